@@ -5,19 +5,22 @@ rag = FurnitureRAG()
 
 while True:
     print("\nOptions:")
-    print("1. Add PDF document")
+    print("1. Add PDF documents")
     print("2. Add text document")  # ✅ NEW: Add text file support!
     print("3. Add website content")
     print("4. Process all documents")
     print("5. Test a query")
-    print("6. Exit")
+    print("6. Remove a document or website")
+    print("7. Exit")
     
-    choice = input("\nEnter your choice (1-6): ")
+    choice = input("\nEnter your choice (1-7): ")
     
     if choice == '1':
-        pdf_path = input("Enter the path to the PDF file: ")
-        rag.add_pdf(pdf_path)
-        print(f"Added PDF: {pdf_path}")
+        pdf_paths = input("Enter the path to the PDF file (several separated by commas): ")
+        # Every file goes into one staged version, published once at the end
+        for pdf_path in [path.strip() for path in pdf_paths.split(",") if path.strip()]:
+            rag.add_pdf(pdf_path, publish=False)
+        rag.publish_changes()
 
     elif choice == '2': 
         text_path = input("Enter the path to the text file: ")
@@ -25,23 +28,28 @@ while True:
         print(f"Added text file: {text_path}")
 
     elif choice == '3':
-        url = input("Enter the website URL: ")
-        rag.add_website(url)
-        print(f"Added website: {url}")
+        url = input("Enter the website or sitemap URL: ")
+        depth = input("Link levels to follow (0 = this page only) [0]: ").strip()
+        rag.add_website(url, max_depth=int(depth) if depth.isdigit() else 0)
 
     elif choice == '4':
         print("Processing documents...")
         rag.process_documents()
-        print("Documents processed and vector store created.")
+        print("Documents processed and vector store updated.")
 
     elif choice == '5':
         query = input("Enter a test query: ")
         print("\nGenerating response...")
-        response = rag.query(query)
         print("\nResponse:")
-        print(response)
+        for token in rag.query_stream(query):
+            print(token, end="", flush=True)
+        print()
 
     elif choice == '6':
+        source = input("Enter the file path or URL to remove: ")
+        rag.remove_source(source)
+
+    elif choice == '7':
         print("Exiting...")
         break
     
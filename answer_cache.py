@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from index_versions import index_version
+
+
+class SemanticAnswerCache:
+    """Cache of past answers looked up by query-embedding similarity.
+
+    A new question hits when its cosine similarity to a stored question in the
+    same language reaches the threshold. Entries expire after a TTL, the least
+    recently used ones are evicted beyond max_entries, and the whole cache is
+    dropped when the vector store on disk is rebuilt.
+    """
+
+    def __init__(self, embed_fn, vector_store_path, threshold=0.92, max_entries=500, ttl=3600):
+        self.embed_fn = embed_fn
+        self.vector_store_path = vector_store_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> entry dict, least recently used first
+        self._matrix = None  # stacked vectors, rebuilt lazily after changes
+        self._keys = []
+        self._next_key = 0
+        self._version = index_version(vector_store_path)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def embed(self, question):
+        """Embed a question and L2-normalise it for cosine similarity"""
+        vector = np.asarray(self.embed_fn(question.strip().lower()), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        """Drop everything if the vector store was rebuilt since the cache was filled"""
+        version = index_version(self.vector_store_path)
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                self._clear()
+                self.invalidations += 1
+                logging.info("Answer cache invalidated: vector store changed")
+
+    def _clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self._keys = []
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, vector, language):
+        """Return the cached entry closest to the vector, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._expire(now)
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries.keys())
+                    self._matrix = np.vstack([self._entries[key]["vector"] for key in self._keys])
+                scores = self._matrix @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    key = self._keys[i]
+                    entry = self._entries[key]
+                    if entry["language"] != language:
+                        continue
+                    self._entries.move_to_end(key)
+                    entry["hits"] += 1
+                    self.hits += 1
+                    return {
+                        "question": entry["question"],
+                        "answer": entry["answer"],
+                        "sources": entry["sources"],
+                        "similarity": float(scores[i])
+                    }
+            self.misses += 1
+            return None
+
+    def store(self, vector, language, question, answer, sources):
+        """Remember an answer for later near-duplicate questions"""
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_key] = {
+                "vector": vector,
+                "language": language,
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "created": time.time(),
+                "hits": 0
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Forget all cached answers"""
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
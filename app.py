@@ -1,16 +1,44 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, g
 from flask_cors import CORS
-from langchain_community.llms import Ollama
-from config import OLLAMA_MODEL, HOST, PORT, DEBUG
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import ConversationalRetrievalChain
-from helpers import detect_language, validate_input, format_response, ensure_directories
-from prompts import handle_user_message  # Use handle_user_message instead of get_system_prompt
+from config import (
+    OLLAMA_MODEL, OLLAMA_BACKENDS, HOST, PORT, DEBUG, WARMUP_ON_STARTUP,
+    OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, OLLAMA_SESSION_CONTEXT, OLLAMA_CONTEXT_MAX,
+    OLLAMA_MAX_QUEUE, OLLAMA_QUEUE_TIMEOUT,
+    SESSION_COOKIE, SESSION_HEADER, SESSION_HISTORY_TURNS, SESSION_HISTORY_TOKENS,
+    SESSION_MAX, SESSION_TTL, SESSION_DB_PATH, VECTOR_STORE_PATH,
+    QUERY_EMBED_CACHE_MAX, QUERY_EMBED_BATCH_MAX, QUERY_EMBED_BATCH_WAIT, RETRIEVAL_SERVER_URL,
+    INDEX_MMAP, INDEX_WATCH_INTERVAL, SEARCH_K, SEARCH_NPROBE, SEARCH_EF, HYBRID_SEARCH, SEARCH_FETCH_K,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD,
+    CONDENSE_MODE, CONDENSE_SKIP_SELF_CONTAINED, CONDENSE_TIMEOUT, CONDENSE_READ_TIMEOUT, CONDENSE_MAX_TOKENS,
+    CONDENSE_MAX_CONCURRENCY,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX, ANSWER_CACHE_TTL,
+    CATALOG_ENABLED, CATALOG_PAGE_SIZE, METRICS_JSON_LOGS, LOG_LEVEL, ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+)
+from embedding_backends import make_embeddings
+from query_embeddings import QueryEmbeddings
+from retrieval_server import RetrievalClient, RemoteRetriever, RemoteEmbeddings
+from index_versions import index_version, IndexWatcher, VersionHandle
+from hybrid_retriever import make_retriever
+from context_budget import pack_context
+from query_rewrite import is_self_contained, expand_query, merge_documents, BackgroundRewrite
+from helpers import SYSTEM_PROMPT, build_rag_prompt, validate_input, format_response, format_sources, ensure_directories
+from ollama_client import (
+    stream_generate, generate, is_available, ServerBusy, GenerationLimiter, AsyncGenerationLimiter,
+    pool as ollama_pool
+)
+from sessions import SessionStore, new_session_id
+from answer_cache import SemanticAnswerCache
+from catalog import CatalogReader
+from metrics import REGISTRY, RequestTrace
+from router import route_message
+import hmac
+import json
+import logging
+import threading
 import time
-from prompts import handle_user_message, get_system_prompt
 
 
+logging.basicConfig(level=LOG_LEVEL)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -32,51 +60,289 @@ step_start = time.time()
 
 # Global variables for lazy loading
 conversation_chain = None
+chain_handle = None  # VersionHandle of conversation_chain, see use_conversation_chain
+embeddings = None
+_load_lock = threading.RLock()  # only one thread builds the components
+
+# Startup/warmup state reported by /readyz
+readiness = {"components_loaded": False, "warmed_up": False, "error": None, "index_version": None}
+
+# Generation options shared by the chain and the streaming path
+LLM_OPTIONS = {
+    "temperature": 0.05,
+    "num_predict": 200,  # Enough for complete door listings
+    "top_k": 3,
+    "top_p": 0.7,
+    "repeat_penalty": 1.2,
+    "num_ctx": OLLAMA_NUM_CTX  # Same window for every call (condense, answer, warmup)
+}
+
+# With a retrieval server the model and index live there and this process is a thin client
+retrieval_client = RetrievalClient(RETRIEVAL_SERVER_URL) if RETRIEVAL_SERVER_URL else None
+
+def get_embeddings():
+    global embeddings
+    if embeddings is None:
+        with _load_lock:
+            if embeddings is None and retrieval_client:
+                embeddings = RemoteEmbeddings(retrieval_client)
+            elif embeddings is None:
+                print("Loading embeddings...")
+                # Cached and micro-batched: concurrent questions share one forward pass
+                embeddings = QueryEmbeddings(
+                    make_embeddings(),
+                    cache_size=QUERY_EMBED_CACHE_MAX,
+                    max_batch=QUERY_EMBED_BATCH_MAX,
+                    max_wait=QUERY_EMBED_BATCH_WAIT
+                )
+    return embeddings
 
 def get_conversation_chain():
-    global conversation_chain
+    if conversation_chain is None:
+        with _load_lock:
+            return _build_conversation_chain()
+    return conversation_chain
+
+def use_conversation_chain():
+    """Handle of the current chain, counted as in use until release() so a reload cannot close its index"""
+    get_conversation_chain()
+    while True:
+        handle = chain_handle
+        if handle.acquire():
+            return handle
+
+def _build_conversation_chain():
+    global conversation_chain, chain_handle
     if conversation_chain is None:
         print("🔄 First request - loading AI components...")
-        
+        chain_handle = _create_conversation_chain()
+        conversation_chain = chain_handle.value
+        print("✅ RAG conversation chain ready!")
+        readiness["components_loaded"] = True
+    
+    return conversation_chain
+
+def _create_conversation_chain():
+    """Open the current index version and build a chain around it; returns its VersionHandle"""
+    # Imported here rather than at the top so the server starts without loading them
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_community.llms import Ollama
+    from vector_index import open_vector_store
+
+    close = None
+    if retrieval_client:
+        print(f"Using retrieval server at {RETRIEVAL_SERVER_URL}")
+        retriever = RemoteRetriever(client=retrieval_client, k=SEARCH_K)
+    else:
         # Load embeddings and vector store
-        print("Loading embeddings...")
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
         print("Loading vector store...")
-        vector_store = FAISS.load_local("data/vector_store", embeddings, allow_dangerous_deserialization=True)
-        print(f"Vector store loaded with documents")
-        
-        # Load language model
-        print("Loading Ollama model...")
-        llm = Ollama(
-            model=OLLAMA_MODEL,
-            temperature=0.05,
-            num_predict=200,  # Enough for complete door listings
-            top_k=3,
-            top_p=0.7,
-            repeat_penalty=1.2
-        )
-        print("Ollama model loaded")
-        
-        # Create conversation chain
-        print("Creating conversation chain with RAG...")
-        conversation_chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=vector_store.as_retriever(search_kwargs={"k": 5}),  # Get more docs for complete listings
-            return_source_documents=True
+        version = index_version(VECTOR_STORE_PATH)
+        vector_store = open_vector_store(
+            VECTOR_STORE_PATH, get_embeddings(),
+            mmap=INDEX_MMAP, nprobe=SEARCH_NPROBE, ef_search=SEARCH_EF
         )
-        print("✅ RAG conversation chain ready!")
-    else:
-        print("Using existing conversation chain")
+        print(f"Vector store loaded with documents (version {version})")
+        readiness["index_version"] = version
+        retriever = make_retriever(vector_store, SEARCH_K, SEARCH_FETCH_K, hybrid=HYBRID_SEARCH)
+        close = vector_store.docstore.close_all
     
-    return conversation_chain
+    # Load language model
+    print("Loading Ollama model...")
+    llm = Ollama(model=OLLAMA_MODEL, base_url=OLLAMA_BACKENDS[0]["url"], keep_alive=OLLAMA_KEEP_ALIVE, **LLM_OPTIONS)
+    print("Ollama model loaded")
+    
+    # Create conversation chain
+    print("Creating conversation chain with RAG...")
+    chain = ConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=retriever,
+        return_source_documents=True
+    )
+    return VersionHandle(chain, close)
+
+def reload_index(version=None):
+    """Load the newest published index in the calling thread and swap it in.
+
+    Chats already running finish on the old index and the next one uses the
+    new index; the old chunk store is closed once the last of them is done.
+    """
+    global conversation_chain, chain_handle
+    with _load_lock:
+        if conversation_chain is None:
+            return None  # nothing loaded yet: the first request opens the current version
+        reload_start = time.time()
+        handle = _create_conversation_chain()
+        previous, chain_handle = chain_handle, handle
+        conversation_chain = handle.value
+        previous.retire()
+    print(f"✅ Index version {readiness['index_version']} swapped in ({time.time() - reload_start:.2f}s)")
+    return readiness["index_version"]
+
+def warmup():
+    """Load all components and run a tiny embed and generation so the first user is fast"""
+    warmup_start = time.time()
+    try:
+        get_conversation_chain()
+        get_embeddings().embed_query("warmup")
+        # Also makes every Ollama backend load the model into memory
+        # Same num_ctx and system prompt as real requests, so the model is not reloaded and the prefix is cached
+        warmed = 0
+        for backend in OLLAMA_BACKENDS:
+            try:
+                generate(OLLAMA_MODEL, "Hi", options=dict(LLM_OPTIONS, num_predict=1), system=SYSTEM_PROMPT,
+                         keep_alive=OLLAMA_KEEP_ALIVE, backend_url=backend["url"])
+                warmed += 1
+            except Exception as e:
+                print(f"Warmup of Ollama backend {backend['url']} failed: {str(e)}")
+        if not warmed:
+            raise RuntimeError("No Ollama backend answered")
+        readiness["warmed_up"] = True
+        readiness["error"] = None
+        print(f"✅ Warmup finished in {time.time() - warmup_start:.2f}s")
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"Warmup failed after {time.time() - warmup_start:.2f}s: {str(e)}")
 
 print(f"✓ Lazy loading ready ({time.time() - step_start:.2f}s)")
 
-# Initialize chat history
-chat_history = []
+def prepare_prompt(question, history, trace, query_type="general", session_id=None):
+    """Retrieval and prompt for a question, holding the current index until it is done"""
+    handle = use_conversation_chain()
+    try:
+        return _prepare_prompt(handle.value, question, history, trace, query_type, session_id)
+    finally:
+        handle.release()
+
+def _prepare_prompt(chain, question, history, trace, query_type, session_id):
+    """Make the retrieval query, retrieve, pack the context and build the final prompt.
+
+    Follow-ups are searched as they are when self-contained, otherwise per
+    CONDENSE_MODE (see query_rewrite.py); only "llm" waits for the chain's
+    condense call before retrieving. A parallel rewrite only starts when
+    rewrite_limiter has a free slot, and runs on the session's backend.
+    The answer prompt comes from build_rag_prompt and is sent with
+    SYSTEM_PROMPT.
+    """
+    search_query = question
+    rewrite = None
+    if history and CONDENSE_SKIP_SELF_CONTAINED and is_self_contained(question):
+        trace.set(condense="skipped")
+    elif history and CONDENSE_MODE == "llm":
+        from langchain.chains.conversational_retrieval.base import _get_chat_history
+        # Same question rewrite the chain does before retrieval, sent through the backend pool
+        with trace.span("condense"):
+            question = search_query = generate(
+                OLLAMA_MODEL,
+                chain.question_generator.prompt.format(question=question, chat_history=_get_chat_history(history)),
+                options=LLM_OPTIONS,
+                keep_alive=OLLAMA_KEEP_ALIVE
+            ).strip()
+        trace.set(condense="llm")
+    elif history:
+        slot = rewrite_limiter.try_acquire() if CONDENSE_MODE == "parallel" else None
+        if slot is not None:
+            from langchain.chains.conversational_retrieval.base import _get_chat_history
+            rewrite = BackgroundRewrite(
+                OLLAMA_MODEL,
+                chain.question_generator.prompt.format(question=question, chat_history=_get_chat_history(history)),
+                options=dict(LLM_OPTIONS, num_predict=CONDENSE_MAX_TOKENS),
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                affinity=session_id,
+                timeout=CONDENSE_READ_TIMEOUT,
+                slot=slot
+            )
+        search_query = expand_query(question, history)
+        if rewrite is None:
+            trace.set(condense="expand")
+    with trace.span("retrieval"):
+        docs = chain.retriever.invoke(search_query)
+    if rewrite is not None:
+        # The expanded query's results stand if the rewrite is not ready in time
+        with trace.span("condense"):
+            rewritten = rewrite.result(CONDENSE_TIMEOUT)
+        if rewritten:
+            with trace.span("retrieval"):
+                docs = merge_documents([chain.retriever.invoke(rewritten), docs], len(docs) or SEARCH_K)
+            question = rewritten
+        trace.set(condense="merged" if rewritten else "timeout")
+    trace.set(docs_retrieved=len(docs))
+    with trace.span("context"):
+        docs, context, stats = pack_context(docs, CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD)
+    trace.set(**stats)
+    logging.debug(f"Context: {stats['context_tokens']} tokens, {stats['context_tokens_saved']} saved, "
+                  f"{stats['chunks_dropped']} chunks dropped")
+    prompt = build_rag_prompt(context, question, query_type)
+    return docs, prompt
+
+# Per-session chat history (replaces the old process-wide list)
+session_store = SessionStore(
+    max_sessions=SESSION_MAX,
+    max_turns=SESSION_HISTORY_TURNS,
+    max_tokens=SESSION_HISTORY_TOKENS,
+    ttl=SESSION_TTL,
+    db_path=SESSION_DB_PATH
+)
+
+# Semantic cache of answers to standalone questions
+answer_cache = SemanticAnswerCache(
+    embed_fn=lambda text: get_embeddings().embed_query(text),
+    vector_store_path=VECTOR_STORE_PATH,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_MAX,
+    ttl=ANSWER_CACHE_TTL
+)
+
+# Product table of the published index version, for listing questions and /api/catalog
+product_catalog = CatalogReader(VECTOR_STORE_PATH, page_size=CATALOG_PAGE_SIZE)
 
-# Skip warmup to reduce startup time (first query will be slightly slower)
-print("Skipping warmup for faster startup...")
+# Caps on concurrent generations: one for the threaded Flask views, one for asgi.py,
+# sized to all backends together (the pool then spreads the slots over them).
+# Parallel follow-up rewrites get their own share of that capacity, so a rewrite
+# never holds a backend slot a queued chat is counting on; they are optional,
+# never wait, and are skipped when their slots are taken.
+backend_capacity = sum(backend["max_concurrency"] for backend in OLLAMA_BACKENDS)
+rewrite_capacity = min(CONDENSE_MAX_CONCURRENCY, backend_capacity - 1) if CONDENSE_MODE == "parallel" else 0
+generation_capacity = backend_capacity - rewrite_capacity
+generation_limiter = GenerationLimiter(generation_capacity, OLLAMA_MAX_QUEUE, OLLAMA_QUEUE_TIMEOUT)
+async_generation_limiter = AsyncGenerationLimiter(generation_capacity, OLLAMA_MAX_QUEUE, OLLAMA_QUEUE_TIMEOUT)
+rewrite_limiter = GenerationLimiter(rewrite_capacity, 0, 0)
+
+REGISTRY.gauge("chat_generations_in_flight", "Generations currently running",
+               lambda: generation_limiter.in_flight + async_generation_limiter.in_flight)
+REGISTRY.gauge("chat_generations_waiting", "Requests waiting for a generation slot",
+               lambda: generation_limiter.waiting + async_generation_limiter.waiting)
+REGISTRY.gauge("chat_sessions_active", "Sessions held in memory", lambda: session_store.stats()["active_sessions"])
+REGISTRY.gauge("answer_cache_hits", "Answer cache hits", lambda: answer_cache.hits)
+REGISTRY.gauge("answer_cache_misses", "Answer cache misses", lambda: answer_cache.misses)
+REGISTRY.gauge("query_embedding_cache_entries", "Query vectors cached",
+               lambda: embeddings.stats()["cached"] if isinstance(embeddings, QueryEmbeddings) else 0)
+
+def ndjson_response(events):
+    """Stream an iterable of event dicts as newline-delimited JSON"""
+    return Response(
+        (json.dumps(event) + "\n" for event in events),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def get_session_id():
+    """Read the session id from the header or cookie, creating one if missing"""
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not session_id or len(session_id) > 64:
+        session_id = new_session_id()
+        g.new_session_id = session_id
+    return session_id
+
+# Warm up in the background so the server can start answering /healthz immediately
+if WARMUP_ON_STARTUP:
+    print("Starting background warmup...")
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+else:
+    print("Skipping warmup (components load on the first request)...")
+
+# Pick up indexes published by admin.py/ingest.py without a restart
+if INDEX_WATCH_INTERVAL and not retrieval_client:
+    IndexWatcher(VECTOR_STORE_PATH, reload_index, interval=INDEX_WATCH_INTERVAL).start()
 
 total_startup = time.time() - startup_start
 print(f"=== APPLICATION READY IN {total_startup:.2f} SECONDS ===")
@@ -86,112 +352,288 @@ print("="*50)
 
 @app.before_request
 def log_request_info():
-    print(f"=== REQUEST: {request.method} {request.path} ===")
-    if request.method == 'POST':
-        print(f"Request data: {request.get_data()}")
-        print(f"Content-Type: {request.content_type}")
+    logging.debug(f"REQUEST: {request.method} {request.path}")
 
 @app.after_request
 def log_response_info(response):
-    print(f"=== RESPONSE: {response.status_code} ===")
+    logging.debug(f"RESPONSE: {response.status_code}")
+    # Hand out the session cookie the first time we see a visitor
+    if getattr(g, 'new_session_id', None):
+        response.set_cookie(SESSION_COOKIE, g.new_session_id, max_age=SESSION_TTL, httponly=True, samesite='Lax')
+        response.headers[SESSION_HEADER] = g.new_session_id
     return response
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/reload-index', methods=['POST'])
+def admin_reload_index():
+    """Load the newest published index now (needs ADMIN_TOKEN in the X-Admin-Token header)"""
+    token = request.headers.get(ADMIN_TOKEN_HEADER, "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        if retrieval_client:
+            return jsonify(retrieval_client.reload())
+        version = reload_index()
+    except Exception as e:
+        logging.error(f"Index reload failed: {str(e)}")
+        return jsonify({"error": f"Index reload failed: {str(e)}"}), 500
+    return jsonify({"status": "reloaded" if version else "not loaded yet", "index_version": version})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: components are loaded and Ollama answers"""
+    ollama_ok = is_available()
+    ready = readiness["components_loaded"] and ollama_ok
+    if WARMUP_ON_STARTUP:
+        ready = ready and readiness["warmed_up"]
+    body = dict(readiness, ollama_reachable=ollama_ok, status="ready" if ready else "not ready")
+    return jsonify(body), 200 if ready else 503
+
+def prepare_chat(session_id, user_message, trace):
+    """Run every step before retrieval: validation, routing, answer cache.
+
+    Returns (result, None) when the message is answered without the LLM, or
+    (None, job) when it still needs retrieval and generation.
+    """
+    with trace.span("validation"):
+        is_valid, error_message = validate_input(user_message)
+    if not is_valid:
+        trace.set(outcome="invalid")
+        return {"response": error_message}, None
+
+    # One pass: normalisation, language detection and intent matching
+    with trace.span("routing"):
+        route = route_message(user_message)
+    detected_language = route.language
+    trace.set(language=detected_language, query_type=route.intent)
+
+    # Greetings, thanks and contact/location/hours questions are answered from templates
+    if route.answer:
+        trace.set(outcome="greeting" if route.intent in ("greeting", "gratitude") else "instant")
+        return {"response": route.answer}, None
+
+    # ALL other queries use RAG system - that's where the knowledge is
+    # The persona lives in the fixed system prompt; only the instruction depends on the query type
+    query_type = "product" if route.intent == "product" else "general"
+
+    # Listing and filtering questions are answered from the product table: complete and without the LLM
+    if CATALOG_ENABLED and route.intent == "product":
+        with trace.span("catalogue"):
+            found = product_catalog.answer(user_message, detected_language)
+        if found:
+            answer, summary, products = found
+            session_store.append(session_id, user_message, summary)
+            trace.set(outcome="catalogue")
+            return {
+                "response": answer,
+                "products": products,
+                "processing_time": f"{trace.elapsed():.2f}s"
+            }, None
+
+    history = session_store.get_history(session_id)
+
+    # Only standalone (first-turn) questions go through the answer cache,
+    # follow-ups depend on the conversation so far
+    cache_vector = None
+    if ANSWER_CACHE_ENABLED and not history:
+        with trace.span("answer_cache"):
+            cache_vector = answer_cache.embed(user_message)
+            cached = answer_cache.lookup(cache_vector, detected_language)
+        if cached:
+            logging.debug(f"Answer cache hit ({cached['similarity']:.3f}): '{cached['question']}'")
+            session_store.append(session_id, user_message, cached["answer"])
+            trace.set(outcome="cache")
+            return {
+                "response": cached["answer"],
+                "sources": cached["sources"],
+                "cached": True,
+                "processing_time": f"{trace.elapsed():.2f}s"
+            }, None
+
+    # Follow-ups continue the session's Ollama context, so its KV cache is reused
+    context = None
+    if OLLAMA_SESSION_CONTEXT and history:
+        context = session_store.get_context(session_id)
+        if context and len(context) > OLLAMA_CONTEXT_MAX:
+            context = None
+
+    trace.set(outcome="rag")
+    return None, {
+        "session_id": session_id,
+        "history": history,
+        "user_message": user_message,
+        "question": user_message,
+        "query_type": query_type,
+        "context": context,
+        "language": detected_language,
+        "cache_vector": cache_vector,
+        "trace": trace
+    }
+
+def generation_kwargs(job):
+    """Ollama request fields shared by the sync and async generation paths"""
+    return {
+        "options": LLM_OPTIONS,
+        "system": SYSTEM_PROMPT,
+        "context": job.get("context"),
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "affinity": job["session_id"]  # follow-ups go back to the backend holding the session's KV cache
+    }
+
+def finish_chat(job, answer, sources, context=None):
+    """Format the answer and record it in the session history and answer cache"""
+    trace = job["trace"]
+    with trace.span("formatting"):
+        formatted_answer = format_response(answer)
+
+        # Update chat history
+        session_store.append(job["session_id"], job["user_message"], formatted_answer)
+        if OLLAMA_SESSION_CONTEXT:
+            session_store.set_context(job["session_id"], context)
+        if job["cache_vector"] is not None:
+            answer_cache.store(job["cache_vector"], job["language"], job["user_message"], formatted_answer, sources)
+
+    trace.finish()
+    return {
+        "response": formatted_answer,
+        "sources": sources,
+        "processing_time": f"{trace.elapsed():.2f}s"
+    }
+
+def immediate_events(result):
+    """Stream events for an answer that needed no generation"""
+    return [
+        {"type": "sources", "sources": result.get("sources", [])},
+        {"type": "token", "token": result["response"]},
+        dict(result, type="done")
+    ]
+
+def answer_events(job, docs, prompt):
+    """Yield chat events: retrieved sources first, then tokens, then the final answer.
+
+    The caller holds the generation slot and releases it when this is done.
+    """
+    trace = job["trace"]
+    sources = format_sources(docs)
+    yield {"type": "sources", "sources": sources}
+
+    tokens = []
+    stats = {}
+    with trace.span("generation"):
+        for token in stream_generate(OLLAMA_MODEL, prompt, stats=stats, **generation_kwargs(job)):
+            if not tokens:
+                trace.set(first_token=trace.elapsed())
+            tokens.append(token)
+            yield {"type": "token", "token": token}
+    trace.set(
+        prompt_tokens=stats.get("prompt_eval_count", 0),
+        completion_tokens=stats.get("eval_count", len(tokens))
+    )
+
+    yield dict(finish_chat(job, "".join(tokens), sources, stats.get("context")), type="done")
+
 # BOTH routes for compatibility
 @app.route('/chat', methods=['POST'])
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    start_time = time.time()
-    print(f" Chat request started at: {time.strftime('%H:%M:%S')}")
-    print("=== CHAT FUNCTION CALLED ===")
+    trace = RequestTrace(json_logs=METRICS_JSON_LOGS)
 
     try:
-        print(f" Step 1 - Getting user message: {time.time() - start_time:.2f}s")
-        global chat_history
+        session_id = get_session_id()
         user_message = request.json.get('message', '')
-        print(f"2. User message received: '{user_message}'")
+        stream = bool(request.json.get('stream', False))
 
-        print(f" Step 2 - Input validation: {time.time() - start_time:.2f}s")
-        # Validate input
-        is_valid, error_message = validate_input(user_message)
-        if not is_valid:
-            return jsonify({"response": error_message})
-
-        print(f" Step 3 - Language detection: {time.time() - start_time:.2f}s")
-        # Detect language
-        detected_language = detect_language(user_message)
-        print(f"3. Detected language: {detected_language} for message: '{user_message}'")
-
-        # Directly handle casual greetings
-        response = handle_user_message(user_message)
-        if response:
-            print(f"Casual greeting or gratitude response: {response}")
-            return jsonify({"response": response})
-
-        print(f" Step 4 - Using RAG for all queries: {time.time() - start_time:.2f}s")
-        
-        # ALL queries use RAG system - that's where the knowledge is
-        print("5. Using RAG system for all queries")
-        
-        # Check if this is specifically about products to customize the prompt
-        product_keywords = ['door', 'doors', 'porte', 'porta', 'catalog', 'catalogo', 'product', 'prodotti', 'products', 'models', 'modelli', 'list', 'lista', 'show', 'mostra', 'hai', 'have', 'available', 'disponibili', 'cosa', 'what', 'quali', 'which', 'mobili', 'furniture', 'arredamenti', 'vendete', 'sell', 'offrite', 'offer']
-        is_product_query = any(keyword in user_message.lower() for keyword in product_keywords)
-        
-        # Create appropriate question based on type - use English for better model understanding
-        if is_product_query:
-            enhanced_question = f"You are Benedetta from Schipani. List all doors from the context. Include names, codes, finishes. User asked: {user_message}"
-        else:
-            enhanced_question = f"You are Benedetta from Schipani company. Answer using the provided context about company info, location, contact details. User asked: {user_message}"
-        
-        print(f"Query type: {'Product' if is_product_query else 'General'}")
-        print(f"Enhanced question: {enhanced_question}")
-        print(f" Step 5 - Starting RAG query...")
-        llm_start = time.time()
-        
-        response = get_conversation_chain()({
-            "question": enhanced_question,
-            "chat_history": chat_history
-        })
-
-        llm_end = time.time()
-        print(f" Step 6 - LLM response received: {llm_end - llm_start:.2f}s (LLM only)")
-
-        # DEBUG: Check retrieved documents
-        if "source_documents" in response:
-            print(f"7. Retrieved {len(response['source_documents'])} documents:")
-            for i, doc in enumerate(response['source_documents']):
-                print(f"   Doc {i+1}: {doc.page_content[:200]}...")
-        else:
-            print("7. WARNING: No source documents found in response!")
-            print(f"   Response keys: {response.keys()}")
-
-        answer = response["answer"]
-        print(f"8. Raw answer: {answer}")
-
-        print(f" Step 7 - Response formatting: {time.time() - start_time:.2f}s")
-        # Format response
-        formatted_answer = format_response(answer)
-        print(f"9. Final response: {formatted_answer}")
+        result, job = prepare_chat(session_id, user_message, trace)
+        if result is not None:
+            trace.finish()
+            return ndjson_response(immediate_events(result)) if stream else jsonify(result)
 
-        # Update chat history
-        chat_history.append((user_message, formatted_answer))
+        # Wait for a free generation slot (503 if the backend is saturated)
+        slot = generation_limiter.acquire()
+
+        if stream:
+            # The stream's generator owns the slot from here on
+            return ndjson_response(stream_chat_events(job, slot))
+
+        try:
+            docs, prompt = prepare_prompt(
+                job["question"], job["history"], trace, job["query_type"], job["session_id"]
+            )
+            for event in answer_events(job, docs, prompt):
+                result = event
+        finally:
+            slot.release()
 
-        total_time = time.time() - start_time
-        print(f" TOTAL TIME: {total_time:.2f}s")
-        print(f" LLM took: {(llm_end - llm_start)/total_time*100:.1f}% of total time")
+        result.pop("type")
+        return jsonify(result)
 
-        return jsonify({
-            "response": formatted_answer,
-            "processing_time": f"{total_time:.2f}s"
-        })
+    except ServerBusy as e:
+        trace.finish("busy")
+        logging.warning(f"Rejected after {trace.elapsed():.2f}s: {str(e)}")
+        return jsonify({"error": str(e)}), 503
 
     except Exception as e:
-        error_time = time.time() - start_time
-        print(f" Error after {error_time:.2f}s: {str(e)}")
+        trace.finish("error")
+        logging.error(f"Error after {trace.elapsed():.2f}s: {str(e)}")
         return jsonify({"error": f"Error: {str(e)}"})
 
+@app.route('/api/catalog', methods=['GET'])
+def catalog():
+    """Products matching a question or filter words, one page at a time"""
+    query = request.args.get('q', '')
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        return jsonify({"error": "page must be a number"}), 400
+    found = product_catalog.search(query, page, strict=False)
+    if found is None:
+        return jsonify({"error": "No product catalogue in the published index"}), 404
+    products, total = found
+    return jsonify({"total": total, "page": page, "page_size": CATALOG_PAGE_SIZE, "products": products})
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "answer_cache": answer_cache.stats(),
+        "sessions": session_store.stats(),
+        "generation": generation_limiter.stats(),
+        "async_generation": async_generation_limiter.stats(),
+        "condense": rewrite_limiter.stats(),
+        "ollama_backends": ollama_pool.stats()
+    })
+
+def stream_chat_events(job, slot):
+    """Retrieve and stream the answer for a prepared job, releasing its generation slot at the end.
+
+    The WSGI server always starts the iteration and closes it when the client
+    goes away, so the finally below runs in every case.
+    """
+    trace = job["trace"]
+    try:
+        docs, prompt = prepare_prompt(job["question"], job["history"], trace, job["query_type"],
+                                      job["session_id"])
+        yield from answer_events(job, docs, prompt)
+
+    except Exception as e:
+        trace.finish("error")
+        logging.error(f"Streaming error after {trace.elapsed():.2f}s: {str(e)}")
+        yield {"type": "error", "error": f"Error: {str(e)}"}
+
+    finally:
+        slot.release()
+
 if __name__ == '__main__':
     app.run(host=HOST, port=PORT, debug=DEBUG)
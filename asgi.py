@@ -0,0 +1,183 @@
+"""Async serving mode.
+
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+
+/api/chat runs as a coroutine: the blocking steps (validation, cache,
+retrieval) go to worker threads while generation streams from Ollama over a
+pooled keep-alive async client, so one event loop serves many concurrent
+chats. Every other route is the regular Flask app.
+"""
+import asyncio
+import json
+import logging
+from http.cookies import SimpleCookie
+from asgiref.wsgi import WsgiToAsgi
+import app as flask_app
+from config import OLLAMA_MODEL, SESSION_COOKIE, SESSION_HEADER, SESSION_TTL, METRICS_JSON_LOGS, LOG_LEVEL
+from helpers import format_sources
+from metrics import RequestTrace
+from ollama_client import async_stream_generate, close_async_client, ServerBusy
+from sessions import new_session_id
+
+logging.basicConfig(level=LOG_LEVEL)
+wsgi_application = WsgiToAsgi(flask_app.app)
+
+
+def _session_from_scope(scope):
+    """Session id from the header or cookie; returns (session_id, is_new)"""
+    headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+    session_id = headers.get(SESSION_HEADER.lower())
+    if not session_id and "cookie" in headers:
+        cookie = SimpleCookie()
+        cookie.load(headers["cookie"])
+        if SESSION_COOKIE in cookie:
+            session_id = cookie[SESSION_COOKIE].value
+    if not session_id or len(session_id) > 64:
+        return new_session_id(), True
+    return session_id, False
+
+
+def _response_headers(content_type, session_id, new_session):
+    headers = [
+        (b"content-type", content_type.encode()),
+        (b"cache-control", b"no-cache"),
+        (b"access-control-allow-origin", b"*")
+    ]
+    if new_session:
+        cookie = f"{SESSION_COOKIE}={session_id}; Max-Age={SESSION_TTL}; Path=/; HttpOnly; SameSite=Lax"
+        headers.append((b"set-cookie", cookie.encode()))
+        headers.append((SESSION_HEADER.lower().encode(), session_id.encode()))
+    return headers
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload, headers):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+
+async def _answer_events(job, docs, prompt):
+    """Yield chat events while generating asynchronously (see app.answer_events)"""
+    trace = job["trace"]
+    sources = format_sources(docs)
+    yield {"type": "sources", "sources": sources}
+    tokens = []
+    stats = {}
+    with trace.span("generation"):
+        async for token in async_stream_generate(OLLAMA_MODEL, prompt, stats=stats, **flask_app.generation_kwargs(job)):
+            if not tokens:
+                trace.set(first_token=trace.elapsed())
+            tokens.append(token)
+            yield {"type": "token", "token": token}
+    trace.set(
+        prompt_tokens=stats.get("prompt_eval_count", 0),
+        completion_tokens=stats.get("eval_count", len(tokens))
+    )
+    result = await asyncio.to_thread(flask_app.finish_chat, job, "".join(tokens), sources, stats.get("context"))
+    yield dict(result, type="done")
+
+
+async def chat(scope, receive, send):
+    """Async /api/chat with the same request and response format as the Flask view"""
+    trace = RequestTrace(json_logs=METRICS_JSON_LOGS)
+    session_id, new_session = _session_from_scope(scope)
+    json_headers = _response_headers("application/json", session_id, new_session)
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+        user_message = data.get("message", "")
+        stream = bool(data.get("stream", False))
+
+        result, job = await asyncio.to_thread(flask_app.prepare_chat, session_id, user_message, trace)
+        if result is not None:
+            trace.finish()
+        if result is not None and not stream:
+            await _send_json(send, 200, result, json_headers)
+            return
+
+        slot = None
+        if result is None:
+            # Wait for a generation slot before any bytes are sent, so overload is a clean 503
+            slot = await flask_app.async_generation_limiter.acquire()
+    except ServerBusy as e:
+        trace.finish("busy")
+        logging.warning(f"Rejected after {trace.elapsed():.2f}s: {str(e)}")
+        await _send_json(send, 503, {"error": str(e)}, json_headers)
+        return
+    except Exception as e:
+        trace.finish("error")
+        logging.error(f"Error after {trace.elapsed():.2f}s: {str(e)}")
+        await _send_json(send, 200, {"error": f"Error: {str(e)}"}, json_headers)
+        return
+
+    try:
+        if result is not None:
+            events = _iterate(flask_app.immediate_events(result))
+        else:
+            docs, prompt = await asyncio.to_thread(
+                flask_app.prepare_prompt, job["question"], job["history"], trace, job["query_type"], job["session_id"]
+            )
+            events = _answer_events(job, docs, prompt)
+
+        if not stream:
+            done = {}
+            async for event in events:
+                done = event
+            done.pop("type", None)
+            await _send_json(send, 200, done, json_headers)
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": _response_headers("application/x-ndjson", session_id, new_session)
+        })
+        try:
+            async for event in events:
+                await send({"type": "http.response.body", "body": (json.dumps(event) + "\n").encode(), "more_body": True})
+        except Exception as e:
+            trace.finish("error")
+            logging.error(f"Streaming error after {trace.elapsed():.2f}s: {str(e)}")
+            error = {"type": "error", "error": f"Error: {str(e)}"}
+            await send({"type": "http.response.body", "body": (json.dumps(error) + "\n").encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except Exception as e:
+        trace.finish("error")
+        logging.error(f"Error after {trace.elapsed():.2f}s: {str(e)}")
+        await _send_json(send, 200, {"error": f"Error: {str(e)}"}, json_headers)
+    finally:
+        # The only release: the slot is held from acquire until the response is complete
+        if slot is not None:
+            slot.release()
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    elif scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ("/chat", "/api/chat"):
+        await chat(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,345 @@
+"""Benchmarks for the chat pipeline.
+
+    python benchmarks/stub_ollama.py --port 11435 &          # optional stand-in for Ollama
+    export OLLAMA_URL=http://localhost:11435
+    python benchmarks/run.py index                           # embed the fixed corpus
+    python benchmarks/run.py retrieval --requests 200
+    python benchmarks/run.py rag --concurrency 4 --requests 32
+    python benchmarks/run.py http --url http://localhost:5000 --concurrency 8 --requests 64 --turns 2
+    python benchmarks/run.py http --turns 2 --follow-ups          # later turns refer back ("and in walnut?")
+    python benchmarks/run.py startup --backends torch onnx   # import time, embed latency, RSS
+
+Each run prints a summary and writes it as JSON to benchmarks/results/ (or
+--output), tagged with the git commit, so runs can be compared over time.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+QUERIES_FILE = os.path.join(BENCH_DIR, "queries.json")
+FOLLOW_UPS_FILE = os.path.join(BENCH_DIR, "follow_ups.json")
+BENCH_STORE = os.path.join(BENCH_DIR, "data", "vector_store")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def load_queries(lang=None, path=QUERIES_FILE):
+    with open(path, encoding="utf-8") as f:
+        queries = json.load(f)
+    return [q for q in queries if not lang or q["lang"] == lang]
+
+
+def percentiles(values):
+    """p50/p95/p99 (nearest rank), mean and max in seconds"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "p50": round(rank(50), 4),
+        "p95": round(rank(95), 4),
+        "p99": round(rank(99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "max": round(ordered[-1], 4)
+    }
+
+
+def summarize(samples, wall_time):
+    ok = [s for s in samples if s.get("ok")]
+    return {
+        "count": len(samples),
+        "errors": len(samples) - len(ok),
+        "latency": percentiles([s["latency"] for s in ok]),
+        "ttft": percentiles([s["ttft"] for s in ok if s.get("ttft") is not None]),
+        "throughput_per_sec": round(len(ok) / wall_time, 3) if wall_time else 0.0
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(mode, params, results, output=None):
+    report = {
+        "mode": mode,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "results": results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{mode}-{report['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+
+def run_concurrently(task, jobs, concurrency):
+    """Run task(job) for every job with a thread pool; returns (samples, wall seconds)"""
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(task, jobs))
+    samples = [sample for result in results for sample in (result if isinstance(result, list) else [result])]
+    return samples, time.time() - start
+
+
+def make_rag():
+    from config import OLLAMA_MODEL
+    from rag import FurnitureRAG
+    return FurnitureRAG(model_name=OLLAMA_MODEL, vector_store_path=BENCH_STORE)
+
+
+def cmd_index(args):
+    """Embed the benchmark corpus into benchmarks/data/vector_store"""
+    rag = make_rag()
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        rag.add_text(os.path.join(CORPUS_DIR, name))
+    start = time.time()
+    rag.process_documents()
+    print(f"Indexed corpus in {time.time() - start:.2f}s")
+
+
+def cmd_retrieval(args):
+    """Retrieval only: query embedding and vector search, no generation"""
+    from config import SEARCH_K
+    rag = make_rag()
+    rag.load_vector_store()
+    store = rag.vector_store
+    queries = load_queries(args.lang)
+    store.similarity_search(queries[0]["text"], k=SEARCH_K)  # warm up
+
+    def task(i):
+        query = queries[i % len(queries)]["text"]
+        start = time.time()
+        vector = store.embeddings.embed_query(query)
+        embedded = time.time()
+        store.similarity_search_by_vector(vector, k=SEARCH_K)
+        done = time.time()
+        return {"ok": True, "latency": done - start, "embed": embedded - start, "search": done - embedded}
+
+    samples, wall = run_concurrently(task, range(args.requests), args.concurrency)
+    results = summarize(samples, wall)
+    results["embed"] = percentiles([s["embed"] for s in samples])
+    results["search"] = percentiles([s["search"] for s in samples])
+    results["index_size"] = store.index.ntotal
+    write_results("retrieval", vars_of(args), results, args.output)
+
+
+def cmd_rag(args):
+    """FurnitureRAG.query_stream end to end (retrieval plus Ollama generation)"""
+    rag = make_rag()
+    rag.load_vector_store()
+    queries = load_queries(args.lang)
+
+    def task(i):
+        query = queries[i % len(queries)]["text"]
+        start = time.time()
+        ttft = None
+        try:
+            for _ in rag.query_stream(query):
+                if ttft is None:
+                    ttft = time.time() - start
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "latency": time.time() - start, "ttft": ttft}
+
+    samples, wall = run_concurrently(task, range(args.requests), args.concurrency)
+    write_results("rag", vars_of(args), summarize(samples, wall), args.output)
+
+
+def cmd_http(args):
+    """Drive /api/chat over HTTP with streaming; each job is one conversation of --turns messages"""
+    import requests
+
+    queries = load_queries(args.lang)
+    # Elliptical follow-ups exercise the condense step; otherwise every turn is a standalone question
+    follow_ups = load_queries(args.lang, FOLLOW_UPS_FILE) if args.follow_ups else queries
+    conversations = max(1, args.requests // args.turns)
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def ask(session_id, message):
+        start = time.time()
+        ttft = None
+        done = {}
+        try:
+            response = session().post(
+                f"{args.url}/api/chat",
+                json={"message": message, "stream": True},
+                headers={"X-Session-ID": session_id},
+                stream=True,
+                timeout=args.timeout
+            )
+            if response.status_code != 200:
+                return {"ok": False, "status": response.status_code}
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "token" and ttft is None:
+                    ttft = time.time() - start
+                elif event.get("type") in ("done", "error"):
+                    done = event
+        except requests.RequestException as e:
+            return {"ok": False, "error": str(e)}
+        if done.get("type") != "done":
+            return {"ok": False, "error": done.get("error", "no done event")}
+        # Template and catalogue answers carry no sources: nothing was retrieved or generated
+        return {"ok": True, "latency": time.time() - start, "ttft": ttft, "cached": bool(done.get("cached")),
+                "instant": "sources" not in done}
+
+    def conversation(i):
+        session_id = uuid.uuid4().hex
+        rng = random.Random(i)
+        samples = []
+        for turn in range(args.turns):
+            sample = ask(session_id, rng.choice(follow_ups if turn else queries)["text"])
+            sample["turn"] = turn
+            samples.append(sample)
+        return samples
+
+    samples, wall = run_concurrently(conversation, range(conversations), args.concurrency)
+    generated = [s for s in samples if not s.get("cached") and not s.get("instant")]
+    results = summarize(generated, wall)
+    results["cache_hits"] = sum(1 for s in samples if s.get("cached"))
+    results["instant_answers"] = sum(1 for s in samples if s.get("instant"))
+    results["first_turn"] = summarize([s for s in generated if s["turn"] == 0], wall)
+    if args.turns > 1:
+        results["follow_up"] = summarize([s for s in generated if s["turn"] > 0], wall)
+    write_results("http", vars_of(args), results, args.output)
+
+
+# Runs in a fresh interpreter so import time and memory are not shared with this process
+IMPORT_PROBE = """
+import json, sys, time
+import config
+config.WARMUP_ON_STARTUP = False  # measure the import alone, not the background model loading
+start = time.time()
+import app
+heavy = ["torch", "transformers", "sentence_transformers", "onnxruntime", "faiss", "langchain.chains"]
+print(json.dumps({"seconds": time.time() - start, "loaded": [name for name in heavy if name in sys.modules]}))
+"""
+
+EMBED_PROBE = """
+import json, resource, sys, time
+queries = json.loads(sys.argv[2])
+start = time.time()
+from embedding_backends import make_embeddings
+model = make_embeddings(sys.argv[1])
+loaded = time.time() - start
+model.embed_query("warmup")
+latencies = []
+for _ in range(int(sys.argv[3])):
+    for query in queries:
+        query_start = time.time()
+        model.embed_query(query)
+        latencies.append(time.time() - query_start)
+print(json.dumps({
+    "load_seconds": loaded,
+    "latencies": latencies,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "vectors": [model.embed_query(query) for query in queries]
+}))
+"""
+
+
+def run_probe(code, *argv, env=None):
+    result = subprocess.run([sys.executable, "-c", code, *argv], cwd=REPO_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, **(env or {})))
+    if result.returncode != 0:
+        return {"error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def cmd_startup(args):
+    """Cold start: time to import app.py, then embedding model load time, query latency and RSS per backend"""
+    import numpy as np
+
+    imports = [run_probe(IMPORT_PROBE) for _ in range(args.repeat)]
+    results = {
+        "import_app": percentiles([r["seconds"] for r in imports if "seconds" in r]),
+        "heavy_modules_at_import": imports[-1].get("loaded", imports[-1].get("error"))
+    }
+    queries = [q["text"] for q in load_queries(args.lang)]
+    vectors = {}
+    for backend in args.backends:
+        probe = run_probe(EMBED_PROBE, backend, json.dumps(queries), str(args.repeat))
+        if "error" in probe:
+            results[backend] = probe
+            continue
+        vectors[backend] = np.array(probe["vectors"], dtype=np.float32)
+        results[backend] = {
+            "load_seconds": round(probe["load_seconds"], 3),
+            "embed_query": percentiles(probe["latencies"]),
+            "rss_mb": round(probe["rss_mb"], 1)
+        }
+    if "torch" in vectors and "onnx" in vectors:
+        # Both backends normalise, so the row-wise dot product is the cosine similarity
+        cosine = (vectors["torch"] * vectors["onnx"]).sum(axis=1)
+        results["onnx_vs_torch_cosine"] = {"min": round(float(cosine.min()), 4), "mean": round(float(cosine.mean()), 4)}
+    write_results("startup", vars_of(args), results, args.output)
+
+
+def vars_of(args):
+    params = {key: value for key, value in vars(args).items() if key not in ("func", "output")}
+    params["ollama_url"] = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat pipeline benchmarks")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    index = sub.add_parser("index", help="embed the benchmark corpus")
+    index.set_defaults(func=cmd_index)
+
+    for name, func in (("retrieval", cmd_retrieval), ("rag", cmd_rag), ("http", cmd_http)):
+        mode = sub.add_parser(name, help=func.__doc__.split("\n")[0])
+        mode.add_argument("--concurrency", type=int, default=1)
+        mode.add_argument("--requests", type=int, default=32)
+        mode.add_argument("--lang", choices=["it", "en"], help="only use queries in this language")
+        mode.add_argument("--output", help="JSON file for the results")
+        mode.set_defaults(func=func)
+        if name == "http":
+            mode.add_argument("--url", default="http://localhost:5000")
+            mode.add_argument("--turns", type=int, default=1, help="messages per conversation")
+            mode.add_argument("--follow-ups", action="store_true",
+                              help="ask later turns from follow_ups.json (questions that refer back)")
+            mode.add_argument("--timeout", type=float, default=120)
+
+    startup = sub.add_parser("startup", help=cmd_startup.__doc__.split("\n")[0])
+    startup.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    startup.add_argument("--repeat", type=int, default=3, help="import runs, and passes over the queries")
+    startup.add_argument("--lang", choices=["it", "en"], help="only use queries in this language")
+    startup.add_argument("--output", help="JSON file for the results")
+    startup.set_defaults(func=cmd_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Local stand-in for Ollama's /api/generate used by the benchmarks.
+
+    python benchmarks/stub_ollama.py --port 11435 --tokens-per-sec 25 --latency 0.3
+    OLLAMA_URL=http://localhost:11435 python app.py
+
+Several stubs make a backend pool, and --error-rate lets one of them fail:
+
+    python benchmarks/stub_ollama.py --port 11436 --error-rate 0.5 &
+    OLLAMA_BACKENDS=http://localhost:11435,http://localhost:11436 python app.py
+
+Answers every prompt by streaming a fixed number of tokens at a steady rate
+after a configurable prompt-evaluation delay, with the same NDJSON framing
+and final counters as Ollama. With --prompt-tokens-per-sec the delay also
+grows with the prompt tokens that are not a prefix of the previous request
+(a single-slot KV cache), and "system"/"context" are honoured like Ollama.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("Le", " nostre", " porte", " SARA", " e", " VALENTINA", " sono", " disponibili",
+         " in", " noce", " e", " bianco", " laccato", ".")
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = {"latency": 0.3, "tokens_per_sec": 25.0, "tokens": 60, "prompt_tokens_per_sec": 0, "error_rate": 0}
+    cache = {"text": ""}  # what the simulated KV cache currently holds
+    contexts = {}  # fake context id -> the conversation text it stands for
+    ids = itertools.count(1)
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        settings = self.settings
+        if random.random() < settings["error_rate"]:
+            self.send_error(500, "stub failure")
+            return
+        options = request.get("options") or {}
+        tokens = min(settings["tokens"], options.get("num_predict") or settings["tokens"])
+
+        # Prompt evaluation before the first token; only the part not already cached costs time
+        context = request.get("context") or [0]
+        text = self.contexts.get(context[0], "") + (request.get("system") or "") + "\n" + request.get("prompt", "")
+        with self.lock:
+            cached = len(os.path.commonprefix([self.cache["text"], text]))
+            self.cache["text"] = text
+        prompt_tokens = (len(text) - cached) // 4
+        delay = settings["latency"]
+        if settings["prompt_tokens_per_sec"]:
+            delay += prompt_tokens / settings["prompt_tokens_per_sec"]
+        time.sleep(delay)
+        answer = "".join(WORDS[i % len(WORDS)] for i in range(tokens))
+        done = {"response": "", "done": True, "prompt_eval_count": prompt_tokens, "eval_count": tokens,
+                "context": self._remember(text + answer)}
+
+        if request.get("stream") is False:
+            time.sleep(tokens / settings["tokens_per_sec"])
+            self._send_json(dict(done, response=answer))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1.0 / settings["tokens_per_sec"]
+        for i in range(tokens):
+            self._write_chunk({"response": WORDS[i % len(WORDS)], "done": False})
+            time.sleep(interval)
+        self._write_chunk(done)
+        self.wfile.write(b"0\r\n\r\n")
+        with self.lock:
+            self.cache["text"] = text + answer
+
+    def _remember(self, text):
+        """Fake context tokens: one id that maps back to the text, padded to its token length"""
+        with self.lock:
+            context_id = next(self.ids)
+            self.contexts[context_id] = text
+        return [context_id] + [0] * max(0, len(text) // 4 - 1)
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(port=11435, latency=0.3, tokens_per_sec=25.0, tokens=60, prompt_tokens_per_sec=0, error_rate=0):
+    """Run the stub until interrupted"""
+    StubOllamaHandler.settings = {
+        "latency": latency, "tokens_per_sec": tokens_per_sec, "tokens": tokens,
+        "prompt_tokens_per_sec": prompt_tokens_per_sec, "error_rate": error_rate
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubOllamaHandler)
+    print(f"Stub Ollama on http://127.0.0.1:{port} ({tokens} tokens at {tokens_per_sec}/s after {latency}s)")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server for benchmarks")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=25.0)
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer (capped by num_predict)")
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=0,
+                        help="prompt evaluation speed for uncached tokens (0 = only --latency)")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of generations answered with HTTP 500")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.tokens_per_sec, args.tokens, args.prompt_tokens_per_sec, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
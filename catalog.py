@@ -0,0 +1,363 @@
+"""Structured product catalogue extracted from the knowledge base.
+
+Catalogue lines such as
+
+    SARA SR-101 - Porta a battente liscia. Finiture: noce nazionale, bianco laccato. Categoria: porte interne.
+
+are parsed into product records when an index version is saved and stored in
+its docstore.sqlite, indexed by category, finish and product line. Listing and
+filtering questions ("which doors come in walnut?", "quali porte scorrevoli
+avete?") are then answered straight from the table: complete, in
+milliseconds and without the LLM.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from chunk_store import extract_codes
+from index_versions import current_version_path, index_version, DOCSTORE_FILE
+from router import normalize, CATALOGUE_KEYWORDS, PRODUCT_KEYWORDS
+
+PRODUCT_LINE = re.compile(
+    r"^\s*(?P<name>[A-Z][\w'’-]*(?:\s+[A-Z][\w'’-]*){0,3}?)\s+(?P<code>[A-Z]{1,4}-?\d{2,6}[A-Z]?)\s*[-–—:]\s*(?P<rest>.+)$"
+)
+FIELD_PATTERN = re.compile(
+    r"\b(?P<field>finiture|finitura|finishes|finish|finitions|acabados|categoria|category|catégorie|categorie|categoría)"
+    r"\s*:\s*(?P<value>[^.;\n]+)",
+    re.IGNORECASE
+)
+FINISH_FIELDS = {"finiture", "finitura", "finishes", "finish", "finitions", "acabados"}
+LIST_SEPARATOR = re.compile(r"\s*(?:,|/|\be\b|\band\b|\bet\b|\by\b)\s*")
+
+# Question words in other languages mapped to the (Italian) catalogue terms
+TERM_SYNONYMS = {
+    'walnut': 'noce', 'noyer': 'noce', 'nogal': 'noce',
+    'oak': 'rovere', 'chene': 'rovere', 'roble': 'rovere',
+    'white': 'bianco', 'blanc': 'bianco', 'blanco': 'bianco', 'bianca': 'bianco', 'bianche': 'bianco', 'bianchi': 'bianco',
+    'cherry': 'ciliegio', 'cerisier': 'ciliegio', 'cerezo': 'ciliegio',
+    'grey': 'grigio', 'gray': 'grigio', 'gris': 'grigio', 'grigia': 'grigio', 'grigie': 'grigio',
+    'ivory': 'avorio', 'ivoire': 'avorio', 'marfil': 'avorio',
+    'elm': 'olmo', 'orme': 'olmo',
+    'lacquer': 'laccato', 'lacquered': 'laccato', 'laque': 'laccato', 'laquee': 'laccato', 'lacado': 'laccato',
+    'laccata': 'laccato', 'laccate': 'laccato',
+    'anthracite': 'antracite', 'antracita': 'antracite',
+    'sliding': 'scorrevoli', 'pocket': 'scorrevoli', 'coulissante': 'scorrevoli', 'coulissantes': 'scorrevoli',
+    'corredera': 'scorrevoli', 'correderas': 'scorrevoli', 'scorrevole': 'scorrevoli',
+    'security': 'blindate', 'armoured': 'blindate', 'armored': 'blindate', 'blindata': 'blindate',
+    'blinde': 'blindate', 'blindes': 'blindate', 'blindee': 'blindate', 'blindees': 'blindate',
+    'blindada': 'blindate', 'blindadas': 'blindate',
+    'interior': 'interne', 'interiors': 'interne', 'interieures': 'interne', 'interiores': 'interne', 'interna': 'interne',
+    'folding': 'libro', 'bifold': 'libro',
+    'flush': 'filo'
+}
+# Questions about things the table does not hold go to RAG even when they name products
+FREE_FORM_KEYWORDS = {
+    'price', 'prices', 'cost', 'costs', 'prezzo', 'prezzi', 'costa', 'costo', 'prix', 'precio', 'precios',
+    'size', 'sizes', 'misure', 'misura', 'dimensioni', 'taille', 'tailles', 'medidas',
+    'how', 'comment', 'why', 'perche', 'pourquoi', 'porque',
+    'delivery', 'consegna', 'livraison', 'entrega', 'warranty', 'garanzia', 'garantie', 'garantia',
+    'install', 'installation', 'montaggio', 'montare', 'installazione', 'installare', 'instalacion', 'instalar'
+}
+LISTING_WORDS = set(PRODUCT_KEYWORDS) | {
+    'avete', 'elenco', 'elenca', 'tutte', 'tutti', 'all', 'avez', 'quels', 'quelles', 'tienen', 'cuales'
+}
+CATALOGUE_WORDS = set(CATALOGUE_KEYWORDS)
+STOPWORDS = {'a', 'da', 'di', 'con', 'in', 'e', 'the', 'de', 'la', 'le', 'y'}
+
+ANSWER_HEADERS = {
+    'it': "Ecco i prodotti che corrispondono ({total}):",
+    'en': "Here are the matching products ({total}):",
+    'fr': "Voici les produits correspondants ({total}) :",
+    'es': "Estos son los productos que coinciden ({total}):"
+}
+MORE_RESULTS = {
+    'it': "...e altri {more}. Indica linea, finitura o tipo di porta per restringere la ricerca.",
+    'en': "...and {more} more. Mention a line, finish or door type to narrow the search.",
+    'fr': "...et {more} autres. Précisez la ligne, la finition ou le type de porte pour affiner la recherche.",
+    'es': "...y {more} más. Indique línea, acabado o tipo de puerta para acotar la búsqueda."
+}
+FINISHES_LABEL = {'it': "finiture", 'en': "finishes", 'fr': "finitions", 'es': "acabados"}
+# What the session history keeps of a listing: the full list would crowd out the conversation
+SUMMARY_HEADERS = {
+    'it': "Ho elencato {total} prodotti del catalogo: {codes}",
+    'en': "I listed {total} catalogue products: {codes}",
+    'fr': "J'ai listé {total} produits du catalogue : {codes}",
+    'es': "He listado {total} productos del catálogo: {codes}"
+}
+SUMMARY_MAX_PRODUCTS = 5
+
+
+def _terms(text):
+    return [word for word in normalize(text).split() if word not in STOPWORDS and len(word) > 1]
+
+
+def extract_products(text, source):
+    """Product records from the catalogue lines of a text"""
+    products = {}
+    for line in text.splitlines():
+        match = PRODUCT_LINE.match(line)
+        if not match:
+            continue
+        rest = match.group("rest")
+        fields = {m.group("field").lower(): m.group("value").strip() for m in FIELD_PATTERN.finditer(rest)}
+        if not fields:
+            continue  # a code mentioned in prose, not a catalogue entry
+        first_field = FIELD_PATTERN.search(rest)
+        description = rest[:first_field.start()].strip().rstrip(".").strip()
+        finishes = next((value for field, value in fields.items() if field in FINISH_FIELDS), "")
+        category = next((value for field, value in fields.items() if field not in FINISH_FIELDS), "")
+        record = {
+            "code": extract_codes(match.group("code"))[0],
+            "display_code": match.group("code"),
+            "name": match.group("name").strip(),
+            "description": description,
+            "category": category.strip().lower(),
+            "finishes": [f.strip().lower() for f in LIST_SEPARATOR.split(finishes) if f.strip()],
+            "source": source
+        }
+        # Chunks overlap, so a line can appear twice; keep the most complete copy
+        previous = products.get(record["code"])
+        if previous is None or len(record["finishes"]) + len(record["description"]) > \
+                len(previous["finishes"]) + len(previous["description"]):
+            products[record["code"]] = record
+    return list(products.values())
+
+
+class ProductCatalog:
+    """Product tables inside an index version's docstore.sqlite"""
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path)
+            with self.conn:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS products ("
+                    "code TEXT NOT NULL, source TEXT NOT NULL, name TEXT NOT NULL, display_code TEXT NOT NULL, "
+                    "description TEXT NOT NULL, category TEXT NOT NULL, finishes TEXT NOT NULL, "
+                    "PRIMARY KEY (code, source))"
+                )
+                # One row per searchable word: attribute is 'category', 'finish' or 'name'
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS product_terms ("
+                    "code TEXT NOT NULL, source TEXT NOT NULL, attribute TEXT NOT NULL, term TEXT NOT NULL)"
+                )
+                self.conn.execute("CREATE INDEX IF NOT EXISTS product_terms_term ON product_terms (attribute, term)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS products_category ON products (category)")
+                self.conn.execute("CREATE TABLE IF NOT EXISTS product_sources (source TEXT PRIMARY KEY, hash TEXT)")
+        self.available = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'products'"
+        ).fetchone() is not None
+
+    def close(self):
+        self.conn.close()
+
+    def sources(self):
+        """Source -> content hash the source's products were extracted from"""
+        return dict(self.conn.execute("SELECT source, hash FROM product_sources"))
+
+    def remove_source(self, source):
+        with self.conn:
+            for table in ("products", "product_terms", "product_sources"):
+                self.conn.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+
+    def rebuild_source(self, source, chunk_ids, digest):
+        """Re-extract a source's products from its chunks in the docstore; returns how many were found"""
+        texts = []
+        chunk_ids = list(chunk_ids)
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            texts.extend(row[0] for row in self.conn.execute(
+                f"SELECT text FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ))
+        products = extract_products("\n".join(texts), source)
+        self.remove_source(source)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO products (code, source, name, display_code, description, category, finishes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(p["code"], source, p["name"], p["display_code"], p["description"], p["category"],
+                  json.dumps(p["finishes"])) for p in products]
+            )
+            self.conn.executemany(
+                "INSERT INTO product_terms (code, source, attribute, term) VALUES (?, ?, ?, ?)",
+                {(p["code"], source, attribute, term)
+                 for p in products
+                 for attribute, text in [("category", p["category"]), ("name", p["name"])] +
+                 [("finish", finish) for finish in p["finishes"]]
+                 for term in _terms(text)}
+            )
+            self.conn.execute("INSERT INTO product_sources (source, hash) VALUES (?, ?)", (source, digest))
+        return len(products)
+
+    def sync(self, manifest):
+        """Bring the tables in line with the ingestion manifest (only changed sources are re-extracted)"""
+        known = self.sources()
+        for source in set(known) - set(manifest["sources"]):
+            self.remove_source(source)
+        found = 0
+        for source, entry in manifest["sources"].items():
+            if entry["hash"] and known.get(source) == entry["hash"]:
+                continue
+            found += self.rebuild_source(source, entry["chunks"].values(), entry["hash"])
+        return found
+
+    def vocabulary(self):
+        """attribute -> set of terms, with words shared by every category left out"""
+        vocabulary = {"category": set(), "finish": set(), "name": set()}
+        for attribute, term in self.conn.execute("SELECT DISTINCT attribute, term FROM product_terms"):
+            vocabulary[attribute].add(term)
+        categories = [set(_terms(row[0])) for row in self.conn.execute("SELECT DISTINCT category FROM products")]
+        if len(categories) > 1:
+            vocabulary["category"] -= set.intersection(*categories)
+        return vocabulary
+
+    def search(self, codes=(), filters=None, limit=25, offset=0):
+        """Products matching every filter ({attribute: [terms]}); returns (page, total)"""
+        candidates = None
+        if codes:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT code FROM products WHERE code IN ({','.join('?' * len(codes))})", list(codes)
+            )
+            candidates = {row[0] for row in rows}
+        finish_terms = set()
+        for attribute, terms in (filters or {}).items():
+            rows = self.conn.execute(
+                f"SELECT DISTINCT code FROM product_terms WHERE attribute = ? AND term IN ({','.join('?' * len(terms))})",
+                [attribute, *terms]
+            )
+            codes_found = {row[0] for row in rows}
+            candidates = codes_found if candidates is None else candidates & codes_found
+            if attribute == "finish":
+                finish_terms = set(terms)
+
+        if candidates is not None and not candidates:
+            return [], 0
+        query = "SELECT code, name, display_code, description, category, finishes, source FROM products"
+        params = []
+        if candidates is not None:
+            query += f" WHERE code IN ({','.join('?' * len(candidates))})"
+            params = sorted(candidates)
+        products = {}
+        for code, name, display_code, description, category, finishes, source in self.conn.execute(
+                query + " ORDER BY name, code", params):
+            products.setdefault(code, {
+                "code": display_code, "name": name, "description": description,
+                "category": category, "finishes": json.loads(finishes), "source": source
+            })
+        products = list(products.values())
+
+        if len(finish_terms) > 1:
+            # "bianco laccato" should prefer finishes with both words over those with one
+            def score(product):
+                return max((len(finish_terms & set(_terms(f))) for f in product["finishes"]), default=0)
+            best = max((score(p) for p in products), default=0)
+            products = [p for p in products if score(p) == best]
+        return products[offset:offset + limit], len(products)
+
+
+def parse_question(text, vocabulary, strict=True):
+    """Codes and attribute filters named in a question, or None if it is not a catalogue listing.
+
+    strict=False takes any text as a filter (the /api/catalog endpoint).
+    """
+    words = {TERM_SYNONYMS.get(word, word) for word in normalize(text).split()}
+    codes = extract_codes(text, query=True)
+    filters = {}
+    for attribute, terms in vocabulary.items():
+        found = sorted(words & terms)
+        if found:
+            filters[attribute] = found
+    if not strict:
+        return codes, filters
+    if words & FREE_FORM_KEYWORDS:
+        return None
+    # A product line name alone ("tell me about Sara") is better answered from the documents,
+    # and without any filter only an explicit request ("which doors do you have?") lists everything
+    listing = bool(words & LISTING_WORDS)
+    if codes or filters.keys() - {"name"} or (filters and listing) or (listing and words & CATALOGUE_WORDS):
+        return codes, filters
+    return None
+
+
+def format_answer(products, total, language, offset=0):
+    """Plain-text product list in the user's language"""
+    lang = language if language in ANSWER_HEADERS else 'it'
+    lines = [ANSWER_HEADERS[lang].format(total=total)]
+    for product in products:
+        line = f"- {product['name']} {product['code']}: {product['description']}"
+        if product["category"]:
+            line += f" ({product['category']})"
+        if product["finishes"]:
+            line += f"; {FINISHES_LABEL[lang]}: {', '.join(product['finishes'])}"
+        lines.append(line)
+    more = total - offset - len(products)
+    if more > 0:
+        lines.append(MORE_RESULTS[lang].format(more=more))
+    return "\n".join(lines)
+
+
+def format_summary(products, total, language):
+    """One-line record of a listing for the session history"""
+    lang = language if language in SUMMARY_HEADERS else 'it'
+    codes = ", ".join(f"{product['name']} {product['code']}" for product in products[:SUMMARY_MAX_PRODUCTS])
+    if total > SUMMARY_MAX_PRODUCTS:
+        codes += ", ..."
+    return SUMMARY_HEADERS[lang].format(total=total, codes=codes)
+
+
+class CatalogReader:
+    """Answers listing questions from the catalogue of the currently published index version"""
+
+    def __init__(self, vector_store_path, page_size=25):
+        self.vector_store_path = vector_store_path
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._version = object()
+        self._catalog = None
+        self._vocabulary = None
+
+    def _current(self, version):
+        """Catalogue of the published version (call with the lock held).
+
+        Reopened after a new version is published; the previous one is closed
+        right away, since every use of it happens under the same lock.
+        """
+        if version != self._version:
+            path = os.path.join(current_version_path(self.vector_store_path), DOCSTORE_FILE)
+            catalog = ProductCatalog(path, read_only=True) if os.path.exists(path) else None
+            if catalog is not None and not catalog.available:
+                catalog.close()
+                catalog = None
+            if self._catalog is not None:
+                self._catalog.close()
+            self._catalog = catalog
+            self._vocabulary = catalog.vocabulary() if catalog else None
+            self._version = version
+        return self._catalog
+
+    def search(self, text, page=1, strict=True):
+        """(products, total) for a question or None when the catalogue cannot answer it"""
+        version = index_version(self.vector_store_path)
+        with self._lock:
+            catalog = self._current(version)
+            if catalog is None:
+                return None
+            parsed = parse_question(text, self._vocabulary, strict)
+            if parsed is None:
+                return None
+            codes, filters = parsed
+            return catalog.search(codes, filters, self.page_size, (max(page, 1) - 1) * self.page_size)
+
+    def answer(self, text, language):
+        """(answer, summary for the session history, products) for a listing question,
+        or None to let RAG answer it"""
+        found = self.search(text)
+        if not found or not found[1]:
+            return None
+        products, total = found
+        return format_answer(products, total, language), format_summary(products, total, language), products
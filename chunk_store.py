@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import weakref
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+
+# Product codes such as "SR-101" or "VL215". Chunks only count upper-case codes
+# written with a hyphen or nothing in between; queries may also use lower case or a space.
+CODE_PATTERN = re.compile(r"\b([A-Z]{1,4})-?(\d{2,6}[A-Z]?)\b")
+QUERY_CODE_PATTERN = re.compile(r"\b([A-Za-z]{1,4})[-\s]?(\d{2,6}[A-Za-z]?)\b")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Bumped when the search tables change so existing stores are backfilled
+SCHEMA_VERSION = 1
+
+
+def extract_codes(text, query=False):
+    """Canonical product codes in a text: upper case without separators"""
+    pattern = QUERY_CODE_PATTERN if query else CODE_PATTERN
+    return sorted({(letters + digits).upper() for letters, digits in pattern.findall(text)})
+
+
+def keyword_query(text, max_terms=32):
+    """FTS5 query matching any word of the text (quoted, so user input is never parsed as syntax)"""
+    words = list(dict.fromkeys(WORD_PATTERN.findall(text.lower())))[:max_terms]
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class _ThreadConnection:
+    """A thread's connection, closed as soon as the thread ends and drops it.
+
+    sqlite3 connections sit in reference cycles and would otherwise stay open
+    until the garbage collector runs.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __del__(self):
+        self.conn.close()
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Chunk texts and metadata in SQLite, fetched by id only when retrieved.
+
+    Replaces the pickled InMemoryDocstore so loading a vector store does not
+    materialise the whole text corpus, and nothing is unpickled from disk.
+
+    Alongside the chunks it keeps an FTS5 index (BM25 keyword search) and a
+    product code table, both updated with every add/delete.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+        # Every live thread's connection, for close_all; a thread's connection is
+        # closed and dropped from here when the thread ends
+        self._connections = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        if not read_only:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chunks ("
+                    "id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+                    "text, content='chunks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS chunk_codes (code TEXT NOT NULL, id TEXT NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS chunk_codes_code ON chunk_codes (code)")
+                conn.execute("CREATE INDEX IF NOT EXISTS chunk_codes_id ON chunk_codes (id)")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    self._backfill(conn)
+        self.has_keyword_index = self._table_exists("chunks_fts")
+
+    def _table_exists(self, name):
+        return self._connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    def _backfill(self, conn):
+        """Build the search tables for chunks stored before they existed"""
+        if conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            print("Building keyword and product code index for existing chunks...")
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+        conn.execute("DELETE FROM chunk_codes")
+        conn.executemany(
+            "INSERT INTO chunk_codes (code, id) VALUES (?, ?)",
+            [
+                (code, doc_id)
+                for doc_id, text in conn.execute("SELECT id, text FROM chunks")
+                for code in extract_codes(text)
+            ]
+        )
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections are not thread-safe).
+
+        Each is only used by its own thread; check_same_thread is off so that
+        close_all can close them from whichever thread retires the store.
+        """
+        holder = getattr(self._local, "conn", None)
+        if holder is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+            holder = self._local.conn = _ThreadConnection(conn)
+            with self._connections_lock:
+                self._connections.add(holder)
+        return holder.conn
+
+    def close(self):
+        """Checkpoint the WAL into the database file and close this thread's connection"""
+        holder = getattr(self._local, "conn", None)
+        if holder is None:
+            return
+        if not self.read_only:
+            holder.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        holder.conn.close()
+        self._local.conn = None
+        with self._connections_lock:
+            self._connections.discard(holder)
+
+    def close_all(self):
+        """Close the connections of every thread, once no request uses the store any more"""
+        with self._connections_lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+        for holder in connections:
+            holder.conn.close()
+
+    def add(self, texts):
+        """Add or replace documents keyed by id"""
+        ids = [(doc_id,) for doc_id in texts]
+        with self._connection() as conn:
+            self._unindex(conn, ids)
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                [
+                    (doc_id, doc.page_content, json.dumps(doc.metadata, default=str))
+                    for doc_id, doc in texts.items()
+                ]
+            )
+            conn.executemany("INSERT INTO chunks_fts (rowid, text) SELECT rowid, text FROM chunks WHERE id = ?", ids)
+            conn.executemany(
+                "INSERT INTO chunk_codes (code, id) VALUES (?, ?)",
+                [(code, doc_id) for doc_id, doc in texts.items() for code in extract_codes(doc.page_content)]
+            )
+
+    def delete(self, ids):
+        """Delete documents by id"""
+        ids = [(doc_id,) for doc_id in ids]
+        with self._connection() as conn:
+            self._unindex(conn, ids)
+            conn.executemany("DELETE FROM chunks WHERE id = ?", ids)
+
+    def _unindex(self, conn, ids):
+        # External-content FTS5 tables need the old text to remove a row
+        conn.executemany(
+            "INSERT INTO chunks_fts (chunks_fts, rowid, text) SELECT 'delete', rowid, text FROM chunks WHERE id = ?", ids
+        )
+        conn.executemany("DELETE FROM chunk_codes WHERE id = ?", ids)
+
+    def keyword_search(self, query, limit):
+        """Chunk ids ranked by BM25 against the words of the query"""
+        match = keyword_query(query)
+        if not match or not self.has_keyword_index:
+            return []
+        rows = self._connection().execute(
+            "SELECT chunks.id FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?",
+            (match, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def code_search(self, codes, limit):
+        """Chunk ids mentioning any of the product codes, most matching codes first"""
+        if not codes or not self.has_keyword_index:
+            return []
+        placeholders = ",".join("?" * len(codes))
+        rows = self._connection().execute(
+            f"SELECT id FROM chunk_codes WHERE code IN ({placeholders}) "
+            "GROUP BY id ORDER BY COUNT(*) DESC LIMIT ?",
+            (*codes, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, search):
+        """Fetch one document by id"""
+        row = self._connection().execute(
+            "SELECT text, metadata FROM chunks WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
@@ -1,3 +1,5 @@
+import os
+
 # Model Configuration - EXTREME SPEED
 OLLAMA_MODEL = "gemma3:1b"  # Much faster model
 TEMPERATURE = 0.01  # Absolutely minimal for instant responses
@@ -5,22 +7,122 @@ NUM_PREDICT = 30  # Extremely short responses
 
 # Rest stays the same...
 
+# Ollama server
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")  # Override to point at a stub or another host
+OLLAMA_POOL_SIZE = 16  # Keep-alive connections to Ollama
+OLLAMA_KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded after a request
+OLLAMA_NUM_CTX = 4096  # Context window; every request must use the same value or Ollama reloads the model
+OLLAMA_SESSION_CONTEXT = True  # Continue each session's Ollama context (KV cache) on follow-up turns
+OLLAMA_CONTEXT_MAX = 2048  # Start a fresh context once the carried one grows past this many tokens
+OLLAMA_MAX_CONCURRENCY = 2  # Generations in flight at once on each backend
+OLLAMA_MAX_QUEUE = 32  # Requests allowed to wait for a generation slot
+OLLAMA_QUEUE_TIMEOUT = 30  # Seconds a request may wait before getting a 503
+
+# Generation backends (ollama_pool.py): each request goes to the least loaded healthy server.
+# List several servers here, or set OLLAMA_BACKENDS="http://gpu1:11434,http://gpu2:11434" (weight 1 each).
+OLLAMA_BACKENDS = [
+    {"url": url, "weight": 1, "max_concurrency": OLLAMA_MAX_CONCURRENCY}
+    for url in os.environ.get("OLLAMA_BACKENDS", OLLAMA_URL).split(",")
+]
+OLLAMA_HEALTH_INTERVAL = 10  # Seconds between /api/tags checks of every backend (0 = off)
+OLLAMA_FAILURE_THRESHOLD = 3  # Failed requests in a row that open a backend's circuit
+OLLAMA_CIRCUIT_COOLDOWN = 30  # Seconds an open circuit keeps traffic away from a backend
+
+# Load models and run a warmup query in the background at startup
+WARMUP_ON_STARTUP = True
+
 
 # Server Configuration
 HOST = "127.0.0.1"
 PORT = 5000
 DEBUG = True
 
+# Logging and metrics
+LOG_LEVEL = "INFO"  # "DEBUG" logs every request and prompt
+METRICS_JSON_LOGS = False  # One JSON log line with all stage timings per chat request
+
+# Conversation memory (per session)
+SESSION_COOKIE = "schipani_session"
+SESSION_HEADER = "X-Session-ID"
+SESSION_HISTORY_TURNS = 4  # Turns passed back to the chain
+SESSION_HISTORY_TOKENS = 600  # Approximate token budget for those turns
+SESSION_MAX = 1000  # Sessions kept in memory (LRU)
+SESSION_TTL = 1800  # Seconds before an idle session is dropped
+SESSION_DB_PATH = None  # e.g. "data/sessions.db" to keep sessions across restarts
+
+# Follow-up questions (query_rewrite.py)
+# "expand": history keywords only, no LLM call (follow-up p50 1.55s vs 2.82s parallel, 3.06s llm on the benchmark)
+# "parallel": search an expanded query while the LLM rewrite runs, merge both when it is ready in time
+# "llm": the chain's serial rewrite before retrieval
+CONDENSE_MODE = os.environ.get("CONDENSE_MODE", "expand")
+CONDENSE_SKIP_SELF_CONTAINED = True  # Follow-ups that need no history are searched as they are
+CONDENSE_TIMEOUT = 1.5  # Seconds retrieval waits for the parallel rewrite before going on without it
+CONDENSE_READ_TIMEOUT = CONDENSE_TIMEOUT + 1.0  # Ollama read timeout for the parallel rewrite
+CONDENSE_MAX_TOKENS = 48  # A rewritten question is short; stop the LLM there
+CONDENSE_MAX_CONCURRENCY = 2  # Parallel rewrites at once, taken out of the chats' generation slots; beyond that "expand"
+
+# Semantic answer cache (first-turn questions only)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.92  # Cosine similarity needed for a hit
+ANSWER_CACHE_MAX = 500  # Cached answers kept (LRU)
+ANSWER_CACHE_TTL = 3600  # Seconds before a cached answer expires
+
 # Company Information
 COMPANY_NAME = "Schipani"
 COMPANY_LOCATION = "Crotone, Italy"
 COMPANY_EMAIL = "info@infissiearredamentikroton.it"
 COMPANY_PHONE = "+39 0962 19 71 707"
+COMPANY_HOURS = None  # e.g. "Mon-Fri 9:00-13:00, 15:30-19:30"; None leaves hours questions to RAG
 
 # Paths
 VECTOR_STORE_PATH = "data/vector_store"
 TEXT_FILES_PATH = "data/text_files"
 PDFS_PATH = "data/pdfs"
+WEB_CACHE_PATH = "data/web_cache"  # HTTP cache of crawled pages (ETag/Last-Modified)
+
+# FAISS index
+INDEX_FACTORY = "Flat"  # Search index built at ingestion, e.g. "IVF1024,SQ8", "HNSW32", "IVF1024,PQ48"
+INDEX_MMAP = False  # Memory-map the search index (read-only) in the server
+INDEX_KEEP_VERSIONS = 3  # Published index versions kept under data/vector_store/versions/
+INDEX_WATCH_INTERVAL = 5  # Seconds between checks for a newly published index (0 = only via /admin/reload-index)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # Shared secret for the reload endpoints (unset = endpoints disabled)
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+SEARCH_K = 3  # Chunks retrieved per question
+HYBRID_SEARCH = True  # Fuse BM25 keyword and product code matches with vector search
+SEARCH_FETCH_K = 20  # Candidates per ranking before fusion
+CONTEXT_TOKEN_BUDGET = 800  # Max (estimated) tokens of retrieved text in the prompt
+CONTEXT_DUPLICATE_THRESHOLD = 0.8  # Word-trigram overlap at which a chunk counts as a duplicate
+SEARCH_NPROBE = 16  # IVF lists probed per query
+SEARCH_EF = 64  # HNSW efSearch
+
+# Web crawling (admin option 3, ingest.py --crawl)
+CRAWL_WORKERS = 8  # Pages fetched concurrently
+CRAWL_MAX_DEPTH = 1  # Link levels followed from the seed pages by ingest.py --crawl
+CRAWL_MAX_PAGES = 200  # Stop after this many pages per crawl
+CRAWL_TIMEOUT = 15  # Seconds per request
+
+# Bulk ingestion (ingest.py)
+INGEST_BATCH_SIZE = 64  # Chunks per embedding call
+INGEST_WORKERS = None  # Parser processes (None = one per CPU)
+INGEST_THREADS = None  # Embedding threads for ingest.py, torch or ONNX (None = backend default)
+INGEST_QUEUE_SIZE = 1024  # Chunks buffered between parsing and embedding
+PDF_WORKERS = None  # Processes parsing pages of one PDF in admin.py (None = one per CPU)
+PDF_PAGES_PER_TASK = 8  # Pages per parsing task; bounds memory to workers x 2 x this many pages
 
 # Embeddings - faster model
 EMBEDDINGS_MODEL = "all-MiniLM-L6-v2"  # Keep same for compatibility with existing vector store
+EMBEDDINGS_BACKEND = os.environ.get("EMBEDDINGS_BACKEND", "torch")  # "onnx": int8 ONNX Runtime model, no torch
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "data/onnx/all-MiniLM-L6-v2")  # Written by `python embedding_backends.py export`
+ONNX_THREADS = None  # ONNX Runtime intra-op threads (None = one per core)
+QUERY_EMBED_CACHE_MAX = 2048  # Query vectors kept in memory (LRU)
+QUERY_EMBED_BATCH_MAX = 32  # Most queries encoded in one forward pass
+QUERY_EMBED_BATCH_WAIT = 0.005  # Seconds to gather concurrent queries into a batch
+
+# Retrieval sidecar (retrieval_server.py): one process holds the model and index for all web workers
+RETRIEVAL_SERVER_URL = os.environ.get("RETRIEVAL_SERVER_URL")  # e.g. "http://127.0.0.1:5100"; None loads them in-process
+RETRIEVAL_SERVER_PORT = 5100
+RETRIEVAL_SERVER_TIMEOUT = 10  # Seconds per search or embed request
+
+# Product catalogue (catalog.py): product records extracted at ingestion answer listing questions directly
+CATALOG_ENABLED = True  # Answer "which doors come in walnut?" from the product table instead of the LLM
+CATALOG_PAGE_SIZE = 25  # Products per answer or /api/catalog page
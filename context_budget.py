@@ -0,0 +1,95 @@
+import re
+from sessions import estimate_tokens
+
+WORD_PATTERN = re.compile(r"\w+")
+MIN_OVERLAP = 30  # Shortest shared run of characters treated as splitter overlap
+MAX_OVERLAP = 600  # Longest overlap searched for (the splitter uses 200)
+MIN_TAIL_TOKENS = 40  # Don't bother adding a truncated chunk smaller than this
+
+
+def _overlap(tail_text, head_text):
+    """Length of the longest suffix of tail_text that is also a prefix of head_text"""
+    window = tail_text[-MAX_OVERLAP:]
+    probe = head_text[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = window.find(probe)
+    while start != -1:
+        length = len(window) - start
+        if head_text.startswith(window[start:]):
+            return length
+        start = window.find(probe, start + 1)
+    return 0
+
+
+def _shingles(text, size=3):
+    words = WORD_PATTERN.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _truncate(text, max_tokens):
+    """Cut text to about max_tokens, ending on a sentence or word boundary"""
+    limit = max(0, (max_tokens - 1) * 4)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("\n"))
+    if end < limit // 2:
+        end = cut.rfind(" ")
+    return cut[:end + 1].rstrip() if end > 0 else cut
+
+
+def pack_context(docs, max_tokens, duplicate_threshold=0.8):
+    """Build the prompt context from ranked documents within a token budget.
+
+    Documents are taken in retrieval order. Text shared with an already kept
+    chunk of the same source (the splitter's chunk_overlap) is trimmed,
+    near-duplicates are dropped, and the last chunk that fits is truncated.
+    Returns (kept_docs, context, stats).
+    """
+    kept = []  # (doc, text, shingles)
+    used = 0
+    for doc in docs:
+        text = doc.page_content.strip()
+        source = doc.metadata.get("source")
+        for other, other_text, _ in kept:
+            if other.metadata.get("source") != source or not text:
+                continue
+            head = _overlap(other_text, text)
+            if head:
+                text = text[head:].lstrip()
+            tail = _overlap(text, other_text)
+            if tail:
+                text = text[:len(text) - tail].rstrip()
+        if not text:
+            continue
+
+        shingles = _shingles(text)
+        if any(_similarity(shingles, other_shingles) >= duplicate_threshold for _, _, other_shingles in kept):
+            continue
+
+        tokens = estimate_tokens(text)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used
+            if remaining >= MIN_TAIL_TOKENS:
+                text = _truncate(text, remaining)
+                kept.append((doc, text, shingles))
+                used += estimate_tokens(text)
+            break
+        kept.append((doc, text, shingles))
+        used += tokens
+
+    context = "\n\n".join(text for _, text, _ in kept)
+    original = sum(estimate_tokens(doc.page_content) for doc in docs)
+    stats = {
+        "context_tokens": estimate_tokens(context) if kept else 0,
+        "context_tokens_saved": max(0, original - used),
+        "chunks_dropped": len(docs) - len(kept)
+    }
+    return [doc for doc, _, _ in kept], context, stats
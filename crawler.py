@@ -0,0 +1,192 @@
+"""Concurrent website crawler with an on-disk HTTP cache.
+
+    crawler = WebCrawler("data/web_cache", workers=8)
+    documents = crawler.crawl(["https://example.com/sitemap.xml"], max_depth=1)
+
+Seeds may be pages or sitemaps. Pages are fetched breadth-first by a bounded
+thread pool, following same-host links up to max_depth. Every response is
+cached with its ETag/Last-Modified, so a re-crawl sends conditional requests
+and unchanged pages come back as 304 without being downloaded again.
+Works against any HTTP server, e.g. `python -m http.server` for testing.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urldefrag, urlparse
+import requests
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "SchipaniAssistantCrawler/1.0"
+SKIPPED_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".css", ".js",
+    ".pdf", ".zip", ".mp4", ".mp3", ".woff", ".woff2", ".ttf"
+)
+# Page furniture that repeats on every page and only adds noise to the index
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer", "form"]
+BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+class HttpCache:
+    """Response bodies and validators (ETag, Last-Modified) on disk, keyed by URL"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _files(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key + ".json"), os.path.join(self.path, key + ".body")
+
+    def get(self, url):
+        """Cached (meta, body) for a URL, or None"""
+        meta_path, body_path = self._files(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, response):
+        """Store a 200 response (body first, so a meta file always has its body)"""
+        meta_path, body_path = self._files(url)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type", ""),
+            "fetched": time.time()
+        }
+        for path, data, mode in ((body_path, response.content, "wb"), (meta_path, json.dumps(meta), "w")):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return meta
+
+
+def parse_page(html, base_url):
+    """Title, readable text (no scripts or navigation) and absolute links of an HTML page"""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+
+    # Links first: most of them live in the navigation that is stripped below
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        url, _ = urldefrag(urljoin(base_url, anchor["href"].strip()))
+        if urlparse(url).scheme in ("http", "https"):
+            links.append(url)
+
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    lines = (" ".join(line.split()) for line in soup.get_text("\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+    return title, BLANK_LINES.sub("\n\n", text).strip(), links
+
+
+def parse_sitemap(body):
+    """URLs listed in a sitemap or sitemap index, or None if the body is not one"""
+    try:
+        root = ElementTree.fromstring(body)
+    except ElementTree.ParseError:
+        return None
+    if not root.tag.endswith(("urlset", "sitemapindex")):
+        return None
+    return [element.text.strip() for element in root.iter() if element.tag.endswith("loc") and element.text]
+
+
+class WebCrawler:
+    """Breadth-first crawler: bounded fetch pool, same-host links, conditional requests"""
+
+    def __init__(self, cache_path, workers=8, max_pages=200, timeout=15):
+        self.cache = HttpCache(cache_path)
+        self.workers = workers
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.stats = {"fetched": 0, "not_modified": 0, "failed": 0}
+
+    def fetch(self, url):
+        """Return (body, content_type, not_modified), revalidating any cached copy"""
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            meta = cached[0]
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            return cached[1], cached[0]["content_type"], True
+        response.raise_for_status()
+        meta = self.cache.put(url, response)
+        return response.content, meta["content_type"], False
+
+    def _visit(self, url):
+        """Fetch and parse one URL (runs in the pool); returns (document, links, sitemap urls, not_modified)"""
+        body, content_type, not_modified = self.fetch(url)
+        if "xml" in content_type or url.lower().endswith(".xml"):
+            urls = parse_sitemap(body)
+            if urls is not None:
+                return None, [], urls, not_modified
+        if "text/plain" in content_type:
+            text = body.decode("utf-8", errors="replace").strip()
+            document = Document(page_content=text, metadata={"source": url, "title": ""}) if text else None
+            return document, [], [], not_modified
+        if "html" not in content_type:
+            return None, [], [], not_modified
+        title, text, links = parse_page(body, url)
+        document = Document(page_content=text, metadata={"source": url, "title": title}) if text else None
+        return document, links, [], not_modified
+
+    def crawl(self, seeds, max_depth=1):
+        """Crawl from seed pages or sitemaps and return one Document per page with text"""
+        hosts = {urlparse(seed).netloc for seed in seeds}
+        seen = set(seeds)
+        frontier = [(seed, 0) for seed in seeds]
+        documents = []
+        pages = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while frontier and pages < self.max_pages:
+                # Pages that fail or have no text do not count, so the rest stays queued for the next round
+                budget = self.max_pages - pages
+                batch, frontier = frontier[:budget], frontier[budget:]
+                futures = {pool.submit(self._visit, url): (url, depth) for url, depth in batch}
+                for future in as_completed(futures):
+                    url, depth = futures[future]
+                    try:
+                        document, links, sitemap_urls, not_modified = future.result()
+                    except (requests.RequestException, OSError) as e:
+                        self.stats["failed"] += 1
+                        print(f"Failed to fetch {url}: {str(e)}")
+                        continue
+                    self.stats["not_modified" if not_modified else "fetched"] += 1
+                    if document is not None:
+                        documents.append(document)
+                        pages += 1
+                    # Sitemap entries are listings, not links, so they keep the sitemap's depth
+                    candidates = [(u, depth) for u in sitemap_urls]
+                    if depth < max_depth:
+                        candidates += [(u, depth + 1) for u in links]
+                    for link, link_depth in candidates:
+                        if link in seen or urlparse(link).netloc not in hosts:
+                            continue
+                        if urlparse(link).path.lower().endswith(SKIPPED_EXTENSIONS):
+                            continue
+                        seen.add(link)
+                        frontier.append((link, link_depth))
+
+        return documents[:self.max_pages]
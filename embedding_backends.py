@@ -0,0 +1,166 @@
+"""Embedding backends for all-MiniLM-L6-v2.
+
+    torch  sentence-transformers through langchain_huggingface (the default)
+    onnx   int8-quantized ONNX Runtime export: no torch in the process, smaller
+           and faster on CPU
+
+    python embedding_backends.py export   # writes ONNX_MODEL_PATH (needs optimum)
+    python embedding_backends.py check    # compares ONNX vectors with the index
+
+Both backends produce mean-pooled, L2-normalised vectors, so an index built
+with one can be queried with the other; `check` measures how close they are
+and how many of the same neighbours the ONNX vectors retrieve (recall@k).
+"""
+import argparse
+import os
+import sys
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDINGS_MODEL, EMBEDDINGS_BACKEND, ONNX_MODEL_PATH, ONNX_THREADS, VECTOR_STORE_PATH
+
+ONNX_MODEL_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2 truncates here too
+BATCH_SIZE = 32
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an exported ONNX model: tokenize, run, mean-pool, normalise"""
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, file_name=ONNX_MODEL_FILE, threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_file = os.path.join(model_path, file_name)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"{model_file} not found - run 'python embedding_backends.py export' first")
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed(self, texts):
+        # Same preprocessing as langchain_huggingface
+        encodings = self.tokenizer.encode_batch([text.replace("\n", " ") for text in texts])
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), BATCH_SIZE):
+            vectors.extend(self._embed(texts[start:start + BATCH_SIZE]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+def make_embeddings(backend=EMBEDDINGS_BACKEND, threads=None):
+    """The configured embedding model; heavy libraries are imported only here.
+
+    threads overrides the CPU threads used for embedding: the session's
+    intra-op threads for onnx, torch's global thread count for torch.
+    """
+    if backend == "onnx":
+        return OnnxEmbeddings(threads=threads or ONNX_THREADS)
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
+    raise ValueError(f"Unknown embeddings backend: {backend}")
+
+
+def export_onnx(model_name=EMBEDDINGS_MODEL, output_path=ONNX_MODEL_PATH):
+    """Export the sentence-transformers model to ONNX and quantize its weights to int8"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    print(f"Exporting {repo} to {output_path}...")
+    model = ORTModelForFeatureExtraction.from_pretrained(repo, export=True)
+    model.save_pretrained(output_path)
+    AutoTokenizer.from_pretrained(repo).save_pretrained(output_path)
+    # Dynamic quantization: int8 weights, activations quantized at run time, no calibration data
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(save_dir=output_path, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+    print(f"Saved {os.path.join(output_path, ONNX_MODEL_FILE)}")
+
+
+def recall_at_k(index, reference, candidate, k=5):
+    """Average share of the top-k neighbours of each reference vector that its candidate vector also finds"""
+    k = min(k, index.ntotal)
+    _, expected = index.search(np.ascontiguousarray(reference, dtype=np.float32), k)
+    _, found = index.search(np.ascontiguousarray(candidate, dtype=np.float32), k)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+
+def check_against_index(vector_store_path=VECTOR_STORE_PATH, samples=200, tolerance=0.98, k=5, min_recall=0.9):
+    """Re-embed chunks of the current index with the ONNX model and compare with the stored vectors.
+
+    Returns True when every cosine similarity reaches the tolerance and the
+    ONNX vectors find at least min_recall of the stored vectors' k neighbours.
+    """
+    import json
+    from chunk_store import SQLiteDocstore
+    from index_versions import current_version_path, FLAT_INDEX_FILE, DOCSTORE_FILE
+    from vector_index import IDS_FILE, read_index
+
+    path = current_version_path(vector_store_path)
+    index = read_index(os.path.join(path, FLAT_INDEX_FILE))
+    with open(os.path.join(path, IDS_FILE), encoding="utf-8") as f:
+        ids = json.load(f)
+    docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE), read_only=True)
+    positions = np.linspace(0, index.ntotal - 1, min(samples, index.ntotal)).astype(int)
+    texts = [docstore.search(ids[i]).page_content for i in positions]
+    stored = np.array([index.reconstruct(int(i)) for i in positions], dtype=np.float32)
+    onnx = np.array(OnnxEmbeddings().embed_documents(texts), dtype=np.float32)
+
+    stored /= np.clip(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12, None)
+    cosine = (stored * onnx).sum(axis=1)
+    k = min(k, index.ntotal)
+    recall = recall_at_k(index, stored, onnx, k)
+    print(f"{len(texts)} chunks: cosine min {cosine.min():.4f}, mean {cosine.mean():.4f}, "
+          f"max abs difference {np.abs(stored - onnx).max():.4f}, recall@{k} {recall:.3f}")
+    ok = bool(cosine.min() >= tolerance)
+    print("ONNX vectors match the index" if ok else f"Some vectors are below the {tolerance} tolerance")
+    if recall < min_recall:
+        print(f"Recall@{k} is below {min_recall}")
+    return ok and recall >= min_recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check the ONNX embeddings backend")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="export and int8-quantize the embeddings model")
+    export.add_argument("--output", default=ONNX_MODEL_PATH)
+    check = subparsers.add_parser("check", help="compare ONNX vectors with those stored in the index")
+    check.add_argument("--samples", type=int, default=200)
+    check.add_argument("--tolerance", type=float, default=0.98, help="minimum cosine similarity")
+    check.add_argument("--k", type=int, default=5, help="neighbours compared for recall@k")
+    check.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(output_path=args.output)
+    else:
+        sys.exit(0 if check_against_index(samples=args.samples, tolerance=args.tolerance,
+                                                k=args.k, min_recall=args.min_recall) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,20 @@
 import logging
-from langdetect import detect
+from langdetect import detect_langs, DetectorFactory
 from config import COMPANY_NAME, COMPANY_LOCATION, COMPANY_EMAIL, COMPANY_PHONE
 import os
 
-# Define a list of gratitude words
-gratitude_words = ['thank', 'grazie', 'merci', 'gracias']
+# Make langdetect deterministic (it samples randomly by default)
+DetectorFactory.seed = 0
 
-def detect_language(text):
-    """Detect the language of user input with a focus on common greetings."""
+def detect_language_among(text, languages, default='it'):
+    """The likeliest of the given languages, for texts langdetect attributes to another one"""
     try:
-        # Clean the text
-        cleaned_text = text.strip().lower()
-        
-        # Explicitly handle common greetings for short texts
-        if len(cleaned_text) <= 20:
-            english_greetings = ['hi', 'hello', 'good morning', 'good evening', 'thanks', 'thank you']
-            italian_greetings = ['ciao', 'buongiorno', 'buonasera', 'grazie', 'prego']
-            french_greetings = ['bonjour', 'salut', 'merci']
-            spanish_greetings = ['hola', 'buenos días', 'gracias']
-            
-            if cleaned_text in english_greetings:
-                return 'en'
-            elif cleaned_text in italian_greetings:
-                return 'it'
-            elif cleaned_text in french_greetings:
-                return 'fr'
-            elif cleaned_text in spanish_greetings:
-                return 'es'
-        
-        # Use langdetect for longer texts
-        detected_lang = detect(cleaned_text)
-        logging.debug(f"Detected language via langdetect: {detected_lang}")
-        
-        return detected_lang
-        
+        for guess in detect_langs(text.strip().lower()):
+            if guess.lang in languages:
+                return guess.lang
     except Exception as e:
-        logging.error(f"Language detection error: {e}")
-        return 'it'  # Default to Italian on error
+        logging.debug(f"Language detection error: {e}")
+    return default if default in languages else sorted(languages)[0]
 
 def validate_input(text):
     """Validate user input"""
@@ -59,6 +37,17 @@ def format_response(text):
     
     return formatted
 
+def format_sources(documents):
+    """Summarise retrieved documents for the client"""
+    sources = []
+    for doc in documents:
+        sources.append({
+            "source": doc.metadata.get("source", ""),
+            "page": doc.metadata.get("page"),
+            "snippet": doc.page_content[:200]
+        })
+    return sources
+
 def ensure_directories():
     """Create necessary directories if they don't exist"""
     directories = [
@@ -74,47 +63,6 @@ def ensure_directories():
     
     print("All directories ensured")
 
-def handle_user_message(user_message):
-    """Process the user message and generate a response."""
-    # Detect language
-    detected_language = detect_language(user_message)
-    logging.debug(f"Detected language: {detected_language}")
-    
-    # Check for casual greeting
-    if is_casual_greeting(user_message):
-        logging.debug("Casual greeting detected.")
-        # Handle casual greeting directly
-        if any(word in user_message.lower() for word in gratitude_words):
-            response = get_gratitude_response(detected_language)
-            logging.debug(f"Generated gratitude response: {response}")
-            return response
-        else:
-            response = get_casual_greeting_response(detected_language)
-            logging.debug(f"Generated casual greeting response: {response}")
-            return response
-    
-    # If not a casual greeting, proceed with normal processing
-    logging.debug("Proceeding with normal processing.")
-    prompt = get_system_prompt(detected_language, user_message)
-    return query_language_model(prompt)
-
-def is_casual_greeting(text):
-    """Check if the message is a casual greeting or simple expression"""
-    # List of casual greetings and expressions
-    casual_phrases = [
-        'ciao', 'hello', 'hi', 'bonjour', 'salut', 'hola', 'buongiorno', 'good morning',
-        'thank you', 'thanks', 'grazie', 'merci', 'gracias', 'bye', 'goodbye', 'arrivederci',
-        'see you', 'take care', 'buenos días', 'hey there', 'hi, how are you?'
-    ]
-    
-    # Normalize the text to lowercase
-    normalized_text = text.lower().strip()
-    
-    # Check if the entire text matches any of the casual phrases
-    result = normalized_text in casual_phrases
-    logging.debug(f"Checking if '{text}' is a casual greeting: {result}")
-    return result
-
 def get_gratitude_response(language_code):
     """Return a predefined gratitude response."""
     gratitude_responses = {
@@ -135,19 +83,31 @@ def get_casual_greeting_response(language_code):
     }
     return casual_responses.get(language_code, casual_responses['en'])
 
-def get_system_prompt(language_code, user_message):
-    """Get appropriate prompt based on message type"""
-    
-    # Clear prompt that instructs to use context
-    prompt = f"""You are Benedetta, virtual assistant for {COMPANY_NAME} in Crotone, Italy. 
-Use any provided context to answer accurately. 
+# Persona and company facts. Identical on every request so the rendered prompt
+# always starts with the same tokens, which Ollama reuses from its KV cache.
+SYSTEM_PROMPT = f"""You are Benedetta, virtual assistant for {COMPANY_NAME} in Crotone, Italy.
+Use any provided context to answer accurately.
 Company: {COMPANY_NAME}, Location: {COMPANY_LOCATION}, Email: {COMPANY_EMAIL}, Phone: {COMPANY_PHONE}
-Respond in the same language as the question: {user_message}"""
-    
-    logging.debug(f"Generated universal prompt: {prompt}")
-    return prompt
+Respond in the same language as the question."""
+
+# Per-query instructions, placed after the context so the prompt prefix stays stable
+RAG_INSTRUCTIONS = {
+    "product": "List all doors from the context that match the question. Include names, codes, finishes.",
+    "general": "Answer using the provided context about company info, location, contact details."
+}
+
+def get_system_prompt():
+    """Get the fixed system prompt (never includes the user's message)"""
+    return SYSTEM_PROMPT
+
+def build_rag_prompt(context, question, query_type="general"):
+    """User prompt for a RAG answer: fixed instructions first, then the variable parts"""
+    instruction = RAG_INSTRUCTIONS.get(query_type, RAG_INSTRUCTIONS["general"])
+    return f"""Use the following context to answer the question at the end.
+
+Context:
+{context}
 
-def query_language_model(prompt):
-    """Query the language model with the given prompt."""
-    # Your existing logic to query the language model
-    pass
+{instruction}
+Question: {question}
+Answer:"""
@@ -0,0 +1,61 @@
+from typing import Any, List
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from chunk_store import extract_codes
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense FAISS search, BM25 keyword search and exact product code lookup, fused by rank.
+
+    Dense similarity alone is poor at exact codes ("SR-101") and finish names,
+    so the keyword and code rankings from the SQLite docstore are merged in and
+    fewer chunks are needed to get the right one into the prompt.
+    """
+
+    vectorstore: Any
+    k: int = 3
+    fetch_k: int = 20  # Candidates taken from each ranking before fusion
+    rrf_k: int = 60
+
+    def dense_search(self, query):
+        """Chunk ids ranked by vector similarity (ids only, texts are fetched after fusion)"""
+        vector = np.array([self.vectorstore.embeddings.embed_query(query)], dtype=np.float32)
+        _, positions = self.vectorstore.index.search(vector, self.fetch_k)
+        mapping = self.vectorstore.index_to_docstore_id
+        return [mapping[i] for i in positions[0] if i != -1 and i in mapping]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docstore = self.vectorstore.docstore
+        rankings = [
+            docstore.code_search(extract_codes(query, query=True), self.fetch_k),
+            docstore.keyword_search(query, self.fetch_k),
+            self.dense_search(query)
+        ]
+        docs = []
+        for doc_id in reciprocal_rank_fusion(rankings, self.rrf_k)[:self.k]:
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+
+def make_retriever(vectorstore, k, fetch_k=20, hybrid=True):
+    """Hybrid retriever, or plain vector search when disabled or the store has no keyword index"""
+    if hybrid:
+        if getattr(vectorstore.docstore, "has_keyword_index", False):
+            return HybridRetriever(vectorstore=vectorstore, k=k, fetch_k=fetch_k)
+        print("No keyword index in this vector store - run ingestion again to enable hybrid search")
+    return vectorstore.as_retriever(search_kwargs={"k": k})
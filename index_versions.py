@@ -0,0 +1,194 @@
+"""Index version layout on disk, without importing FAISS.
+
+    data/vector_store/
+        CURRENT              id of the published version
+        versions/<id>/       index.faiss, index_ids.json, docstore.sqlite, manifest.json
+
+Ingestion stages a new version, then repoints CURRENT with one atomic rename.
+Servers poll CURRENT and swap the new version in.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+FLAT_INDEX_FILE = "index.faiss"
+ANN_INDEX_FILE = "index_ann.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Versioned layout: every ingestion writes versions/<id>/ and then repoints CURRENT.
+# A store without CURRENT is the older flat layout and is read in place.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+STAGING_SUFFIX = ".partial"
+STALE_STAGING_AGE = 24 * 3600  # Seconds before an abandoned staging directory is removed
+
+
+def current_version(root):
+    """Id of the published index version, or None for an unversioned store"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_version_path(root):
+    """Directory holding the published index files"""
+    version = current_version(root)
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def index_version(root):
+    """Changes whenever a new index is published (version id, or index mtime for unversioned stores)"""
+    version = current_version(root)
+    if version:
+        return version
+    try:
+        return os.path.getmtime(os.path.join(root, FLAT_INDEX_FILE))
+    except OSError:
+        return None
+
+
+def stage_version(root):
+    """Create a new version directory holding a copy of the current index, for ingestion to modify.
+
+    The published version is never written to, so servers can keep reading it
+    while the new one is built.
+    """
+    # Microseconds keep versions staged within the same second in order for pruning
+    now = time.time()
+    version = time.strftime("%Y%m%d-%H%M%S-", time.localtime(now)) + f"{int(now % 1 * 1e6):06d}-" + os.urandom(2).hex()
+    path = os.path.join(root, VERSIONS_DIR, version + STAGING_SUFFIX)
+    os.makedirs(path)
+    source = current_version_path(root)
+    for name in os.listdir(source):
+        source_path = os.path.join(source, name)
+        # The search index is rebuilt on save; SQLite is copied with its backup API below
+        if not os.path.isfile(source_path) or name == CURRENT_FILE or name == ANN_INDEX_FILE \
+                or name.startswith(DOCSTORE_FILE) or name.endswith(".tmp"):
+            continue
+        shutil.copy2(source_path, os.path.join(path, name))
+    docstore_path = os.path.join(source, DOCSTORE_FILE)
+    if os.path.exists(docstore_path):
+        src = sqlite3.connect(f"file:{docstore_path}?mode=ro", uri=True)
+        dst = sqlite3.connect(os.path.join(path, DOCSTORE_FILE))
+        with dst:
+            src.backup(dst)
+        src.close()
+        dst.close()
+    return path
+
+
+def publish_version(root, staging_path, keep=3):
+    """Make a staged version current with one atomic rename of the CURRENT pointer.
+
+    Keeps the newest `keep` versions, so servers still reading an older one
+    have time to switch.
+    """
+    path = staging_path[:-len(STAGING_SUFFIX)]
+    os.replace(staging_path, path)
+    version = os.path.basename(path)
+    pointer = os.path.join(root, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    _prune_versions(root, keep)
+    return version
+
+
+def discard_version(staging_path):
+    """Drop a staged version that turned out to have no changes"""
+    shutil.rmtree(staging_path, ignore_errors=True)
+
+
+def _prune_versions(root, keep):
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    current = current_version(root)
+    finished = sorted(name for name in os.listdir(versions_dir) if not name.endswith(STAGING_SUFFIX))
+    for name in finished[:-keep] if keep else []:
+        if name != current:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+    for name in os.listdir(versions_dir):
+        path = os.path.join(versions_dir, name)
+        if name.endswith(STAGING_SUFFIX) and time.time() - os.path.getmtime(path) > STALE_STAGING_AGE:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class VersionHandle:
+    """An opened index version shared by concurrent requests.
+
+    Requests acquire() it while they read the version and release() it after;
+    acquire() returns False once a newer version replaced it. close runs
+    when the handle is retired and its last user is done, so a swap never
+    closes files in use and pruned versions are not held open.
+    """
+
+    def __init__(self, value, close=None):
+        self.value = value
+        self._close = close
+        self._users = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._retired:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            unused = self._retired and self._users == 0
+        if unused:
+            self._closed()
+
+    def retire(self):
+        """Replaced by a newer version: close now, or when the last user releases it"""
+        with self._lock:
+            self._retired = True
+            unused = self._users == 0
+        if unused:
+            self._closed()
+
+    def _closed(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+class IndexWatcher:
+    """Background thread calling on_change(version) when a new index version is published"""
+
+    def __init__(self, root, on_change, interval=5.0):
+        self.root = root
+        self.on_change = on_change
+        self.interval = interval
+        self.version = index_version(root)
+
+    def start(self):
+        threading.Thread(target=self._run, name="index-watcher", daemon=True).start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        version = index_version(self.root)
+        if version == self.version:
+            return False
+        try:
+            self.on_change(version)
+        except Exception as e:
+            # Keep the old index and retry on the next poll
+            print(f"Could not load index version {version}: {str(e)}")
+            return False
+        self.version = version
+        return True
@@ -0,0 +1,194 @@
+"""Bulk ingestion of document directories into the vector store.
+
+    python ingest.py data/pdfs data/text_files --workers 4 --batch-size 64
+    python ingest.py --crawl https://example.com/sitemap.xml --depth 1
+
+Files are parsed and chunked in a process pool, chunks flow through a bounded
+queue into batched embedding calls, and each batch is added to the staged
+index as soon as it is embedded; the index is saved and published once at the
+end.
+Sources that are unchanged since the last run (see the manifest in rag.py)
+are skipped.
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from config import (
+    PDFS_PATH, TEXT_FILES_PATH, INGEST_BATCH_SIZE, INGEST_WORKERS, INGEST_THREADS, INGEST_QUEUE_SIZE, CRAWL_MAX_DEPTH
+)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.md')
+
+_DONE = object()
+
+
+def find_files(directories):
+    """List supported files under the given directories"""
+    files = []
+    for directory in directories:
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    files.append(os.path.join(root, name))
+    return files
+
+
+def parse_file(path):
+    """Load and chunk one file (runs in a worker process)"""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    from text_split import make_text_splitter, source_hash
+    from pdf_stream import file_hash
+
+    start = time.time()
+    if path.lower().endswith('.pdf'):
+        # Same digest as FurnitureRAG.add_pdf, so either entry point sees the file as unchanged
+        docs = PyPDFLoader(path).load()
+        digest = file_hash(path)
+    else:
+        docs = TextLoader(path, encoding="utf-8").load()
+        digest = source_hash(docs)
+    chunks = make_text_splitter().split_documents(docs)
+    return path, digest, chunks, time.time() - start
+
+
+class BulkIngestor:
+    """Parse, chunk and embed many files with the stages running concurrently"""
+
+    def __init__(self, rag, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE, queue_size=INGEST_QUEUE_SIZE):
+        self.rag = rag
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.chunk_queue = queue.Queue(maxsize=queue_size)
+        self.timings = {"parse": 0.0, "parse_wall": 0.0, "embed": 0.0, "write": 0.0}
+        self.counts = {"files": 0, "skipped": 0, "failed": 0, "chunks": 0, "stale": 0}
+
+    def _produce(self, files, manifest, stale_ids, errors):
+        """Parse files in the process pool and feed new chunks into the queue"""
+        start = time.time()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                pending = set()
+                remaining = iter(files)
+                while True:
+                    # Keep only a couple of files per worker in flight to bound memory
+                    while len(pending) < self.workers * 2:
+                        path = next(remaining, None)
+                        if path is None:
+                            break
+                        pending.add(pool.submit(parse_file, path))
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        try:
+                            path, digest, chunks, elapsed = future.result()
+                        except Exception as e:
+                            self.counts["failed"] += 1
+                            errors.append(str(e))
+                            print(f"Failed to parse file: {e}")
+                            continue
+                        self.timings["parse"] += elapsed
+                        self.counts["files"] += 1
+                        if self.rag.is_unchanged(manifest, path, digest):
+                            self.counts["skipped"] += 1
+                            continue
+                        new_chunks, new_ids, stale = self.rag.diff_source(manifest, path, digest, chunks)
+                        stale_ids.extend(stale)
+                        for chunk, chunk_id in zip(new_chunks, new_ids):
+                            self.chunk_queue.put((chunk, chunk_id))
+        finally:
+            self.timings["parse_wall"] = time.time() - start
+            self.chunk_queue.put(_DONE)
+
+    def _batches(self):
+        """Yield lists of (chunk, id) pairs of at most batch_size from the queue"""
+        batch = []
+        while True:
+            item = self.chunk_queue.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, directories):
+        """Ingest every supported file under the directories"""
+        total_start = time.time()
+        files = find_files(directories)
+        print(f"Found {len(files)} files in {', '.join(directories)}")
+        manifest = self.rag.prepare_ingestion()
+
+        stale_ids, errors = self.rag.prune_missing_sources(manifest), []
+        producer = threading.Thread(target=self._produce, args=(files, manifest, stale_ids, errors), daemon=True)
+        producer.start()
+
+        for batch in self._batches():
+            chunks = [chunk for chunk, _ in batch]
+            embed_start = time.time()
+            vectors = self.rag.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            self.timings["embed"] += time.time() - embed_start
+            write_start = time.time()
+            self.rag.add_chunks(chunks, [chunk_id for _, chunk_id in batch], vectors)
+            self.timings["write"] += time.time() - write_start
+            self.counts["chunks"] += len(batch)
+            print(f"Embedded {self.counts['chunks']} chunks "
+                  f"({self.counts['chunks'] / (time.time() - total_start):.1f} chunks/sec)")
+        producer.join()
+        self.counts["stale"] = len(stale_ids)
+
+        write_start = time.time()
+        self.rag.apply_changes(manifest, [], [], stale_ids, added=self.counts["chunks"])
+        self.timings["write"] += time.time() - write_start
+
+        total = time.time() - total_start
+        self.report(total)
+        return {"timings": self.timings, "counts": self.counts, "total": total, "errors": errors}
+
+    def report(self, total):
+        """Print counts, stage times and throughput"""
+        counts, timings = self.counts, self.timings
+        print("=== INGESTION REPORT ===")
+        print(f"Files: {counts['files']} parsed, {counts['skipped']} unchanged, {counts['failed']} failed")
+        print(f"Chunks: {counts['chunks']} embedded, {counts['stale']} removed")
+        print(f"Parse: {timings['parse_wall']:.2f}s wall ({timings['parse']:.2f}s across {self.workers} workers)")
+        embed_rate = counts['chunks'] / timings['embed'] if timings['embed'] else 0.0
+        print(f"Embed: {timings['embed']:.2f}s ({embed_rate:.1f} chunks/sec, batch size {self.batch_size})")
+        print(f"Write: {timings['write']:.2f}s")
+        overall_rate = counts['chunks'] / total if total else 0.0
+        print(f"Total: {total:.2f}s ({overall_rate:.1f} chunks/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest document directories into the vector store")
+    parser.add_argument("directories", nargs="*", help=f"default: {PDFS_PATH} {TEXT_FILES_PATH} (unless --crawl is used)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks per embedding call")
+    parser.add_argument("--threads", type=int, default=INGEST_THREADS, help="embedding threads (ONNX Runtime or torch)")
+    parser.add_argument("--queue-size", type=int, default=INGEST_QUEUE_SIZE, help="max chunks waiting to be embedded")
+    parser.add_argument("--crawl", nargs="+", metavar="URL", help="also crawl these pages or sitemaps")
+    parser.add_argument("--depth", type=int, default=CRAWL_MAX_DEPTH, help="link levels to follow when crawling")
+    args = parser.parse_args()
+
+    from rag import FurnitureRAG
+    rag = FurnitureRAG(embedding_threads=args.threads)
+    directories = args.directories or ([] if args.crawl else [PDFS_PATH, TEXT_FILES_PATH])
+    if directories:
+        BulkIngestor(
+            rag,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size
+        ).run(directories)
+    if args.crawl:
+        rag.crawl_website(args.crawl, max_depth=args.depth)
+        rag.process_documents()
+
+
+if __name__ == '__main__':
+    main()
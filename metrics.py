@@ -0,0 +1,199 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache hits up to slow CPU generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+metrics_logger = logging.getLogger("chat.metrics")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, {"le": bound})
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback when metrics are scraped"""
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn()}"]
+
+
+class Registry:
+    """All metrics exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self._register(Gauge(name, help_text, fn))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("chat_requests_total", "Chat requests by outcome", ["outcome"])
+REQUEST_SECONDS = REGISTRY.histogram("chat_request_seconds", "End-to-end chat latency", ["outcome"])
+STAGE_SECONDS = REGISTRY.histogram("chat_stage_seconds", "Time spent in each chat pipeline stage", ["stage"])
+FIRST_TOKEN_SECONDS = REGISTRY.histogram("chat_time_to_first_token_seconds", "Time from request to first generated token")
+DOCS_RETRIEVED = REGISTRY.histogram("chat_docs_retrieved", "Documents retrieved per question", buckets=(0, 1, 2, 3, 5, 8, 13, 21))
+PROMPT_TOKENS = REGISTRY.counter("chat_prompt_tokens_total", "Prompt tokens evaluated by the LLM")
+COMPLETION_TOKENS = REGISTRY.counter("chat_completion_tokens_total", "Tokens generated by the LLM")
+CONDENSE = REGISTRY.counter("chat_condense_total", "Follow-up questions by how the retrieval query was made", ["result"])
+CONTEXT_TOKENS_SAVED = REGISTRY.counter("chat_context_tokens_saved_total", "Retrieved tokens trimmed from prompts (overlap, duplicates, budget)")
+EMBED_CACHE = REGISTRY.counter("query_embedding_cache_total", "Query embedding lookups by cache result", ["result"])
+EMBED_QUERY_SECONDS = REGISTRY.histogram("query_embedding_seconds", "Time to get a query vector (cache, queueing and encode)")
+EMBED_BATCH_SIZE = REGISTRY.histogram("query_embedding_batch_size", "Queries encoded per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64))
+EMBED_BATCH_SECONDS = REGISTRY.histogram("query_embedding_batch_seconds", "Time to encode one batch of queries")
+BACKEND_REQUESTS = REGISTRY.counter("ollama_backend_requests_total", "Generations per Ollama backend by result", ["backend", "result"])
+BACKEND_SECONDS = REGISTRY.histogram("ollama_backend_generation_seconds", "Generation time per Ollama backend", ["backend"])
+BACKEND_FIRST_TOKEN_SECONDS = REGISTRY.histogram("ollama_backend_first_token_seconds", "Time to first token per Ollama backend", ["backend"])
+
+
+class RequestTrace:
+    """Per-request spans for the chat pipeline.
+
+    Each span is recorded in chat_stage_seconds; finish() records the request
+    latency and, if json_logs is set, writes one JSON line with every span.
+    """
+
+    def __init__(self, json_logs=False):
+        self.start = time.time()
+        self.json_logs = json_logs
+        self.spans = {}
+        self.attrs = {}
+        self.outcome = None
+        self._finished = False
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    @contextmanager
+    def span(self, stage):
+        span_start = time.time()
+        try:
+            yield self
+        finally:
+            duration = time.time() - span_start
+            self.spans[stage] = self.spans.get(stage, 0.0) + duration
+            STAGE_SECONDS.observe(duration, stage=stage)
+
+    def set(self, **attrs):
+        """Attach attributes such as docs_retrieved, prompt_tokens, outcome"""
+        if "outcome" in attrs:
+            self.outcome = attrs.pop("outcome")
+        self.attrs.update(attrs)
+        if "docs_retrieved" in attrs:
+            DOCS_RETRIEVED.observe(attrs["docs_retrieved"])
+        if "prompt_tokens" in attrs:
+            PROMPT_TOKENS.inc(attrs["prompt_tokens"])
+        if "completion_tokens" in attrs:
+            COMPLETION_TOKENS.inc(attrs["completion_tokens"])
+        if "condense" in attrs:
+            CONDENSE.inc(result=attrs["condense"])
+        if "context_tokens_saved" in attrs:
+            CONTEXT_TOKENS_SAVED.inc(attrs["context_tokens_saved"])
+        if "first_token" in attrs:
+            FIRST_TOKEN_SECONDS.observe(attrs["first_token"])
+
+    def finish(self, outcome=None):
+        """Record the request once; later calls are ignored"""
+        if self._finished:
+            return
+        self._finished = True
+        outcome = outcome or self.outcome or "unknown"
+        total = self.elapsed()
+        REQUESTS.inc(outcome=outcome)
+        REQUEST_SECONDS.observe(total, outcome=outcome)
+        if self.json_logs:
+            metrics_logger.info(json.dumps({
+                "event": "chat_request",
+                "outcome": outcome,
+                "total_seconds": round(total, 4),
+                "spans": {stage: round(seconds, 4) for stage, seconds in self.spans.items()},
+                **self.attrs
+            }))
@@ -0,0 +1,355 @@
+import json
+import asyncio
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    OLLAMA_POOL_SIZE, OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_FAILURE_THRESHOLD, OLLAMA_CIRCUIT_COOLDOWN
+)
+from ollama_pool import BackendPool
+
+# Keep-alive connections shared by every request in this process
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=len(OLLAMA_BACKENDS), pool_maxsize=OLLAMA_POOL_SIZE))
+_session.mount("https://", HTTPAdapter(pool_connections=len(OLLAMA_BACKENDS), pool_maxsize=OLLAMA_POOL_SIZE))
+
+_async_client = None
+
+# Every generation goes through the pool, which picks the backend
+pool = BackendPool(
+    OLLAMA_BACKENDS,
+    failure_threshold=OLLAMA_FAILURE_THRESHOLD,
+    cooldown=OLLAMA_CIRCUIT_COOLDOWN,
+    health_interval=OLLAMA_HEALTH_INTERVAL,
+    session=_session
+)
+
+
+class ServerBusy(Exception):
+    """No generation slot became free in time"""
+
+
+class OllamaError(RuntimeError):
+    """Ollama reported an error in the response stream"""
+
+
+class StreamCancel:
+    """Lets another thread stop a stream_generate call, even while it waits for the next token.
+
+    cancel() shuts down the open HTTP response, so Ollama sees the connection
+    drop and stops generating; the stream then ends without a retry and without
+    charging a failure to the backend.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def attach(self, response):
+        with self._lock:
+            self._response = response
+        if self._event.is_set():
+            self._shutdown(response)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            self._shutdown(response)
+
+    @staticmethod
+    def _shutdown(response):
+        # urllib3 >= 2.3 can unblock a read in progress; close() only takes effect after it
+        getattr(response.raw, "shutdown", response.close)()
+
+
+def _generate_payload(model, prompt, options, system=None, context=None, keep_alive=None):
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True
+    }
+    if options:
+        payload["options"] = options
+    # A fixed system prompt renders as the same token prefix every time, which Ollama reuses from its KV cache
+    if system:
+        payload["system"] = system
+    # Token context returned by a previous generation, to continue that conversation
+    if context:
+        payload["context"] = context
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def _parse_line(line, stats=None):
+    """Decode one NDJSON line; returns (token, done)"""
+    result = json.loads(line)
+    if result.get('error'):
+        raise OllamaError(result['error'])
+    done = result.get('done', False)
+    if done and stats is not None:
+        # The final message carries Ollama's own token counts and timings
+        for key in ('prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration', 'context'):
+            if key in result:
+                stats[key] = result[key]
+    return result.get('response', ''), done
+
+
+def _client_error(error):
+    """An HTTP 4xx: the request itself is wrong (unknown model, bad options), not the backend"""
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500
+
+
+def _next_backend(tried, affinity, backend_url, error):
+    """Backend for the next attempt; raises the last error when none is left for a retry,
+    or ServerBusy when no backend can take the request at all"""
+    backend = pool.acquire(exclude=tried, affinity=affinity, url=backend_url)
+    if backend is None:
+        if tried:
+            raise error
+        raise ServerBusy("No Ollama backend is available")
+    if tried:
+        logging.warning(f"Ollama backend {tried[-1].url} failed ({error}), retrying on {backend.url}")
+    return backend
+
+
+def stream_generate(model, prompt, options=None, timeout=120, stats=None, system=None, context=None, keep_alive=None,
+                    affinity=None, backend_url=None, cancel=None):
+    """Yield response tokens from Ollama's /api/generate as they are produced.
+
+    The request goes to a backend chosen by the pool (backend_url pins one);
+    if it fails before the first token, it is retried on another backend.
+    affinity (a session id) keeps a conversation on the backend holding its
+    KV cache. If a stats dict is given it receives Ollama's token counts, the
+    new conversation context and the backend url when the stream ends.
+    cancel (a StreamCancel) lets another thread end the stream early.
+    """
+    payload = _generate_payload(model, prompt, options, system, context, keep_alive)
+    tried = []
+    error = None
+    while True:
+        backend = _next_backend(tried, affinity, backend_url, error)
+        tried.append(backend)
+        start = time.time()
+        first_token = None
+        outcome = None  # stays None if the caller stops reading: not the backend's fault
+        try:
+            with _session.post(f"{backend.url}/api/generate", json=payload, stream=True, timeout=timeout) as response:
+                if cancel is not None:
+                    cancel.attach(response)
+                response.raise_for_status()
+                # Ollama streams one JSON object per line (NDJSON)
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    token, done = _parse_line(line.decode('utf-8'), stats)
+                    if token:
+                        if first_token is None:
+                            first_token = time.time() - start
+                        yield token
+                    if done:
+                        break
+            outcome = True
+        except (requests.RequestException, OllamaError) as e:
+            # Rejected requests fail the same way on every backend: no retry and no failure charged
+            if _client_error(e):
+                raise
+            if cancel is not None and cancel.is_set():
+                return
+            outcome = False
+            # Tokens already sent cannot be taken back, so only a stream that never started is retried
+            if first_token is not None:
+                raise
+            error = e
+        finally:
+            pool.release(backend, outcome, first_token, time.time() - start)
+        if outcome:
+            if stats is not None:
+                stats["backend"] = backend.url
+            return
+
+
+def generate(model, prompt, options=None, timeout=120, **kwargs):
+    """Return the full Ollama response for a prompt"""
+    return "".join(stream_generate(model, prompt, options=options, timeout=timeout, **kwargs))
+
+
+def get_async_client():
+    """Pooled keep-alive client for the async serving path (httpx is only needed there)"""
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(120, connect=5),
+            limits=httpx.Limits(max_connections=OLLAMA_POOL_SIZE, max_keepalive_connections=OLLAMA_POOL_SIZE)
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def async_stream_generate(model, prompt, options=None, stats=None, system=None, context=None, keep_alive=None,
+                                affinity=None, backend_url=None):
+    """Async version of stream_generate"""
+    import httpx
+    payload = _generate_payload(model, prompt, options, system, context, keep_alive)
+    tried = []
+    error = None
+    while True:
+        backend = _next_backend(tried, affinity, backend_url, error)
+        tried.append(backend)
+        start = time.time()
+        first_token = None
+        outcome = None
+        try:
+            async with get_async_client().stream("POST", f"{backend.url}/api/generate", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    token, done = _parse_line(line, stats)
+                    if token:
+                        if first_token is None:
+                            first_token = time.time() - start
+                        yield token
+                    if done:
+                        break
+            outcome = True
+        except (httpx.HTTPError, OllamaError) as e:
+            if _client_error(e):
+                raise
+            outcome = False
+            if first_token is not None:
+                raise
+            error = e
+        finally:
+            pool.release(backend, outcome, first_token, time.time() - start)
+        if outcome:
+            if stats is not None:
+                stats["backend"] = backend.url
+            return
+
+
+def is_available(timeout=2):
+    """Check that at least one Ollama backend answers"""
+    return pool.check_all(timeout)
+
+
+class GenerationSlot:
+    """A held generation slot; release() is safe to call more than once"""
+
+    def __init__(self, release_fn):
+        self._release_fn = release_fn
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._release_fn()
+
+
+class GenerationLimiter:
+    """Caps concurrent generations on the backend, with a bounded wait queue.
+
+    Requests beyond max_queue, or waiting longer than timeout seconds, get
+    ServerBusy so the caller can answer 503 instead of piling up.
+    """
+
+    def __init__(self, max_concurrency, max_queue, timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+
+    def acquire(self):
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise ServerBusy("Too many requests are waiting for the language model")
+            self.waiting += 1
+        try:
+            acquired = self._semaphore.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            if not acquired:
+                self.rejected += 1
+                raise ServerBusy("Timed out waiting for the language model")
+            self.in_flight += 1
+        return GenerationSlot(self._release)
+
+    def try_acquire(self):
+        """A slot if one is free right now, else None (for optional work that must not queue)"""
+        if not self._semaphore.acquire(blocking=False):
+            return None
+        with self._lock:
+            self.in_flight += 1
+        return GenerationSlot(self._release)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rejected": self.rejected
+            }
+
+
+class AsyncGenerationLimiter(GenerationLimiter):
+    """GenerationLimiter for coroutines running on one event loop"""
+
+    def __init__(self, max_concurrency, max_queue, timeout):
+        super().__init__(max_concurrency, max_queue, timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ServerBusy("Too many requests are waiting for the language model")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServerBusy("Timed out waiting for the language model")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return GenerationSlot(self._release)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
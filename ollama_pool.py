@@ -0,0 +1,173 @@
+"""Pool of Ollama generation backends.
+
+Each request goes to the least loaded healthy backend (in-flight generations
+relative to its weight); max_concurrency is a hard cap per backend. A
+background thread polls /api/tags on every backend; a backend that fails
+several requests in a row has its circuit opened and gets no traffic for a
+cooldown period; after that it is tried again and one more failure reopens it.
+When no backend is up with room the request is refused, so the caller can
+answer 503 at once. A session's follow-ups stay on the backend that holds
+its KV cache while it has room.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+import requests
+from metrics import BACKEND_REQUESTS, BACKEND_SECONDS, BACKEND_FIRST_TOKEN_SECONDS
+
+AFFINITY_MAX = 4096  # Sessions remembered for backend affinity (LRU)
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 4)
+
+
+class OllamaBackend:
+    """One Ollama server with its load, health and circuit state"""
+
+    def __init__(self, url, weight=1, max_concurrency=2):
+        self.url = url.rstrip("/")
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.open_until = 0.0  # circuit open (no traffic) until this time
+        self.first_tokens = deque(maxlen=200)
+        self.durations = deque(maxlen=200)
+
+    def available(self, now):
+        return self.healthy and now >= self.open_until
+
+    def load(self):
+        """Load after taking one more request; ties go to the backend with fewer requests for its weight"""
+        return (self.in_flight + 1) / self.weight, self.requests / self.weight
+
+    def stats(self, now):
+        if now < self.open_until:
+            state = "open"
+        else:
+            state = "up" if self.healthy else "down"
+        return {
+            "url": self.url,
+            "state": state,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "first_token_p50": _percentile(self.first_tokens, 50),
+            "first_token_p95": _percentile(self.first_tokens, 95),
+            "duration_p50": _percentile(self.durations, 50),
+            "duration_p95": _percentile(self.durations, 95)
+        }
+
+
+class BackendPool:
+    """Least-loaded routing, health checks and circuit breaking over several Ollama backends"""
+
+    def __init__(self, backends, failure_threshold=3, cooldown=30, health_interval=10, session=None):
+        self.backends = [OllamaBackend(**backend) for backend in backends]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.session = session or requests.Session()
+        self._affinity = OrderedDict()  # session id -> backend url
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def __len__(self):
+        return len(self.backends)
+
+    def acquire(self, exclude=(), affinity=None, url=None):
+        """Pick a backend (or take the one at url) and count the request on it.
+
+        None when every candidate was tried, is down, has its circuit open or is full.
+        """
+        self._start_health_checks()
+        now = time.time()
+        with self._lock:
+            candidates = [backend for backend in self.backends
+                          if backend not in exclude and (url is None or backend.url == url.rstrip("/"))]
+            available = [backend for backend in candidates
+                         if backend.available(now) and backend.in_flight < backend.max_concurrency]
+            if not available:
+                return None
+            preferred = self._affinity.get(affinity) if affinity else None
+            backend = next((b for b in available if b.url == preferred), None)
+            if backend is None:
+                backend = min(available, key=OllamaBackend.load)
+            if affinity:
+                self._affinity[affinity] = backend.url
+                self._affinity.move_to_end(affinity)
+                while len(self._affinity) > AFFINITY_MAX:
+                    self._affinity.popitem(last=False)
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend, ok, first_token=None, duration=None):
+        """End a request: ok=True success, False backend failure, None not the backend's fault
+        (abandoned by the caller, or rejected with a 4xx)"""
+        now = time.time()
+        with self._lock:
+            backend.in_flight -= 1
+            if ok:
+                backend.consecutive_failures = 0
+                backend.open_until = 0.0
+                if first_token is not None:
+                    backend.first_tokens.append(first_token)
+                if duration is not None:
+                    backend.durations.append(duration)
+            elif ok is False:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold and now >= backend.open_until:
+                    backend.open_until = now + self.cooldown
+                    logging.warning(f"Ollama backend {backend.url} failed {backend.consecutive_failures} times "
+                                    f"in a row, no traffic for {self.cooldown}s")
+        BACKEND_REQUESTS.inc(backend=backend.url, result={True: "ok", False: "failed", None: "abandoned"}[ok])
+        if ok:
+            if first_token is not None:
+                BACKEND_FIRST_TOKEN_SECONDS.observe(first_token, backend=backend.url)
+            if duration is not None:
+                BACKEND_SECONDS.observe(duration, backend=backend.url)
+
+    def check(self, backend, timeout=2):
+        """Poll one backend's /api/tags and record whether it answered"""
+        try:
+            ok = self.session.get(f"{backend.url}/api/tags", timeout=timeout).ok
+        except requests.RequestException:
+            ok = False
+        if ok != backend.healthy:
+            logging.warning(f"Ollama backend {backend.url} is {'up' if ok else 'down'}")
+        backend.healthy = ok
+        return ok
+
+    def check_all(self, timeout=2):
+        """Poll every backend now; True if at least one answers"""
+        return any([self.check(backend, timeout) for backend in self.backends])
+
+    def _start_health_checks(self):
+        if self._health_thread is not None or not self.health_interval:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check_all()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return [backend.stats(now) for backend in self.backends]
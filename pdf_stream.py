@@ -0,0 +1,115 @@
+"""Streaming, page-parallel PDF parsing.
+
+A PDF is split into page ranges that a process pool extracts and chunks. Only
+a few ranges per worker are in flight and chunks are yielded in page order,
+so memory stays bounded by workers x pages_per_task pages, however large
+the PDF is.
+"""
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_readers = {}  # per-process PdfReader cache, so each worker parses the xref once
+
+
+def file_hash(path, block_size=1 << 20):
+    """sha256 of a file's bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _reader(path):
+    from pypdf import PdfReader
+    key = (path, os.path.getmtime(path))
+    if key not in _readers:
+        _readers.clear()
+        _readers[key] = PdfReader(path)
+    return _readers[key]
+
+
+def page_count(path):
+    """Number of pages in a PDF"""
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path, start, stop):
+    """Extract and chunk pages [start, stop) of a PDF (runs in a worker process)"""
+    from langchain_core.documents import Document
+    from text_split import make_text_splitter
+
+    reader = _reader(path)
+    total = len(reader.pages)
+    pages = []
+    for index in range(start, min(stop, total)):
+        text = reader.pages[index].extract_text() or ""
+        if text.strip():
+            pages.append(Document(page_content=text, metadata={"source": path, "page": index, "total_pages": total}))
+    return make_text_splitter().split_documents(pages), min(stop, total) - start
+
+
+def iter_pdf_chunks(path, workers=None, pages_per_task=8, progress=None):
+    """Yield the chunks of a PDF in page order while later pages are still being parsed.
+
+    progress(pages_done, total_pages) is called after every page range.
+    """
+    total = page_count(path)
+    ranges = [(start, start + pages_per_task) for start in range(0, total, pages_per_task)]
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    done = 0
+
+    if workers <= 1:
+        # Small PDF: a process pool would cost more than it saves
+        for start, stop in ranges:
+            chunks, pages = extract_page_range(path, start, stop)
+            done += pages
+            if progress:
+                progress(done, total)
+            yield from chunks
+        _readers.clear()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(ranges)
+        while True:
+            # A couple of ranges per worker in flight; results are taken in submission order
+            while len(pending) < workers * 2:
+                next_range = next(remaining, None)
+                if next_range is None:
+                    break
+                pending.append(pool.submit(extract_page_range, path, *next_range))
+            if not pending:
+                break
+            chunks, pages = pending.popleft().result()
+            done += pages
+            if progress:
+                progress(done, total)
+            yield from chunks
+
+
+class PageProgress:
+    """Prints pages/sec at most once per interval while a PDF is ingested"""
+
+    def __init__(self, name, interval=1.0):
+        self.name = name
+        self.interval = interval
+        self.start = time.time()
+        self.last = 0.0
+        self.pages = 0
+
+    def __call__(self, done, total):
+        self.pages = done
+        now = time.time()
+        if now - self.last >= self.interval or done == total:
+            self.last = now
+            print(f"{self.name}: {done}/{total} pages ({self.rate():.1f} pages/sec)")
+
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.pages / elapsed if elapsed else 0.0
@@ -0,0 +1,110 @@
+"""Query embedding service: LRU cache plus micro-batching.
+
+Wraps the HuggingFaceEmbeddings used for retrieval. Repeated questions are
+answered from an LRU cache keyed by the normalised text. Cache misses from
+concurrent requests are queued, and a single thread encodes whatever arrives
+within max_wait seconds (up to max_batch texts) in one forward pass instead of
+one batch-of-one pass per request.
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+from langchain_core.embeddings import Embeddings
+from metrics import EMBED_BATCH_SIZE, EMBED_BATCH_SECONDS, EMBED_QUERY_SECONDS, EMBED_CACHE
+
+
+def normalize_query(text):
+    """Cache key: collapsed whitespace, lowercase (the MiniLM models are uncased)"""
+    return " ".join(text.split()).lower()
+
+
+class QueryEmbeddings(Embeddings):
+    """Embeddings wrapper that caches and batches embed_query calls.
+
+    embed_documents goes straight to the wrapped model (ingestion already
+    batches), so the same object can be handed to the vector store.
+    """
+
+    def __init__(self, base, cache_size=2048, max_batch=32, max_wait=0.005):
+        self.base = base
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._cache = OrderedDict()  # key -> vector, least recently used first
+        self._pending = {}  # key -> Future, so identical in-flight queries share one encode
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        start = time.time()
+        key = normalize_query(text)
+        result = "hit"
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            else:
+                result = "coalesced"  # same text already being encoded
+                future = self._pending.get(key)
+                if future is None:
+                    result = "miss"
+                    future = self._pending[key] = Future()
+                    self._start_worker()
+                    self._queue.put(key)
+        EMBED_CACHE.inc(result=result)
+        if vector is None:
+            vector = future.result()
+        EMBED_QUERY_SECONDS.observe(time.time() - start)
+        return list(vector)
+
+    def _start_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="query-embeddings", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self):
+        """Block for one query, then take whatever else arrives within max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.time()
+            try:
+                vectors = self.base.embed_documents(batch)
+            except Exception as e:
+                with self._lock:
+                    futures = [self._pending.pop(key) for key in batch]
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            EMBED_BATCH_SIZE.observe(len(batch))
+            EMBED_BATCH_SECONDS.observe(time.time() - start)
+            with self._lock:
+                futures = [self._pending.pop(key) for key in batch]
+                for key, vector in zip(batch, vectors):
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._cache), "pending": len(self._pending)}
@@ -0,0 +1,124 @@
+"""Retrieval queries for follow-up questions without a serial condense round-trip.
+
+ConversationalRetrievalChain rewrites every follow-up with a full LLM call
+before it retrieves, so a second turn costs two generations back to back.
+Here a follow-up is first checked for being self-contained (then it is used
+as is); otherwise it is expanded with the salient words of the previous
+questions, which needs no LLM, and optionally the LLM rewrite runs in the
+background while the expanded query is already being searched.
+"""
+import threading
+import time
+from chunk_store import extract_codes
+from ollama_client import StreamCancel, stream_generate
+from router import normalize, PRODUCT_KEYWORDS
+
+# First words that continue the previous question ("and in walnut?", "e quanto costa?")
+CONTINUATION_WORDS = {
+    'and', 'also', 'but', 'so', 'then', 'e', 'ed', 'anche', 'ma', 'quindi', 'allora',
+    'et', 'aussi', 'mais', 'alors', 'y', 'tambien', 'pero', 'entonces'
+}
+# Words pointing back to something said before
+REFERRING_WORDS = {
+    'it', 'its', 'they', 'them', 'their', 'that', 'those', 'these', 'this', 'one', 'ones', 'same', 'else',
+    'esso', 'essa', 'quello', 'quella', 'quelli', 'quelle', 'questo', 'questa', 'questi', 'queste',
+    'stesso', 'stessa', 'stessi', 'stesse', 'ne', 'altro', 'altra', 'altri', 'altre',
+    'cela', 'ca', 'celui', 'celle', 'ceux', 'celles', 'meme', 'memes', 'autre', 'autres',
+    'ese', 'esa', 'esos', 'esas', 'este', 'esta', 'estos', 'estas', 'ello', 'mismo', 'misma', 'otro', 'otra'
+}
+MIN_SELF_CONTAINED_WORDS = 3
+# Words carried over from earlier questions must say something about the topic
+EXPANSION_STOPWORDS = set(PRODUCT_KEYWORDS) | {
+    'about', 'there', 'where', 'does', 'your', 'with', 'from', 'would', 'could', 'like', 'want', 'need',
+    'avete', 'sono', 'della', 'delle', 'dello', 'degli', 'nella', 'nelle', 'dove', 'come', 'quanto', 'quando',
+    'vorrei', 'vostri', 'vostre', 'vous', 'avez', 'quels', 'quelles', 'pour', 'dans', 'tienen', 'cuales',
+    'para', 'donde', 'cuanto', 'tiene', 'puedo', 'posso'
+}
+
+
+def is_self_contained(question):
+    """Cheap check that a follow-up can be searched without the conversation"""
+    words = normalize(question).split()
+    if len(words) < MIN_SELF_CONTAINED_WORDS or words[0] in CONTINUATION_WORDS:
+        return False
+    return not REFERRING_WORDS & set(words)
+
+
+def expand_query(question, history, max_terms=8, turns=2):
+    """The question followed by product codes and topic words of the previous questions (newest first).
+
+    Codes are only carried over when the question names none ("e la SR-102?" is about another product).
+    """
+    present = set(normalize(question).split())
+    has_codes = bool(extract_codes(question, query=True))
+    terms = []
+    for previous, _ in reversed(history[-turns:]):
+        for code in [] if has_codes else extract_codes(previous, query=True):
+            if code not in terms:
+                terms.append(code)
+        for word in normalize(previous).split():
+            if len(word) > 3 and word not in EXPANSION_STOPWORDS and word not in present and word not in terms:
+                terms.append(word)
+    return " ".join([question] + terms[:max_terms])
+
+
+def merge_documents(rankings, k):
+    """Fuse ranked document lists by reciprocal rank, keeping the top k distinct chunks"""
+    from hybrid_retriever import reciprocal_rank_fusion
+
+    docs = {}
+    ids = []
+    for ranking in rankings:
+        keys = []
+        for doc in ranking:
+            key = (doc.metadata.get("source"), doc.page_content)
+            docs.setdefault(key, doc)
+            keys.append(key)
+        ids.append(keys)
+    return [docs[key] for key in reciprocal_rank_fusion(ids)[:k]]
+
+
+class BackgroundRewrite:
+    """LLM question rewrite running in its own thread.
+
+    result(timeout) returns the rewritten question, or None if it is not ready
+    within timeout seconds of being started; the generation is then cancelled
+    at once, without waiting for its next token, so Ollama stops producing
+    tokens nobody will read and the backend slot is freed.
+    The thread owns slot (a GenerationSlot, optional) and releases it when the
+    stream ends; timeout bounds each read from Ollama.
+    """
+
+    def __init__(self, model, prompt, options=None, keep_alive=None, affinity=None, timeout=120, slot=None):
+        self._tokens = []
+        self._done = threading.Event()
+        self._cancel = StreamCancel()
+        self.error = None
+        self.started = time.time()
+        self._thread = threading.Thread(
+            target=self._run, args=(model, prompt, options, keep_alive, affinity, timeout, slot),
+            name="condense", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, model, prompt, options, keep_alive, affinity, timeout, slot):
+        stream = stream_generate(model, prompt, options=options, timeout=timeout, keep_alive=keep_alive,
+                                 affinity=affinity, cancel=self._cancel)
+        try:
+            for token in stream:
+                if self._cancel.is_set():
+                    return
+                self._tokens.append(token)
+        except Exception as e:
+            self.error = e
+        finally:
+            stream.close()
+            if slot is not None:
+                slot.release()
+            self._done.set()
+
+    def result(self, timeout):
+        if not self._done.wait(max(0.0, self.started + timeout - time.time())) or self.error is not None:
+            self._cancel.cancel()
+            return None
+        return "".join(self._tokens).strip() or None
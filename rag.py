@@ -1,35 +1,120 @@
 import os
-import requests
+import json
+import hashlib
+import logging
+import time
 from bs4 import BeautifulSoup
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
 from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain_community.llms import Ollama
+from ollama_client import stream_generate
+from config import (
+    VECTOR_STORE_PATH, INDEX_FACTORY, INDEX_KEEP_VERSIONS, INGEST_BATCH_SIZE, PDF_WORKERS, PDF_PAGES_PER_TASK, WEB_CACHE_PATH, CRAWL_WORKERS, CRAWL_MAX_PAGES, CRAWL_TIMEOUT, OLLAMA_URL, OLLAMA_NUM_CTX, OLLAMA_KEEP_ALIVE, SEARCH_K, SEARCH_FETCH_K, HYBRID_SEARCH,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD
+)
+from hybrid_retriever import make_retriever
+from context_budget import pack_context
+from crawler import WebCrawler
+from embedding_backends import make_embeddings
+from pdf_stream import file_hash, iter_pdf_chunks, PageProgress
+from text_split import make_text_splitter, source_hash
+from helpers import SYSTEM_PROMPT, build_rag_prompt
+from vector_index import (
+    save_ann_index, create_vector_store, load_writable_store, save_vector_store, open_vector_store,
+    LEGACY_DOCSTORE_FILE
+)
+from index_versions import current_version_path, stage_version, publish_version, discard_version, FLAT_INDEX_FILE, DOCSTORE_FILE
+from catalog import ProductCatalog
+
+MANIFEST_FILE = "manifest.json"
+
+
+def chunk_hash(source, content):
+    """Content hash of one chunk, also used as its docstore id"""
+    return hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()
+
 
 class FurnitureRAG:
     
-    def __init__(self, model_name="llama3.2:latest"):
+    def __init__(self, model_name="llama3.2:latest", vector_store_path=VECTOR_STORE_PATH, embedding_threads=None):
         self.model_name = model_name
+        self.vector_store_path = vector_store_path
+        self.work_path = None  # staged index version being modified, see prepare_ingestion
+        self.migrated = False  # the staged copy was converted from the pickled format and must be published
+        self.manifest = None  # manifest of the staged version, kept in memory until it is published
+        self.pending_changes = False  # add_pdf(publish=False) changed the staged version
         self.documents = []
         self.vector_store = None
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        self.llm = Ollama(model=model_name)
+        self.embeddings = make_embeddings(threads=embedding_threads)
+        self.llm = Ollama(model=model_name, base_url=OLLAMA_URL, num_ctx=OLLAMA_NUM_CTX, keep_alive=OLLAMA_KEEP_ALIVE)
         
         # Create data directory if it doesn't exist
         os.makedirs("data", exist_ok=True)
         os.makedirs("data/pdfs", exist_ok=True)
-        os.makedirs("data/vector_store", exist_ok=True)
+        os.makedirs(self.vector_store_path, exist_ok=True)
         
-    def add_pdf(self, pdf_path):
-        """Add a PDF document to the knowledge base"""
-        loader = PyPDFLoader(pdf_path)
-        self.documents.extend(loader.load())
-        print(f"Added PDF: {pdf_path}")
+    def add_pdf(self, pdf_path, batch_size=INGEST_BATCH_SIZE, workers=PDF_WORKERS, publish=True):
+        """Add a PDF document to the knowledge base.
+
+        The PDF is streamed straight into the index: page ranges are parsed in
+        parallel, and chunks are embedded and added in batches as they arrive, so
+        the whole document is never held in memory. An unchanged file is not
+        parsed at all. With publish=False the changes stay in the staged version
+        so several files can be added before one publish_changes().
+        """
+        start = time.time()
+        digest = file_hash(pdf_path)
+        manifest = self.manifest if self.work_path is not None else self._load_manifest()
+        if self.is_unchanged(manifest, pdf_path, digest):
+            print(f"PDF unchanged: {pdf_path}")
+            return self
+        manifest = self.prepare_ingestion()
+
+        entry = manifest["sources"].get(pdf_path)
+        known = entry["chunks"] if entry else {}
+        current = {}
+        batch, batch_ids = [], []
+        added = 0
+        progress = PageProgress(pdf_path)
+        for chunk in iter_pdf_chunks(pdf_path, workers=workers, pages_per_task=PDF_PAGES_PER_TASK, progress=progress):
+            digest_chunk = chunk_hash(pdf_path, chunk.page_content)
+            if digest_chunk in current:
+                continue
+            current[digest_chunk] = known.get(digest_chunk, digest_chunk)
+            if digest_chunk in known:
+                continue
+            batch.append(chunk)
+            batch_ids.append(digest_chunk)
+            if len(batch) >= batch_size:
+                self.add_chunks(batch, batch_ids)
+                added += len(batch)
+                batch, batch_ids = [], []
+        if batch:
+            self.add_chunks(batch, batch_ids)
+            added += len(batch)
+
+        stale_ids = [chunk_id for digest_chunk, chunk_id in known.items() if digest_chunk not in current]
+        if stale_ids and self.vector_store is not None:
+            self.vector_store.delete(stale_ids)
+        manifest["sources"][pdf_path] = {"hash": digest, "chunks": current}
+        self.pending_changes = self.pending_changes or bool(added or stale_ids)
+        if publish:
+            self.publish_changes()
+        print(f"Added PDF: {pdf_path} - {progress.pages} pages in {time.time() - start:.2f}s "
+              f"({progress.rate():.1f} pages/sec), {added} chunks embedded, {len(stale_ids)} removed")
         return self
     
+    def publish_changes(self):
+        """Publish the staged version if anything in it changed, otherwise drop it"""
+        if self.work_path is None:
+            return self
+        if (self.pending_changes or self.migrated) and self.vector_store is not None:
+            self.save(self.manifest)
+        else:
+            print("Vector store already up to date")
+            self.discard_changes()
+        return self
+
     def add_text(self, text_path):
         """Add a text document to the knowledge base"""
         loader = TextLoader(text_path, encoding="utf-8")  # Explicit encoding!
@@ -38,108 +123,263 @@ class FurnitureRAG:
         return self
 
     
-    def add_website(self, url):
-        """Add content from a website to the knowledge base"""
-        loader = WebBaseLoader(url)
-        self.documents.extend(loader.load())
-        print(f"Added website: {url}")
+    def add_website(self, url, max_depth=0):
+        """Add content from a website (page or sitemap, optionally following links) to the knowledge base"""
+        return self.crawl_website([url], max_depth=max_depth)
+
+    def crawl_website(self, seeds, max_depth=1):
+        """Crawl seed pages or sitemaps concurrently and add every page with text.
+
+        Pages are revalidated against the HTTP cache, so unchanged ones are not
+        downloaded again, and process_documents skips re-embedding them.
+        """
+        start = time.time()
+        crawler = WebCrawler(WEB_CACHE_PATH, workers=CRAWL_WORKERS, max_pages=CRAWL_MAX_PAGES, timeout=CRAWL_TIMEOUT)
+        documents = crawler.crawl(seeds, max_depth=max_depth)
+        self.documents.extend(documents)
+        stats = crawler.stats
+        print(f"Added website: {len(documents)} pages from {', '.join(seeds)} in {time.time() - start:.2f}s "
+              f"({stats['fetched']} downloaded, {stats['not_modified']} unchanged, {stats['failed']} failed)")
         return self
     
     def process_documents(self):
-        """Process documents into chunks and create vector store"""
-        if not self.documents:
+        """Process documents into chunks and merge them into the vector store.
+
+        Only chunks whose content hash is not in the manifest get embedded; chunks
+        of changed or deleted sources are removed from the index.
+        """
+        if not self.documents and not self._missing_file_sources():
             print("No documents to process")
             return self
+
+        manifest = self.prepare_ingestion()
+        stale_ids = self.prune_missing_sources(manifest)
+
         # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(self.documents)
-        print(f"Storing {len(chunks)} documents in the vector store...")
-        print(f"Split into {len(chunks)} chunks")
-        
-        # Create vector store
-        self.vector_store = FAISS.from_documents(chunks, self.embeddings)
-        
-        # Save the vector store
-        self.vector_store.save_local("data/vector_store")
-        print("Vector store created and saved")
+        text_splitter = make_text_splitter()
+
+        # Group pages by the file or URL they came from
+        by_source = {}
+        for doc in self.documents:
+            by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+
+        new_chunks, new_ids = [], []
+        unchanged = 0
+        for source, docs in by_source.items():
+            digest = source_hash(docs)
+            if self.is_unchanged(manifest, source, digest):
+                unchanged += 1
+                continue
+            chunks, ids, stale = self.diff_source(manifest, source, digest, text_splitter.split_documents(docs))
+            new_chunks.extend(chunks)
+            new_ids.extend(ids)
+            stale_ids.extend(stale)
+
+        print(f"Sources: {len(by_source) - unchanged} new/changed, {unchanged} unchanged")
+        self.apply_changes(manifest, new_chunks, new_ids, stale_ids)
+        self.documents = []
+        return self
+
+    def prepare_ingestion(self):
+        """Stage a copy of the current index and load it with its manifest before merging new chunks.
+
+        Changes go to the staged version only; save() publishes it atomically,
+        so a running server never reads a half-written index.
+        """
+        if self.work_path is None:
+            self.work_path = stage_version(self.vector_store_path)
+            self.vector_store = None
+            self.migrated = os.path.exists(os.path.join(self.work_path, LEGACY_DOCSTORE_FILE))
+            if os.path.exists(os.path.join(self.work_path, FLAT_INDEX_FILE)):
+                self.vector_store = load_writable_store(self.work_path, self.embeddings)
+                print("Vector store loaded")
+            self.manifest = self._load_manifest()
+        return self.manifest
+
+    def prune_missing_sources(self, manifest):
+        """Drop files that were ingested before but no longer exist on disk.
+
+        Returns the ids of their chunks so they can be deleted from the index.
+        """
+        stale_ids = []
+        removed_sources = self._missing_file_sources(manifest)
+        for source in removed_sources:
+            stale_ids.extend(manifest["sources"].pop(source)["chunks"].values())
+        if removed_sources:
+            print(f"Removed sources no longer on disk: {len(removed_sources)}")
+        return stale_ids
+
+    @staticmethod
+    def is_unchanged(manifest, source, digest):
+        """True if the source was ingested before with exactly this content"""
+        entry = manifest["sources"].get(source)
+        return bool(entry) and entry["hash"] == digest
+
+    def diff_source(self, manifest, source, digest, chunks):
+        """Compare a source's chunks with the manifest and record the new state.
+
+        Returns the chunks that need embedding, their ids, and the ids of chunks
+        that are no longer part of the source.
+        """
+        entry = manifest["sources"].get(source)
+        known = entry["chunks"] if entry else {}
+        current = {}
+        new_chunks, new_ids = [], []
+        for chunk in chunks:
+            digest_chunk = chunk_hash(source, chunk.page_content)
+            if digest_chunk in current:
+                continue
+            current[digest_chunk] = known.get(digest_chunk, digest_chunk)
+            if digest_chunk not in known:
+                new_chunks.append(chunk)
+                new_ids.append(digest_chunk)
+        stale_ids = [chunk_id for digest_chunk, chunk_id in known.items() if digest_chunk not in current]
+        manifest["sources"][source] = {"hash": digest, "chunks": current}
+        return new_chunks, new_ids, stale_ids
+
+    def apply_changes(self, manifest, new_chunks, new_ids, stale_ids, added=0):
+        """Delete stale chunks, add new ones and save the index with its manifest.
+
+        added counts chunks already put in the staged index with add_chunks
+        (bulk ingestion adds each batch as soon as it is embedded).
+        """
+        print(f"Chunks: {added + len(new_chunks)} to add, {len(stale_ids)} to remove")
+        if not added and not new_chunks and not stale_ids and not self.migrated and not self.pending_changes:
+            print("Vector store already up to date")
+            self.discard_changes()
+            return self
+
+        if stale_ids and self.vector_store is not None:
+            self.vector_store.delete(stale_ids)
+        if new_chunks:
+            self.add_chunks(new_chunks, new_ids)
+        self.save(manifest)
         return self
+
+    def add_chunks(self, chunks, ids, vectors=None):
+        """Embed chunks (unless vectors are given) and add them to the in-memory index"""
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+        if vectors is None:
+            vectors = self.embeddings.embed_documents(texts)
+        if self.vector_store is None:
+            self.vector_store = create_vector_store(self.work_path, self.embeddings, len(vectors[0]))
+        self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+    def save(self, manifest):
+        """Save the vector store, its search index and the manifest, then publish the new version"""
+        save_vector_store(self.vector_store, self.work_path)
+        save_ann_index(self.vector_store, self.work_path, INDEX_FACTORY)
+        self._save_manifest(manifest)
+        catalog = ProductCatalog(os.path.join(self.work_path, DOCSTORE_FILE))
+        products = catalog.sync(manifest)
+        catalog.close()
+        if products:
+            print(f"Product catalogue: {products} products extracted")
+        chunks = self.vector_store.index.ntotal
+        self.vector_store.docstore.close()
+        version = publish_version(self.vector_store_path, self.work_path, keep=INDEX_KEEP_VERSIONS)
+        self.work_path, self.manifest, self.pending_changes = None, None, False
+        print(f"Vector store updated and saved ({chunks} chunks, version {version})")
+        self.load_vector_store()
+
+    def discard_changes(self):
+        """Drop the staged version when there was nothing to save"""
+        if self.work_path is not None:
+            if self.vector_store is not None:
+                self.vector_store.docstore.close()
+            discard_version(self.work_path)
+            self.work_path, self.manifest, self.pending_changes = None, None, False
+            self.load_vector_store()
+
+    def remove_source(self, source):
+        """Remove every chunk of a file or URL from the vector store"""
+        if source not in self._load_manifest()["sources"]:
+            print(f"Source not in vector store: {source}")
+            return self
+        manifest = self.prepare_ingestion()
+        entry = manifest["sources"].pop(source)
+        if entry["chunks"]:
+            self.vector_store.delete(list(entry["chunks"].values()))
+        self.save(manifest)
+        print(f"Removed {len(entry['chunks'])} chunks of {source}")
+        return self
+
+    def _missing_file_sources(self, manifest=None):
+        """Sources in the manifest that were files and have since been deleted"""
+        manifest = manifest or self._load_manifest()
+        return [
+            source for source in manifest["sources"]
+            if source and "://" not in source and not os.path.exists(source)
+        ]
+
+    def _manifest_path(self):
+        """Manifest of the staged version during ingestion, otherwise of the published one"""
+        return os.path.join(self.work_path or current_version_path(self.vector_store_path), MANIFEST_FILE)
+
+    def _load_manifest(self):
+        """Read the ingestion manifest, rebuilding it from the docstore if missing"""
+        manifest_path = self._manifest_path()
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+
+        manifest = {"sources": {}}
+        if self.vector_store is not None:
+            # Index built before manifests existed: recover chunk ids from the docstore
+            # so that re-adding the same files does not duplicate them
+            for chunk_id in self.vector_store.index_to_docstore_id.values():
+                doc = self.vector_store.docstore.search(chunk_id)
+                source = doc.metadata.get("source", "")
+                entry = manifest["sources"].setdefault(source, {"hash": None, "chunks": {}})
+                entry["chunks"][chunk_hash(source, doc.page_content)] = chunk_id
+        return manifest
+
+    def _save_manifest(self, manifest):
+        manifest_path = self._manifest_path()
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
     
     def load_vector_store(self):
-        """Load an existing vector store"""
-        if os.path.exists("data/vector_store"):
-            self.vector_store = FAISS.load_local("data/vector_store", self.embeddings)
-            print("Vector store loaded")
+        """Load the published vector store for querying"""
+        if self.vector_store is not None:
+            self.vector_store.docstore.close_all()
+        if os.path.exists(os.path.join(current_version_path(self.vector_store_path), FLAT_INDEX_FILE)):
+            self.vector_store = open_vector_store(self.vector_store_path, self.embeddings)
         else:
+            self.vector_store = None
             print("No vector store found")
         return self
     
     def query(self, question, use_retrieval=True):
         """Query the system with or without retrieval"""
+        return "".join(self.query_stream(question, use_retrieval=use_retrieval))
+
+    def query_stream(self, question, use_retrieval=True):
+        """Query the system and yield the answer token by token"""
         if use_retrieval and self.vector_store:
-            # Create a retrieval chain
-            retriever = self.vector_store.as_retriever(
-                search_kwargs={"k": 3}  # Return top 3 relevant chunks
-            )
+            # Vector search fused with keyword and product code matches
+            retriever = make_retriever(self.vector_store, SEARCH_K, SEARCH_FETCH_K, hybrid=HYBRID_SEARCH)
             
             # Get relevant documents
             docs = retriever.invoke(question)
 
             
-            # Create context from retrieved documents
-            context = "\n\n".join([doc.page_content for doc in docs])
-            
-            # Create prompt with context
-            prompt = f"""You are a helpful assistant for a furniture company.
-            Use the following information to answer the question.
-            
-            Context:
-            {context}
-            
-            Question: {question}
+            # Create context from retrieved documents (overlap and duplicates removed, within budget)
+            docs, context, stats = pack_context(docs, CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD)
+            logging.debug(f"Context: {stats['context_tokens']} tokens, {stats['context_tokens_saved']} saved")
             
-            Answer:"""
-            
-            # Query Ollama directly
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": self.model_name,
-                    "prompt": prompt
-                }
-            )
-            
-            # Process streaming response
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    line_json = line.decode('utf-8')
-                    import json
-                    result = json.loads(line_json)
-                    if 'response' in result:
-                        full_response += result['response']
-            
-            return full_response
+            # Same prompt layout as the server: fixed system prompt, then context and question
+            prompt = build_rag_prompt(context, question)
         else:
             # Direct query without retrieval
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": self.model_name,
-                    "prompt": f"Question: {question}\nAnswer:"
-                }
-            )
-            
-            # Process streaming response
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    line_json = line.decode('utf-8')
-                    import json
-                    result = json.loads(line_json)
-                    if 'response' in result:
-                        full_response += result['response']
-            
-            return full_response
+            prompt = f"Question: {question}\nAnswer:"
+
+        # Query Ollama directly and pass tokens through as they arrive; keep_alive keeps
+        # the model loaded between admin queries
+        yield from stream_generate(
+            self.model_name, prompt,
+            options={"num_ctx": OLLAMA_NUM_CTX}, system=SYSTEM_PROMPT, keep_alive=OLLAMA_KEEP_ALIVE
+        )
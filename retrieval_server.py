@@ -0,0 +1,227 @@
+"""Retrieval sidecar: one process owns the embeddings model and the vector store.
+
+    python retrieval_server.py --port 5100
+    RETRIEVAL_SERVER_URL=http://127.0.0.1:5100 gunicorn -w 4 app:app
+
+Web workers pointed at it (RETRIEVAL_SERVER_URL) use RemoteRetriever and
+RemoteEmbeddings instead of loading torch, the model and the FAISS index
+themselves, so memory no longer grows with the number of workers and they
+boot in a fraction of the time. Query embeddings from every worker go
+through the server's QueryEmbeddings, so they are cached and batched
+together.
+
+    POST /search  {"queries": [...], "k": 3} -> {"results": [[{"page_content", "metadata"}, ...], ...]}
+    POST /embed   {"texts": [...]}            -> {"vectors": [[...], ...]}
+    POST /reload                               -> {"index_version": ...}  (X-Admin-Token: ADMIN_TOKEN)
+    GET  /healthz
+
+Newly published index versions are picked up by polling (INDEX_WATCH_INTERVAL)
+or POST /reload, and swapped in without interrupting searches in flight.
+"""
+import argparse
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+import requests
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from config import (
+    VECTOR_STORE_PATH, INDEX_MMAP, SEARCH_K, SEARCH_NPROBE, SEARCH_EF,
+    HYBRID_SEARCH, SEARCH_FETCH_K, INDEX_WATCH_INTERVAL, QUERY_EMBED_CACHE_MAX, QUERY_EMBED_BATCH_MAX, QUERY_EMBED_BATCH_WAIT,
+    RETRIEVAL_SERVER_PORT, RETRIEVAL_SERVER_TIMEOUT, ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+)
+
+
+class RetrievalService:
+    """The embeddings model, vector store and retrievers for the whole deployment"""
+
+    def __init__(self):
+        from embedding_backends import make_embeddings
+        from query_embeddings import QueryEmbeddings
+
+        self.embeddings = QueryEmbeddings(
+            make_embeddings(),
+            cache_size=QUERY_EMBED_CACHE_MAX,
+            max_batch=QUERY_EMBED_BATCH_MAX,
+            max_wait=QUERY_EMBED_BATCH_WAIT
+        )
+        self._lock = threading.Lock()
+        self._handle = None
+        self.reload()
+        self.embeddings.embed_query("warmup")
+
+    def reload(self, version=None):
+        """Open the current index version and swap it in for the next searches.
+
+        The previous version's chunk store is closed once searches running on it are done.
+        """
+        from vector_index import open_vector_store
+        from index_versions import index_version, VersionHandle
+        start = time.time()
+        version = index_version(VECTOR_STORE_PATH)
+        vector_store = open_vector_store(
+            VECTOR_STORE_PATH, self.embeddings,
+            mmap=INDEX_MMAP, nprobe=SEARCH_NPROBE, ef_search=SEARCH_EF
+        )
+        with self._lock:
+            previous, self._handle = self._handle, VersionHandle(vector_store, vector_store.docstore.close_all)
+            self.vector_store = vector_store
+            self.version = version
+            self._retrievers = {}
+        if previous is not None:
+            previous.retire()
+        print(f"Retrieval index version {version} ready ({vector_store.index.ntotal} chunks, {time.time() - start:.2f}s)")
+        return version
+
+    def _acquire(self, k):
+        """(handle, retriever) on the current version; the handle must be released after searching"""
+        from hybrid_retriever import make_retriever
+        with self._lock:
+            # Swapped under this lock and retired only after, so the current handle is never retired here
+            handle = self._handle
+            handle.acquire()
+            if k not in self._retrievers:
+                self._retrievers[k] = make_retriever(handle.value, k, SEARCH_FETCH_K, hybrid=HYBRID_SEARCH)
+            return handle, self._retrievers[k]
+
+    def search(self, queries, k):
+        """Top-k documents for each query; the queries run concurrently so their embeddings share a batch"""
+        handle, retriever = self._acquire(k)
+        try:
+            if len(queries) == 1:
+                return [retriever.invoke(queries[0])]
+            return retriever.batch(queries)
+        finally:
+            handle.release()
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json({"status": "ok", "chunks": self.service.vector_store.index.ntotal,
+                             "index_version": self.service.version})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/search":
+                results = self.service.search(request["queries"], int(request.get("k") or SEARCH_K))
+                self._send_json({"results": [
+                    [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+                    for docs in results
+                ]})
+            elif self.path == "/embed":
+                texts = request["texts"]
+                # One text is a query (cached, batched across workers); several are documents
+                if len(texts) == 1:
+                    vectors = [self.service.embeddings.embed_query(texts[0])]
+                else:
+                    vectors = self.service.embeddings.embed_documents(texts)
+                self._send_json({"vectors": vectors})
+            elif self.path == "/reload":
+                token = self.headers.get(ADMIN_TOKEN_HEADER, "")
+                if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+                    self._send_json({"error": "Forbidden"}, status=403)
+                    return
+                self._send_json({"status": "reloaded", "index_version": self.service.reload()})
+            else:
+                self.send_error(404)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json({"error": f"Bad request: {str(e)}"}, status=400)
+        except Exception as e:
+            print(f"Retrieval error: {str(e)}")
+            self._send_json({"error": str(e)}, status=500)
+
+
+class RetrievalClient:
+    """HTTP client for the retrieval server, keeping connections open between calls"""
+
+    def __init__(self, url, timeout=RETRIEVAL_SERVER_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, path, payload, headers=None):
+        response = self.session.post(self.url + path, json=payload, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, queries, k):
+        results = self._post("/search", {"queries": queries, "k": k})["results"]
+        return [[Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in docs]
+                for docs in results]
+
+    def embed(self, texts):
+        return self._post("/embed", {"texts": texts})["vectors"]
+
+    def reload(self):
+        return self._post("/reload", {}, headers={ADMIN_TOKEN_HEADER: ADMIN_TOKEN or ""})
+
+
+class RemoteRetriever(BaseRetriever):
+    """Retriever backed by the retrieval server"""
+
+    client: Any
+    k: int = 3
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.client.search([query], self.k)[0]
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings computed by the retrieval server (used by the answer cache and warmup)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed([text])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve retrieval and query embeddings to the web workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=RETRIEVAL_SERVER_PORT)
+    args = parser.parse_args()
+
+    RetrievalHandler.service = RetrievalService()
+    if INDEX_WATCH_INTERVAL:
+        from index_versions import IndexWatcher
+        IndexWatcher(VECTOR_STORE_PATH, RetrievalHandler.service.reload, interval=INDEX_WATCH_INTERVAL).start()
+    server = ThreadingHTTPServer((args.host, args.port), RetrievalHandler)
+    server.daemon_threads = True
+    print(f"Retrieval server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
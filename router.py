@@ -0,0 +1,196 @@
+"""Single-pass query router.
+
+Each message is normalised once and matched against precompiled patterns.
+Its language comes from the language-specific words it contains; langdetect
+(cached) only decides when there are none or they tie, since it misreads short
+messages ("che porte avete?" -> fr). The patterns then decide whether a template can answer it: greetings,
+thanks, and contact/location/opening-hours questions. Everything else goes to
+RAG.
+"""
+import re
+import unicodedata
+from collections import Counter, namedtuple
+from functools import lru_cache
+from config import COMPANY_NAME, COMPANY_LOCATION, COMPANY_EMAIL, COMPANY_PHONE, COMPANY_HOURS
+from helpers import detect_language_among, get_gratitude_response, get_casual_greeting_response
+
+# intent: greeting, gratitude, contact, location, hours (or several joined by "+"),
+# product or general. answer is set when no retrieval/generation is needed.
+Route = namedtuple("Route", ["intent", "language", "answer"])
+
+# Keywords are written normalised: lowercase, no accents, no punctuation
+GREETINGS = {
+    'it': ['ciao', 'salve', 'buongiorno', 'buonasera', 'arrivederci', 'come stai'],
+    'en': ['hi', 'hello', 'hey', 'hey there', 'good morning', 'good afternoon', 'good evening',
+           'bye', 'goodbye', 'see you', 'take care', 'how are you'],
+    'fr': ['bonjour', 'bonsoir', 'salut', 'au revoir', 'ca va'],
+    'es': ['hola', 'buenos dias', 'buenas tardes', 'buenas noches', 'adios', 'que tal']
+}
+THANKS = {
+    'it': ['grazie', 'grazie mille'],
+    'en': ['thanks', 'thank you'],
+    'fr': ['merci', 'merci beaucoup'],
+    'es': ['gracias', 'muchas gracias']
+}
+SUPPORTED_LANGUAGES = set(GREETINGS)
+DEFAULT_LANGUAGE = 'it'  # the company's own language, for messages no supported language fits
+
+# Questions answered from the company details in config.py
+FAQ_KEYWORDS = {
+    "contact": {
+        'it': ['telefono', 'numero di telefono', 'cellulare', 'contatti', 'contatto', 'contattarvi', 'chiamarvi',
+               'indirizzo email', 'indirizzo e mail', 'indirizzo mail', 'posta elettronica'],
+        'en': ['phone', 'phone number', 'telephone', 'contact', 'contacts', 'call you', 'email', 'e mail', 'mail',
+               'email address', 'mail address'],
+        'fr': ['numero de telephone', 'contacter', 'courriel', 'adresse email', 'adresse e mail', 'adresse mail'],
+        'es': ['llamar', 'llamaros', 'contacto', 'contactar', 'correo', 'direccion de correo',
+               'direccion de email', 'correo electronico']
+    },
+    "location": {
+        'it': ['indirizzo', 'dove siete', 'dove vi trovate', 'dove si trova', 'come arrivare'],
+        'en': ['address', 'where are you', 'where is your', 'location', 'located', 'directions'],
+        'fr': ['adresse', 'ou etes vous', 'ou se trouve', 'ou vous trouver'],
+        'es': ['direccion', 'donde estan', 'donde se encuentra', 'donde queda', 'ubicacion', 'ubicados']
+    },
+    "hours": {
+        'it': ['orari', 'orario', 'aperti', 'apertura', 'chiusi', 'chiusura'],
+        'en': ['hours', 'opening hours', 'opening times', 'open', 'closed'],
+        'fr': ['horaires', 'horaire', 'ouvert', 'ouverts', 'ouverture'],
+        'es': ['horario', 'horarios', 'abierto', 'abiertos', 'cerrado']
+    }
+}
+
+# Catalogue terms: the question is about products, so never answer it from a template
+CATALOGUE_TERMS = {
+    'it': ['porta', 'porte', 'catalogo', 'prodotto', 'prodotti', 'modello', 'modelli', 'mobili', 'arredamenti',
+           'finitura', 'finiture', 'prezzo', 'prezzi'],
+    'en': ['door', 'doors', 'catalog', 'catalogue', 'product', 'products', 'model', 'models', 'furniture',
+           'finish', 'price', 'prices'],
+    'fr': ['catalogue', 'produit', 'produits', 'modele', 'meuble', 'meubles', 'prix'],
+    'es': ['puerta', 'puertas', 'catalogo', 'producto', 'productos', 'modelo', 'modelos', 'muebles',
+           'precio', 'precios']
+}
+# Generic words that, together with the catalogue terms, select the product prompt
+PRODUCT_TERMS = {
+    'it': ['lista', 'mostra', 'hai', 'disponibili', 'cosa', 'quali', 'vendete', 'offrite'],
+    'en': ['list', 'show', 'have', 'available', 'what', 'which', 'sell', 'offer']
+}
+CATALOGUE_KEYWORDS = sorted({word for words in CATALOGUE_TERMS.values() for word in words})
+PRODUCT_KEYWORDS = sorted({word for words in PRODUCT_TERMS.values() for word in words})
+
+FAQ_ANSWERS = {
+    "contact": {
+        'it': f"Puoi chiamarci al {COMPANY_PHONE} oppure scriverci a {COMPANY_EMAIL}.",
+        'en': f"You can call us at {COMPANY_PHONE} or email us at {COMPANY_EMAIL}.",
+        'fr': f"Vous pouvez nous appeler au {COMPANY_PHONE} ou nous écrire à {COMPANY_EMAIL}.",
+        'es': f"Puede llamarnos al {COMPANY_PHONE} o escribirnos a {COMPANY_EMAIL}."
+    },
+    "location": {
+        'it': f"{COMPANY_NAME} si trova a {COMPANY_LOCATION}.",
+        'en': f"{COMPANY_NAME} is located in {COMPANY_LOCATION}.",
+        'fr': f"{COMPANY_NAME} se trouve à {COMPANY_LOCATION}.",
+        'es': f"{COMPANY_NAME} se encuentra en {COMPANY_LOCATION}."
+    },
+    "hours": {
+        'it': f"I nostri orari di apertura: {COMPANY_HOURS}.",
+        'en': f"Our opening hours: {COMPANY_HOURS}.",
+        'fr': f"Nos horaires d'ouverture : {COMPANY_HOURS}.",
+        'es': f"Nuestro horario de apertura: {COMPANY_HOURS}."
+    }
+}
+# Template answers are for messages that are essentially the question itself
+FAQ_MAX_WORDS = 6
+FAQ_QUESTION_MAX_WORDS = 10
+QUESTION_WORDS = {
+    'dove', 'come', 'qual', 'quale', 'quali', 'quando', 'avete', 'potete', 'posso',
+    'where', 'what', 'how', 'when', 'which', 'can', 'could', 'do', 'does', 'is', 'are',
+    'ou', 'quel', 'quelle', 'quels', 'comment', 'quand', 'avez', 'pouvez', 'est',
+    'donde', 'cual', 'cuales', 'como', 'cuando', 'tienen', 'puedo', 'pueden'
+}
+# Without configured opening hours, hours questions are left to the knowledge base
+ANSWERABLE = {"contact", "location"} | ({"hours"} if COMPANY_HOURS else set())
+
+
+def _alternation(words):
+    # Longest first so "grazie mille" wins over "grazie"
+    return "|".join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+
+
+# Small-talk words are language specific, which beats langdetect on short messages
+SMALL_TALK_LANGUAGE = {word: lang for table in (GREETINGS, THANKS) for lang, words in table.items() for word in words}
+SMALL_TALK_WORD = re.compile(rf"\b(?:{_alternation(SMALL_TALK_LANGUAGE)})\b")
+SMALL_TALK_PATTERN = re.compile(rf"(?:(?:{_alternation(SMALL_TALK_LANGUAGE)})\s*)+")
+THANKS_PATTERN = re.compile(rf"\b(?:{_alternation(w for words in THANKS.values() for w in words)})\b")
+INTENT_PATTERN = re.compile(r"\b(?:" + "|".join(
+    [rf"(?P<{intent}>{_alternation(w for words in table.values() for w in words)})"
+     for intent, table in FAQ_KEYWORDS.items()] +
+    [rf"(?P<catalogue>{_alternation(CATALOGUE_KEYWORDS)})", rf"(?P<product>{_alternation(PRODUCT_KEYWORDS)})"]
+) + r")\b")
+# Languages each keyword belongs to, for short questions langdetect gets wrong ("Dove siete?" -> af)
+KEYWORD_LANGUAGES = {}
+for table in [GREETINGS, THANKS, *FAQ_KEYWORDS.values(), CATALOGUE_TERMS, PRODUCT_TERMS]:
+    for lang, words in table.items():
+        for word in words:
+            KEYWORD_LANGUAGES.setdefault(word, set()).add(lang)
+PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(PUNCTUATION.sub(" ", text).split())
+
+
+@lru_cache(maxsize=4096)
+def _detected_language(text, candidates):
+    return detect_language_among(text, candidates, DEFAULT_LANGUAGE)
+
+
+def keyword_language(keywords, text):
+    """Language most of the matched keywords belong to; langdetect picks among the tied
+    languages, or among all supported ones when no keyword matched"""
+    votes = Counter(lang for word in keywords for lang in KEYWORD_LANGUAGES.get(word, ()))
+    candidates = SUPPORTED_LANGUAGES
+    if votes:
+        best = max(votes.values())
+        candidates = {lang for lang, count in votes.items() if count == best}
+    if len(candidates) == 1:
+        return next(iter(candidates))
+    return _detected_language(text.strip(), frozenset(candidates))
+
+
+def is_faq_question(normalized, text):
+    """Only short messages or short questions are contact/location questions; longer ones
+    ("I would like to contact someone about a broken hinge...") need the knowledge base"""
+    words = normalized.split()
+    if len(words) <= FAQ_MAX_WORDS:
+        return True
+    interrogative = text.rstrip().endswith("?") or words[0] in QUESTION_WORDS
+    return interrogative and len(words) <= FAQ_QUESTION_MAX_WORDS
+
+
+def route_message(text):
+    """Classify a message in one pass and answer it directly when possible"""
+    normalized = normalize(text)
+    greeting = SMALL_TALK_WORD.search(normalized)
+
+    if greeting and SMALL_TALK_PATTERN.fullmatch(normalized):
+        language = SMALL_TALK_LANGUAGE[greeting.group()]
+        if THANKS_PATTERN.search(normalized):
+            return Route("gratitude", language, get_gratitude_response(language))
+        return Route("greeting", language, get_casual_greeting_response(language))
+
+    matches = list(INTENT_PATTERN.finditer(normalized))
+    keywords = [match.group() for match in SMALL_TALK_WORD.finditer(normalized)] + [match.group() for match in matches]
+    language = keyword_language(keywords, text)
+
+    found = {match.lastgroup for match in matches}
+    faq = [intent for intent in FAQ_KEYWORDS if intent in found]
+    if faq and "catalogue" not in found and set(faq) <= ANSWERABLE and is_faq_question(normalized, text):
+        answer = " ".join(FAQ_ANSWERS[intent].get(language, FAQ_ANSWERS[intent][DEFAULT_LANGUAGE]) for intent in faq)
+        return Route("+".join(faq), language, answer)
+
+    if found & {"catalogue", "product"}:
+        return Route("product", language, None)
+    return Route("general", language, None)
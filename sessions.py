@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for gemma/llama tokenizers)"""
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Beginning of text within about max_tokens, ending in "..." when cut"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, (max_tokens - 1) * 4)
+    return text[:max_chars - 3] + "..." if max_chars > 3 else text[:max_chars]
+
+
+def new_session_id():
+    """Generate a new random session id"""
+    return uuid.uuid4().hex
+
+
+class SessionStore:
+    """Per-session chat history with a bounded window, LRU eviction and idle TTL.
+
+    Histories live in an in-memory LRU. When db_path is set, every turn is also
+    written to SQLite so sessions survive a restart and evicted sessions can be
+    reloaded on their next request.
+    """
+
+    def __init__(self, max_sessions=1000, max_turns=4, max_tokens=600, ttl=1800, db_path=None):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.db_path = db_path
+        self._sessions = OrderedDict()  # session_id -> (last_seen, [(question, answer), ...])
+        self._contexts = {}  # session_id -> Ollama context tokens of the last generation (memory only)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        """Open the SQLite backend and create its tables"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_turns ("
+            "session_id TEXT NOT NULL, turn INTEGER NOT NULL, question TEXT NOT NULL, "
+            "answer TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (session_id, turn))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chat_turns_updated ON chat_turns (updated)")
+        self._db.commit()
+
+    def _trim(self, history):
+        """Keep the newest turns that fit the turn window and token budget.
+
+        The latest turn is always kept, cut down to the budget if it is longer
+        on its own, so a follow-up still knows what was just said.
+        """
+        history = history[-self.max_turns:] if self.max_turns else list(history)
+        total = sum(estimate_tokens(q) + estimate_tokens(a) for q, a in history)
+        while len(history) > 1 and total > self.max_tokens:
+            q, a = history.pop(0)
+            total -= estimate_tokens(q) + estimate_tokens(a)
+        if history and total > self.max_tokens:
+            q, a = history[-1]
+            q = truncate_to_tokens(q, min(estimate_tokens(q), self.max_tokens // 2))
+            history[-1] = (q, truncate_to_tokens(a, self.max_tokens - estimate_tokens(q)))
+        return history
+
+    def _load(self, session_id, now):
+        """Load a session from SQLite, or None if unknown or expired"""
+        if self._db is None:
+            return None
+        rows = self._db.execute(
+            "SELECT question, answer, updated FROM chat_turns WHERE session_id = ? ORDER BY turn",
+            (session_id,)
+        ).fetchall()
+        if not rows or now - rows[-1][2] > self.ttl:
+            return None
+        return [(q, a) for q, a, _ in rows]
+
+    def _save(self, session_id, history, now):
+        """Replace the stored window of a session in SQLite"""
+        if self._db is None:
+            return
+        with self._db:
+            self._db.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+            self._db.executemany(
+                "INSERT INTO chat_turns (session_id, turn, question, answer, updated) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, i, q, a, now) for i, (q, a) in enumerate(history)]
+            )
+
+    def _expire(self, now):
+        """Drop idle sessions from memory and from the database"""
+        # The OrderedDict is kept in last-seen order, so stale entries sit at the front
+        while self._sessions:
+            session_id, (last_seen, _) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._contexts.pop(session_id, None)
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM chat_turns WHERE updated < ?", (now - self.ttl,))
+
+    def get_history(self, session_id):
+        """Return a copy of the session's trimmed history (oldest turn first)"""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                self._contexts.pop(session_id, None)
+                entry = None
+            if entry is None:
+                history = self._load(session_id, now)
+                if history is None:
+                    return []
+                entry = (now, self._trim(history))
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            self._evict()
+            return list(entry[1])
+
+    def append(self, session_id, question, answer):
+        """Add a turn to the session and trim it to the window"""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry else (self._load(session_id, now) or [])
+            history = self._trim(history + [(question, answer)])
+            self._sessions[session_id] = (now, history)
+            self._save(session_id, history, now)
+            self._expire(now)
+            self._evict()
+
+    def get_context(self, session_id):
+        """Ollama context tokens saved by the session's last generation, or None"""
+        with self._lock:
+            return self._contexts.get(session_id)
+
+    def set_context(self, session_id, context):
+        """Remember (or with None, drop) the session's Ollama context"""
+        with self._lock:
+            if context and session_id in self._sessions:
+                self._contexts[session_id] = context
+            else:
+                self._contexts.pop(session_id, None)
+
+    def clear(self, session_id):
+        """Forget a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._contexts.pop(session_id, None)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+
+    def _evict(self):
+        """Evict least recently used sessions from memory"""
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            self._contexts.pop(session_id, None)
+
+    def stats(self):
+        """Return basic counters for monitoring"""
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "persistent": self._db is not None
+            }
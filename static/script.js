@@ -33,25 +33,19 @@ const generateBotResponse = async (userMessage) => {
         // Scroll to the bottom of the chat
         chatBody.scrollTop = chatBody.scrollHeight;
         
-        // Send request to Flask backend
+        // Send request to Flask backend, asking for a token stream
         const response = await fetch(API_URL, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ message: userMessage }),
+            body: JSON.stringify({ message: userMessage, stream: true }),
         });
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        // Parse the JSON response
-        const data = await response.json();
-        
-        // Remove the thinking indicator
-        chatBody.removeChild(thinkingMessageDiv);
-        
         // Create a new message element for the bot response
         const messageContent = `
             <svg class="bot-avatar" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="37" height="31" viewBox="0 0 502 497">
@@ -62,23 +56,59 @@ const generateBotResponse = async (userMessage) => {
         const botMessageDiv = createMessageElement(messageContent, "bot-message");
         const botMessageText = botMessageDiv.querySelector(".message-text");
         
-        // Add the new message to the chat
-        chatBody.appendChild(botMessageDiv);
-        
-        // Display the response text
-        // Display the response text
-if (data.response) {
-    botMessageText.textContent = data.response;
-} else if (data.error) {
-    botMessageText.textContent = "Sorry, I encountered an error. Please try again.";
-    botMessageDiv.classList.add("error");
-} else {
-    botMessageText.textContent = "No response received.";
-}
-
+        // Swap the thinking indicator for the bot message (only once)
+        const showBotMessage = () => {
+            if (thinkingMessageDiv.parentNode) {
+                chatBody.replaceChild(botMessageDiv, thinkingMessageDiv);
+            }
+        }
         
-        // Scroll to the bottom of the chat
-        chatBody.scrollTop = chatBody.scrollHeight;
+        const showData = (data) => {
+            showBotMessage();
+            if (data.response) {
+                botMessageText.textContent = data.response;
+            } else if (data.error) {
+                botMessageText.textContent = "Sorry, I encountered an error. Please try again.";
+                botMessageDiv.classList.add("error");
+            } else {
+                botMessageText.textContent = "No response received.";
+            }
+            chatBody.scrollTop = chatBody.scrollHeight;
+        }
+        
+        // Greetings and validation errors still come back as plain JSON
+        const contentType = response.headers.get("Content-Type") || "";
+        if (!contentType.includes("application/x-ndjson")) {
+            showData(await response.json());
+            return;
+        }
+        
+        // Read the NDJSON stream and render tokens as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        
+        const handleEvent = (event) => {
+            if (event.type === "token") {
+                showBotMessage();
+                botMessageText.textContent += event.token;
+                chatBody.scrollTop = chatBody.scrollHeight;
+            } else if (event.type === "done" || event.type === "error") {
+                showData(event);
+            }
+        }
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+        }
+        if (buffer.trim()) {
+            handleEvent(JSON.parse(buffer));
+        }
         
     } catch (error) {
         console.error('Error generating bot response:', error);
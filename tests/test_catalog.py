@@ -0,0 +1,74 @@
+"""Product catalogue: extraction, listing questions and what the session keeps of an answer"""
+import os
+from langchain_core.documents import Document
+from catalog import CatalogReader, ProductCatalog, extract_products, format_answer
+from chunk_store import SQLiteDocstore
+from config import SESSION_HISTORY_TOKENS
+from index_versions import DOCSTORE_FILE, publish_version, stage_version
+from router import route_message
+from sessions import estimate_tokens
+
+LINES = [
+    "SARA SR-101 - Porta a battente liscia. Finiture: noce nazionale, bianco laccato. Categoria: porte interne.",
+    "VALENTINA VL-215 - Porta scorrevole con vetro satinato. Finiture: rovere, grigio. Categoria: porte scorrevoli.",
+    "ALVIN AL-300 - Porta blindata. Finiture: noce, avorio. Categoria: porte blindate.",
+]
+# Enough walnut doors for a listing far longer than the session history budget
+WALNUT = [f"LINEA NOCE{i} NC-{400 + i} - Porta a battente con pannelli pantografati e maniglia in ottone satinato. "
+          f"Finiture: noce. Categoria: porte interne." for i in range(20)]
+
+
+def _reader(tmp_path, lines=LINES):
+    root = str(tmp_path)
+    staging = stage_version(root)
+    path = os.path.join(staging, DOCSTORE_FILE)
+    docstore = SQLiteDocstore(path)
+    docstore.add({"c1": Document(page_content="\n".join(lines), metadata={"source": "catalogo.txt"})})
+    docstore.close()
+    catalog = ProductCatalog(path)
+    catalog.sync({"sources": {"catalogo.txt": {"hash": "h1", "chunks": {"c1": "c1"}}}})
+    catalog.close()
+    publish_version(root, staging)
+    return CatalogReader(root)
+
+
+def test_extract_products_reads_fields():
+    product, = extract_products(LINES[0], "catalogo.txt")
+    assert (product["name"], product["code"], product["category"]) == ("SARA", "SR101", "porte interne")
+    assert product["finishes"] == ["noce nazionale", "bianco laccato"]
+    assert extract_products("La SR-101 e' la nostra porta piu' venduta.", "faq.txt") == []
+
+
+def test_listing_questions_filter_by_finish_and_category(tmp_path):
+    reader = _reader(tmp_path)
+    products, total = reader.search("quali porte in noce avete?")
+    assert total == 2 and {p["code"] for p in products} == {"SR-101", "AL-300"}
+    products, total = reader.search("which sliding doors do you have?")
+    assert [p["code"] for p in products] == ["VL-215"]
+    # Prices are not in the table
+    assert reader.search("quanto costa la porta SR-101?") is None
+
+
+def test_answer_is_in_the_question_language(tmp_path):
+    reader = _reader(tmp_path)
+    question = "quali porte in noce avete?"
+    answer, _, _ = reader.answer(question, route_message(question).language)
+    assert answer.startswith("Ecco i prodotti che corrispondono (2):")
+    assert "finiture: noce" in answer
+    answer, _, _ = reader.answer("which doors come in walnut?", "en")
+    assert answer.startswith("Here are the matching products (2):")
+
+
+def test_session_keeps_a_short_summary_of_long_listings(tmp_path):
+    reader = _reader(tmp_path, LINES + WALNUT)
+    answer, summary, products = reader.answer("quali porte in noce avete?", "it")
+    assert len(products) == 22 and estimate_tokens(answer) > SESSION_HISTORY_TOKENS
+    assert summary.startswith("Ho elencato 22 prodotti del catalogo:") and summary.endswith("...")
+    assert estimate_tokens(summary) < SESSION_HISTORY_TOKENS // 4
+
+
+def test_format_answer_mentions_the_remaining_products():
+    products = extract_products("\n".join(LINES), "catalogo.txt")
+    answer = format_answer(products[:1], 3, "fr")
+    assert answer.splitlines()[0] == "Voici les produits correspondants (3) :"
+    assert answer.splitlines()[-1].startswith("...et 2 autres.")
@@ -0,0 +1,60 @@
+"""Packing retrieved chunks into the prompt: splitter overlap, duplicates and the token budget"""
+from langchain_core.documents import Document
+from context_budget import pack_context, MIN_TAIL_TOKENS
+from sessions import estimate_tokens
+
+TEXT = (
+    "La porta SARA SR-101 e' una porta a battente liscia disponibile in noce nazionale e bianco laccato. "
+    "La porta VALENTINA VL-215 e' scorrevole, con pannelli in vetro satinato e telaio in alluminio. "
+    "Tutte le porte interne hanno una garanzia di cinque anni e vengono installate dai nostri tecnici. "
+    "Lo showroom di Crotone espone l'intera linea BUGNATA e la linea ALVIN-SOFIA."
+)
+OTHER = (
+    "Per la posa servono le misure del vano porta: larghezza, altezza e spessore del muro. "
+    "Il sopralluogo e' gratuito in provincia di Crotone e si prenota per telefono o per email. "
+    "I tempi di consegna vanno da tre a sei settimane a seconda della finitura scelta."
+)
+
+
+def _doc(text, source="catalogo.pdf"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_splitter_overlap_is_sent_once():
+    first, second = _doc(TEXT[:250]), _doc(TEXT[150:])
+    docs, context, stats = pack_context([first, second], max_tokens=1000)
+    assert docs == [first, second]
+    assert context.replace("\n\n", " ").count("vetro satinato") == 1
+    assert stats["context_tokens_saved"] > 0 and stats["chunks_dropped"] == 0
+
+
+def test_overlap_is_only_trimmed_within_a_source():
+    first, second = _doc(TEXT[:250]), _doc(TEXT[150:], source="sito.html")
+    _, context, _ = pack_context([first, second], max_tokens=1000, duplicate_threshold=1.01)
+    assert context.count("vetro satinato") == 2
+
+
+def test_near_duplicates_are_dropped():
+    original = _doc(TEXT)
+    copy = _doc(TEXT.replace("cinque", "5"), source="sito.html")
+    other = _doc("Orari: lunedi-venerdi 9-13 e 15-19.", source="orari.txt")
+    docs, _, stats = pack_context([original, copy, other], max_tokens=1000)
+    assert docs == [original, other]
+    assert stats["chunks_dropped"] == 1
+
+
+def test_budget_truncates_the_last_chunk_and_stops():
+    docs = [_doc(TEXT, source="a"), _doc(OTHER, source="b"), _doc("Contatti: info@example.com", source="c")]
+    budget = estimate_tokens(TEXT) + MIN_TAIL_TOKENS
+    kept, context, stats = pack_context(docs, max_tokens=budget)
+    assert kept == docs[:2]
+    assert stats["context_tokens"] <= budget
+    second = context.split("\n\n")[1]
+    assert OTHER.startswith(second) and len(second) < len(OTHER)
+
+
+def test_chunk_smaller_than_min_tail_is_not_added():
+    docs = [_doc(TEXT, source="a"), _doc(OTHER, source="b")]
+    kept, _, stats = pack_context(docs, max_tokens=estimate_tokens(TEXT) + MIN_TAIL_TOKENS - 1)
+    assert kept == docs[:1]
+    assert stats["chunks_dropped"] == 1
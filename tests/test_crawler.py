@@ -0,0 +1,74 @@
+"""Crawling a local http.server, then re-crawling it with conditional requests"""
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from crawler import WebCrawler
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    root = tmp_path / "site"
+    root.mkdir()
+    (root / "index.html").write_text(
+        '<html><head><title>Home</title></head><body><nav>menu</nav>'
+        '<p>Porte SARA SR-101 in noce.</p><a href="doors.html">Doors</a></body></html>'
+    )
+    (root / "doors.html").write_text(
+        '<html><head><title>Doors</title></head><body><p>VALENTINA VL-215 bianco laccato.</p></body></html>'
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_crawl_follows_links_and_strips_boilerplate(site, tmp_path):
+    _, url = site
+    documents = WebCrawler(str(tmp_path / "cache"), workers=2).crawl([f"{url}/index.html"], max_depth=1)
+    texts = {doc.metadata["title"]: doc.page_content for doc in documents}
+    assert set(texts) == {"Home", "Doors"}
+    assert "SR-101" in texts["Home"] and "menu" not in texts["Home"]
+
+
+def test_recrawl_revalidates_unchanged_pages(site, tmp_path):
+    root, url = site
+    cache = str(tmp_path / "cache")
+    WebCrawler(cache, workers=2).crawl([f"{url}/index.html"], max_depth=1)
+
+    crawler = WebCrawler(cache, workers=2)
+    documents = crawler.crawl([f"{url}/index.html"], max_depth=1)
+    assert crawler.stats == {"fetched": 0, "not_modified": 2, "failed": 0}
+    # Cached bodies are parsed again, so a 304 still yields the page
+    assert len(documents) == 2
+
+    # A newer Last-Modified makes the server send the page again
+    page = root / "doors.html"
+    page.write_text('<html><head><title>Doors</title></head><body><p>SOFIA SF-300.</p></body></html>')
+    stat = page.stat()
+    os.utime(page, (stat.st_atime, stat.st_mtime + 10))
+    crawler = WebCrawler(cache, workers=2)
+    documents = crawler.crawl([f"{url}/index.html"], max_depth=1)
+    assert crawler.stats == {"fetched": 1, "not_modified": 1, "failed": 0}
+    assert any("SF-300" in doc.page_content for doc in documents)
+
+
+def test_failed_pages_do_not_use_up_the_page_budget(site, tmp_path):
+    root, url = site
+    # The first two links are broken; the crawl must go on to the others to reach max_pages
+    links = "".join(f'<a href="{name}.html">{name}</a>' for name in ("gone1", "gone2", "p1", "p2", "p3"))
+    (root / "list.html").write_text(f"<html><body><p>Catalogo.</p>{links}</body></html>")
+    for name in ("p1", "p2", "p3"):
+        (root / f"{name}.html").write_text(f"<html><body><p>Page {name}.</p></body></html>")
+
+    crawler = WebCrawler(str(tmp_path / "cache"), workers=2, max_pages=3)
+    documents = crawler.crawl([f"{url}/list.html"], max_depth=1)
+    assert len(documents) == 3
+    assert crawler.stats["failed"] >= 1
@@ -0,0 +1,125 @@
+"""ONNX embeddings: pooling against a numpy reference, int8 retrieval quality, and parity with the torch backend"""
+import os
+import numpy as np
+import pytest
+from config import EMBEDDINGS_MODEL, ONNX_MODEL_PATH
+from embedding_backends import ONNX_MODEL_FILE, recall_at_k
+
+SENTENCES = [
+    "Le porte SARA sono disponibili in noce nazionale.",
+    "Which doors come in white lacquer?",
+    "SR-101 porta a battente liscia",
+    "Horaires d'ouverture du showroom de Crotone",
+    "¿Tienen puertas correderas?"
+]
+MIN_COSINE = 0.98  # Same tolerance as `python embedding_backends.py check`
+MIN_RECALL = 0.9
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """A made-up ONNX 'encoder' (an embedding table lookup) with a WordPiece tokenizer"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import helper, numpy_helper, TensorProto
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[CLS]": 2, "[SEP]": 3, "porta": 4, "sara": 5, "noce": 6, "door": 7, "white": 8}
+    tokenizer = Tokenizer(models.WordPiece(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+
+    table = np.random.default_rng(0).normal(size=(len(vocab), 8)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"], axis=0)], "lookup",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 8])],
+        [numpy_helper.from_array(table, "table")]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / ONNX_MODEL_FILE))
+    return str(tmp_path), tokenizer, table
+
+
+def test_mean_pooling_ignores_padding(tiny_model):
+    from embedding_backends import OnnxEmbeddings
+
+    path, tokenizer, table = tiny_model
+    embeddings = OnnxEmbeddings(model_path=path, threads=1)
+    texts = ["porta", "sara porta noce door white"]
+    vectors = np.array(embeddings.embed_documents(texts))
+    for text, vector in zip(texts, vectors):
+        expected = table[tokenizer.encode(text).ids].mean(axis=0)
+        np.testing.assert_allclose(vector, expected / np.linalg.norm(expected), rtol=1e-5, atol=1e-6)
+    # The short text padded in a batch embeds the same as on its own
+    np.testing.assert_allclose(embeddings.embed_query("porta"), vectors[0], rtol=1e-5, atol=1e-6)
+
+
+def test_int8_model_keeps_the_fp32_neighbours(tmp_path):
+    """A made-up fp32 encoder (lookup and projection), quantized like `export` does, over a small corpus"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    faiss = pytest.importorskip("faiss")
+    from onnx import helper, numpy_helper, TensorProto
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from embedding_backends import OnnxEmbeddings
+
+    words = ["porta", "sara", "noce", "rovere", "bianco", "laccato", "vetro", "scorrevole", "battente", "blindata",
+             "maniglia", "ottone", "door", "walnut", "oak", "white", "glass", "sliding", "handle", "brass",
+             "porte", "chene", "verre", "puerta", "roble", "vidrio", "armadio", "letto", "cucina", "tavolo"]
+    vocab = {"[PAD]": 0, "[UNK]": 1, **{word: i + 2 for i, word in enumerate(words)}}
+    tokenizer = Tokenizer(models.WordPiece(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+
+    rng = np.random.default_rng(0)
+    table = rng.normal(size=(len(vocab), 64)).astype(np.float32)
+    projection = rng.normal(size=(64, 64)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["tokens"], axis=0),
+         helper.make_node("MatMul", ["tokens", "projection"], ["last_hidden_state"])], "encoder",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 64])],
+        [numpy_helper.from_array(table, "table"), numpy_helper.from_array(projection, "projection")]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model.onnx"))
+    quantize_dynamic(str(tmp_path / "model.onnx"), str(tmp_path / ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    corpus = [" ".join(rng.choice(words, size=rng.integers(3, 9))) for _ in range(300)]
+    fp32 = np.array(OnnxEmbeddings(model_path=str(tmp_path), file_name="model.onnx", threads=1).embed_documents(corpus))
+    int8 = np.array(OnnxEmbeddings(model_path=str(tmp_path), threads=1).embed_documents(corpus))
+    index = faiss.IndexFlatL2(fp32.shape[1])
+    index.add(fp32.astype(np.float32))
+    assert (fp32 * int8).sum(axis=1).min() >= MIN_COSINE
+    assert recall_at_k(index, fp32, int8, k=10) >= MIN_RECALL
+
+
+def test_missing_model_says_how_to_export(tmp_path):
+    pytest.importorskip("onnxruntime")
+    from embedding_backends import OnnxEmbeddings
+
+    with pytest.raises(FileNotFoundError, match="export"):
+        OnnxEmbeddings(model_path=str(tmp_path))
+
+
+def test_onnx_vectors_match_torch():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("langchain_huggingface")
+    if not os.path.exists(os.path.join(ONNX_MODEL_PATH, ONNX_MODEL_FILE)):
+        pytest.skip("run 'python embedding_backends.py export' first")
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from embedding_backends import OnnxEmbeddings
+
+    onnx_vectors = np.array(OnnxEmbeddings().embed_documents(SENTENCES))
+    torch_vectors = np.array(HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL).embed_documents(SENTENCES))
+    cosines = (onnx_vectors * torch_vectors).sum(axis=1)
+    assert cosines.min() >= MIN_COSINE, cosines
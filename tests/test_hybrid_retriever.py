@@ -0,0 +1,52 @@
+"""Rank fusion, product code extraction and the SQLite keyword/code indexes"""
+from langchain_core.documents import Document
+from chunk_store import SQLiteDocstore, extract_codes
+from hybrid_retriever import reciprocal_rank_fusion
+
+
+def test_fusion_favours_ids_ranked_well_in_several_lists():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"], ["b"]]) == ["b", "c", "a"]
+    assert reciprocal_rank_fusion([["a", "b"], []]) == ["a", "b"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_fusion_score_is_reciprocal_rank():
+    # First in one list scores 1/61; 40th in two lists scores 2/100 and wins
+    first = ["a"] + [f"x{i}" for i in range(38)] + ["b"]
+    second = [f"y{i}" for i in range(39)] + ["b"]
+    ranking = reciprocal_rank_fusion([first, second])
+    assert ranking[0] == "b" and ranking[1] == "a"
+
+
+def test_codes_are_canonical():
+    assert extract_codes("Porta SARA SR-101 e VL215 (non sr-102)") == ["SR101", "VL215"]
+    assert extract_codes("avete la sr 102 o la vl-215b?", query=True) == ["SR102", "VL215B"]
+    assert extract_codes("2024 catalogue") == []
+
+
+def _docstore(tmp_path):
+    docstore = SQLiteDocstore(str(tmp_path / "docstore.sqlite"))
+    docstore.add({
+        "1": Document(page_content="SARA SR-101 porta a battente liscia in noce", metadata={"source": "a"}),
+        "2": Document(page_content="Confronto SR-101 e SR-102, finiture bianco laccato", metadata={"source": "a"}),
+        "3": Document(page_content="VALENTINA VL-215 porta scorrevole", metadata={"source": "b"}),
+    })
+    return docstore
+
+
+def test_code_search_ranks_chunks_with_more_matching_codes_first(tmp_path):
+    docstore = _docstore(tmp_path)
+    assert docstore.code_search(["SR101", "SR102"], 10) == ["2", "1"]
+    assert docstore.code_search(extract_codes("e la vl 215?", query=True), 10) == ["3"]
+    assert docstore.code_search([], 10) == []
+
+
+def test_keyword_search_and_delete_keep_indexes_in_sync(tmp_path):
+    docstore = _docstore(tmp_path)
+    assert docstore.keyword_search("porta scorrevole", 10)[0] == "3"
+    # Query text is quoted, never parsed as FTS5 syntax
+    assert docstore.keyword_search('noce" OR "*', 10) == ["1"]
+    docstore.delete(["1"])
+    assert docstore.code_search(["SR101"], 10) == ["2"]
+    assert "1" not in docstore.keyword_search("noce", 10)
+    assert isinstance(docstore.search("1"), str)
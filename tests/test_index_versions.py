@@ -0,0 +1,85 @@
+"""Publishing index versions and closing replaced ones only when their last reader is done"""
+import os
+import sqlite3
+import threading
+import pytest
+from langchain_core.documents import Document
+from chunk_store import SQLiteDocstore
+from index_versions import (
+    DOCSTORE_FILE, VERSIONS_DIR, VersionHandle, current_version, current_version_path, publish_version, stage_version
+)
+
+
+def _publish(root, text):
+    staging = stage_version(root)
+    docstore = SQLiteDocstore(os.path.join(staging, DOCSTORE_FILE))
+    docstore.add({text: Document(page_content=text, metadata={"source": "s"})})
+    docstore.close()
+    return publish_version(root, staging, keep=2)
+
+
+def test_publish_switches_current_and_prunes_old_versions(tmp_path):
+    root = str(tmp_path)
+    versions = [_publish(root, f"chunk {i}") for i in range(3)]
+    assert current_version(root) == versions[-1]
+    assert sorted(os.listdir(os.path.join(root, VERSIONS_DIR))) == sorted(versions[1:])
+    # Each version is a copy of the previous one plus its changes
+    docstore = SQLiteDocstore(os.path.join(current_version_path(root), DOCSTORE_FILE), read_only=True)
+    assert len(docstore) == 3
+
+
+def test_retired_handle_closes_after_its_last_user():
+    closed = []
+    handle = VersionHandle("index", close=lambda: closed.append(True))
+    assert handle.acquire() and handle.acquire()
+    handle.retire()
+    assert not handle.acquire()
+    handle.release()
+    assert closed == []
+    handle.release()
+    assert closed == [True]
+
+
+def test_unused_handle_closes_when_retired():
+    closed = []
+    VersionHandle("index", close=lambda: closed.append(True)).retire()
+    assert closed == [True]
+
+
+def test_close_all_closes_every_thread_connection(tmp_path):
+    path = str(tmp_path / DOCSTORE_FILE)
+    SQLiteDocstore(path).add({"1": Document(page_content="text", metadata={})})
+    docstore = SQLiteDocstore(path, read_only=True)
+    connections = []
+    readers = [threading.Thread(target=lambda: connections.append(docstore._connection())) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+        reader.join()
+    connections.append(docstore._connection())
+    docstore.close_all()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_finished_threads_do_not_keep_connections_open(tmp_path):
+    path = str(tmp_path / DOCSTORE_FILE)
+    SQLiteDocstore(path).add({"1": Document(page_content="text", metadata={})})
+    docstore = SQLiteDocstore(path, read_only=True)
+
+    def request():
+        docstore.search("1")
+
+    for _ in range(200):
+        reader = threading.Thread(target=request)
+        reader.start()
+        reader.join()
+    # Only the constructor thread's connection is left
+    assert len(docstore._connections) == 1
+    if os.path.isdir("/proc/self/fd"):
+        before = len(os.listdir("/proc/self/fd"))
+        for _ in range(200):
+            reader = threading.Thread(target=request)
+            reader.start()
+            reader.join()
+        assert len(os.listdir("/proc/self/fd")) <= before + 1
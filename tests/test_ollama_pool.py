@@ -0,0 +1,117 @@
+"""Backend pool routing, retries and circuit breaking against stub Ollama servers"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+import requests
+import ollama_client
+from ollama_client import ServerBusy, stream_generate
+from ollama_pool import BackendPool
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stub_ollama.py")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_stub(error_rate=0):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, STUB, "--port", str(port), "--latency", "0", "--tokens-per-sec", "1000",
+         "--tokens", "5", "--error-rate", str(error_rate)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/api/tags", timeout=0.5)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("stub Ollama did not start")
+
+
+@pytest.fixture(scope="module")
+def stubs():
+    started = [_start_stub(), _start_stub(), _start_stub(error_rate=1)]
+    yield {"healthy": started[0][1], "healthy2": started[1][1], "failing": started[2][1]}
+    for process, _ in started:
+        process.kill()
+        process.wait()
+
+
+def _use_pool(monkeypatch, urls, **kwargs):
+    pool = BackendPool([{"url": url, "max_concurrency": 2} for url in urls], health_interval=0, **kwargs)
+    monkeypatch.setattr(ollama_client, "pool", pool)
+    return pool
+
+
+def _by_url(pool):
+    return {stats["url"]: stats for stats in pool.stats()}
+
+
+def test_failed_request_is_retried_on_another_backend(monkeypatch, stubs):
+    # Idle backends tie on load, so the first request goes to the first one listed
+    pool = _use_pool(monkeypatch, [stubs["failing"], stubs["healthy"]])
+    stats = {}
+    assert "".join(stream_generate("stub", "hello", stats=stats))
+    assert stats["backend"] == stubs["healthy"]
+    backends = _by_url(pool)
+    assert backends[stubs["failing"]]["failures"] == 1
+    assert backends[stubs["healthy"]]["requests"] == 1
+    assert all(backend["in_flight"] == 0 for backend in backends.values())
+
+
+def test_circuit_opens_after_consecutive_failures(monkeypatch, stubs):
+    pool = _use_pool(monkeypatch, [stubs["failing"], stubs["healthy"]], failure_threshold=2, cooldown=60)
+    for _ in range(4):
+        assert "".join(stream_generate("stub", "hello"))
+    backends = _by_url(pool)
+    assert backends[stubs["failing"]]["state"] == "open"
+    assert backends[stubs["failing"]]["requests"] == 2
+    assert backends[stubs["healthy"]]["requests"] == 4
+
+
+def test_every_circuit_open_fails_fast(monkeypatch, stubs):
+    _use_pool(monkeypatch, [stubs["failing"]], failure_threshold=1, cooldown=60)
+    with pytest.raises(requests.HTTPError):
+        "".join(stream_generate("stub", "hello"))
+    with pytest.raises(ServerBusy):
+        "".join(stream_generate("stub", "hello"))
+
+
+def test_client_errors_are_not_retried_or_charged(monkeypatch, stubs):
+    pool = _use_pool(monkeypatch, [stubs["healthy"] + "/missing", stubs["healthy2"]], failure_threshold=1)
+    with pytest.raises(requests.HTTPError):
+        "".join(stream_generate("stub", "hello"))
+    backends = pool.stats()
+    assert backends[0]["failures"] == 0 and backends[0]["state"] == "up"
+    assert backends[1]["requests"] == 0
+
+
+def test_session_stays_on_its_backend(monkeypatch, stubs):
+    pool = _use_pool(monkeypatch, [stubs["healthy"], stubs["healthy2"]])
+    first, second, other = {}, {}, {}
+    "".join(stream_generate("stub", "hello", stats=first, affinity="session-a"))
+    "".join(stream_generate("stub", "hello", stats=other, affinity="session-b"))
+    "".join(stream_generate("stub", "and then?", stats=second, affinity="session-a"))
+    assert first["backend"] == second["backend"]
+    assert other["backend"] != first["backend"]
+    assert sum(backend["requests"] for backend in pool.stats()) == 3
+
+
+def test_max_concurrency_is_a_hard_limit():
+    pool = BackendPool([{"url": "http://a", "max_concurrency": 1}, {"url": "http://b", "max_concurrency": 1}],
+                       health_interval=0)
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    assert pool.acquire() is None
+    pool.release(first, True)
+    assert pool.acquire(affinity="session").url == first.url
@@ -0,0 +1,53 @@
+"""Routing and language of short messages, where langdetect alone guesses wrong"""
+import pytest
+from router import route_message, FAQ_ANSWERS
+
+PRODUCT_QUESTIONS = [
+    ("che porte avete?", "it"),
+    ("Quanto costa la porta SR-101?", "it"),
+    ("Avete un catalogo?", "it"),
+    ("Do you sell furniture?", "en"),
+    ("Which doors do you have?", "en"),
+    ("Avez-vous des meubles en chêne?", "fr"),
+    ("Quel est le prix du modèle SR-101?", "fr"),
+    ("¿Tienen puertas de roble?", "es"),
+    ("¿Cuál es el precio de la puerta?", "es"),
+]
+
+
+@pytest.mark.parametrize("text, language", PRODUCT_QUESTIONS)
+def test_short_product_questions_keep_their_language(text, language):
+    route = route_message(text)
+    assert (route.intent, route.language, route.answer) == ("product", language, None)
+
+
+@pytest.mark.parametrize("text, language", [
+    ("Dove siete?", "it"),
+    ("Where are you located?", "en"),
+    ("Où se trouve votre magasin?", "fr"),
+    ("¿Dónde están?", "es"),
+])
+def test_location_questions_are_answered_in_their_language(text, language):
+    route = route_message(text)
+    assert route.intent == "location" and route.language == language
+    assert route.answer == FAQ_ANSWERS["location"][language]
+
+
+@pytest.mark.parametrize("text, language", [("ciao", "it"), ("thank you", "en"), ("merci", "fr"), ("hola", "es")])
+def test_small_talk(text, language):
+    route = route_message(text)
+    assert route.language == language and route.answer
+
+
+def test_greeting_counts_towards_the_language():
+    assert route_message("Ciao, avete porte in noce?").language == "it"
+
+
+def test_email_address_is_a_contact_question():
+    route = route_message("Qual è il vostro indirizzo email?")
+    assert route.intent == "contact" and route.language == "it"
+
+
+def test_long_messages_go_to_retrieval():
+    route = route_message("I would like to contact someone about a broken hinge on the door I bought last year")
+    assert route.intent == "product" and route.answer is None
@@ -0,0 +1,95 @@
+"""Session history window, token budget, TTL and persistence"""
+import sessions
+from sessions import SessionStore, estimate_tokens
+
+
+class Clock:
+    """Stands in for the time module inside sessions"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def _store(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(sessions, "time", clock)
+    return SessionStore(**kwargs), clock
+
+
+def test_history_keeps_the_newest_turns(monkeypatch):
+    store, _ = _store(monkeypatch, max_turns=2, max_tokens=10_000)
+    for i in range(4):
+        store.append("s", f"question {i}", f"answer {i}")
+    assert store.get_history("s") == [("question 2", "answer 2"), ("question 3", "answer 3")]
+    assert store.get_history("other") == []
+
+
+def test_history_fits_the_token_budget(monkeypatch):
+    long_answer = "x" * 400
+    budget = 2 * (estimate_tokens("q") + estimate_tokens(long_answer))
+    store, _ = _store(monkeypatch, max_turns=10, max_tokens=budget)
+    for i in range(5):
+        store.append("s", "q", long_answer)
+    history = store.get_history("s")
+    assert len(history) == 2
+    assert sum(estimate_tokens(q) + estimate_tokens(a) for q, a in history) <= budget
+
+
+def test_latest_turn_longer_than_the_budget_is_cut_not_dropped(monkeypatch):
+    store, _ = _store(monkeypatch, max_turns=4, max_tokens=100)
+    store.append("s", "earlier question", "earlier answer")
+    store.append("s", "quali porte in noce avete?", "SARA SR-101 in noce nazionale. " * 100)
+    history = store.get_history("s")
+    assert len(history) == 1
+    question, answer = history[0]
+    assert question == "quali porte in noce avete?"
+    assert answer.startswith("SARA SR-101 in noce nazionale.") and answer.endswith("...")
+    assert estimate_tokens(question) + estimate_tokens(answer) <= 100
+
+
+def test_long_question_leaves_room_for_the_answer(monkeypatch):
+    store, _ = _store(monkeypatch, max_tokens=100)
+    store.append("s", "q" * 2000, "a" * 2000)
+    (question, answer), = store.get_history("s")
+    assert estimate_tokens(question) <= 50 and answer.startswith("aaa")
+    assert estimate_tokens(question) + estimate_tokens(answer) <= 100
+
+
+def test_idle_sessions_expire(monkeypatch):
+    store, clock = _store(monkeypatch, ttl=60)
+    store.append("s", "q", "a")
+    store.set_context("s", [1, 2, 3])
+    clock.now += 30
+    assert store.get_history("s") == [("q", "a")]  # reading refreshes last seen
+    clock.now += 59
+    assert store.get_history("s") == [("q", "a")]
+    clock.now += 61
+    assert store.get_history("s") == []
+    assert store.get_context("s") is None
+
+
+def test_least_recently_used_sessions_are_evicted(monkeypatch):
+    store, clock = _store(monkeypatch, max_sessions=2)
+    for session_id in ("a", "b"):
+        store.append(session_id, "q", "a")
+        clock.now += 1
+    store.get_history("a")
+    store.append("c", "q", "a")
+    assert store.stats()["active_sessions"] == 2
+    assert store.get_history("b") == []
+    assert store.get_history("a") == [("q", "a")]
+
+
+def test_persistent_sessions_survive_a_restart_but_not_the_ttl(monkeypatch, tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    store, clock = _store(monkeypatch, max_turns=2, ttl=60, db_path=db_path)
+    for i in range(3):
+        store.append("s", f"q{i}", f"a{i}")
+
+    restarted = SessionStore(max_turns=2, ttl=60, db_path=db_path)
+    assert restarted.get_history("s") == [("q1", "a1"), ("q2", "a2")]
+    clock.now += 61
+    assert SessionStore(max_turns=2, ttl=60, db_path=db_path).get_history("s") == []
@@ -0,0 +1,27 @@
+"""Chunking shared by every ingestion path.
+
+Kept apart from rag.py so ingestion worker processes can import it without
+loading the chains, FAISS and the embeddings backends.
+"""
+import hashlib
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def make_text_splitter():
+    """Chunking used for every source"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+
+def source_hash(docs):
+    """Content hash of all pages loaded from one source"""
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(str(doc.metadata.get("page", "")).encode("utf-8"))
+        digest.update(doc.page_content.encode("utf-8"))
+    return digest.hexdigest()
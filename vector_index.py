@@ -0,0 +1,151 @@
+import os
+import json
+import logging
+import pickle
+import faiss
+from langchain_community.vectorstores import FAISS
+from chunk_store import SQLiteDocstore
+from index_versions import FLAT_INDEX_FILE, ANN_INDEX_FILE, DOCSTORE_FILE, current_version_path
+
+IDS_FILE = "index_ids.json"  # docstore id of every index position
+LEGACY_DOCSTORE_FILE = "index.pkl"  # pickled docstore written by FAISS.save_local
+
+
+def _read_ids(folder_path):
+    with open(os.path.join(folder_path, IDS_FILE), encoding="utf-8") as f:
+        return {i: doc_id for i, doc_id in enumerate(json.load(f))}
+
+
+def _write_ids(folder_path, index_to_docstore_id):
+    path = os.path.join(folder_path, IDS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([index_to_docstore_id[i] for i in range(len(index_to_docstore_id))], f)
+    os.replace(tmp_path, path)
+
+
+def _migrate_pickled_docstore(folder_path):
+    """Move chunks from a legacy index.pkl into the SQLite chunk store (once)"""
+    legacy_path = os.path.join(folder_path, LEGACY_DOCSTORE_FILE)
+    logging.info(f"Migrating {legacy_path} to {DOCSTORE_FILE}...")
+    # Our own file from earlier FAISS.save_local runs; unpickled one last time
+    with open(legacy_path, "rb") as f:
+        old_docstore, index_to_docstore_id = pickle.load(f)
+    docstore = SQLiteDocstore(os.path.join(folder_path, DOCSTORE_FILE))
+    docstore.add({doc_id: old_docstore.search(doc_id) for doc_id in index_to_docstore_id.values()})
+    _write_ids(folder_path, index_to_docstore_id)
+    os.remove(legacy_path)
+    logging.info(f"Migrated {len(index_to_docstore_id)} chunks")
+
+
+def create_vector_store(folder_path, embeddings, dimension):
+    """Empty flat index backed by the SQLite chunk store"""
+    docstore = SQLiteDocstore(os.path.join(folder_path, DOCSTORE_FILE))
+    return FAISS(embeddings, faiss.IndexFlatL2(dimension), docstore, {})
+
+
+def load_writable_store(folder_path, embeddings):
+    """Open the flat index and chunk store for ingestion, migrating a pickled docstore first.
+
+    Called on a staged copy (index_versions.stage_version), so the published
+    files servers read are left alone.
+    """
+    if not os.path.exists(os.path.join(folder_path, IDS_FILE)) and \
+            os.path.exists(os.path.join(folder_path, LEGACY_DOCSTORE_FILE)):
+        _migrate_pickled_docstore(folder_path)
+    index = faiss.read_index(os.path.join(folder_path, FLAT_INDEX_FILE))
+    docstore = SQLiteDocstore(os.path.join(folder_path, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, _read_ids(folder_path))
+
+
+def save_vector_store(vector_store, folder_path):
+    """Write the flat index and its id list (chunks are already in SQLite)"""
+    os.makedirs(folder_path, exist_ok=True)
+    _write_ids(folder_path, vector_store.index_to_docstore_id)
+    index_path = os.path.join(folder_path, FLAT_INDEX_FILE)
+    tmp_path = index_path + ".tmp"
+    faiss.write_index(vector_store.index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def build_ann_index(flat_index, factory):
+    """Build an approximate (IVF/HNSW, optionally PQ/SQ) index from a flat one.
+
+    Vectors are added in the flat index's order so positions keep matching the
+    docstore mapping. Returns None if there are too few vectors to train it.
+    """
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    index = faiss.index_factory(flat_index.d, factory, flat_index.metric_type)
+    try:
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+    except RuntimeError as e:
+        logging.warning(f"Could not build '{factory}' index with {flat_index.ntotal} vectors: {e}")
+        return None
+    return index
+
+
+def save_ann_index(vector_store, folder_path, factory):
+    """Write the search index next to the flat one, or remove it for 'Flat'"""
+    ann_path = os.path.join(folder_path, ANN_INDEX_FILE)
+    if not factory or factory == "Flat":
+        if os.path.exists(ann_path):
+            os.remove(ann_path)
+        return None
+
+    index = build_ann_index(vector_store.index, factory)
+    if index is None:
+        if os.path.exists(ann_path):
+            os.remove(ann_path)
+        return None
+    tmp_path = ann_path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, ann_path)
+    logging.info(f"Search index '{factory}' saved ({index.ntotal} vectors)")
+    return index
+
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """Apply query-time search parameters to IVF and HNSW indexes"""
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+    if ef_search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def read_index(path, mmap=False):
+    """Read a FAISS index, memory-mapped read-only if requested"""
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        return faiss.read_index(path, flags)
+    return faiss.read_index(path)
+
+
+def open_vector_store(folder_path, embeddings, mmap=False, nprobe=None, ef_search=None):
+    """Open a saved vector store for serving (read only).
+
+    folder_path is the store root; its current version is opened. Prefers the
+    approximate index when one was built at ingestion time and can memory-map
+    it so several workers share one page-cached copy. Chunk texts stay in
+    SQLite until a search returns them. A store still in the pickled format
+    is not migrated here, since several servers may open it at once.
+    """
+    folder_path = current_version_path(folder_path)
+    ann_path = os.path.join(folder_path, ANN_INDEX_FILE)
+    index_path = ann_path if os.path.exists(ann_path) else os.path.join(folder_path, FLAT_INDEX_FILE)
+    index = tune_index(read_index(index_path, mmap=mmap), nprobe=nprobe, ef_search=ef_search)
+
+    if not os.path.exists(os.path.join(folder_path, IDS_FILE)) and \
+            os.path.exists(os.path.join(folder_path, LEGACY_DOCSTORE_FILE)):
+        raise RuntimeError(f"{folder_path} holds a pickled index from an older version; "
+                           f"run ingest.py (or add a document from admin.py) once to migrate it")
+    docstore = SQLiteDocstore(os.path.join(folder_path, DOCSTORE_FILE), read_only=True)
+    index_to_docstore_id = _read_ids(folder_path)
+
+    logging.info(f"Opened {type(index).__name__} with {index.ntotal} vectors{' (mmap)' if mmap else ''}")
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)